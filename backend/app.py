@@ -2,36 +2,147 @@
 Flask後端應用
 處理文檔上傳、識別和信息提取
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
+import json
+import time
 import uuid
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from werkzeug.utils import secure_filename
-from utils.ocr_processor import OCRProcessor
+from werkzeug.security import safe_join
 from utils.info_extractor import InfoExtractor
-from utils.document_classifier import DocumentClassifier
 from utils.privacy_masker import PrivacyMasker
+from utils.image_io import decode_image, image_size, load_image, save_bytes
+from utils.model_registry import ModelRegistry
+from utils.image_cache import ImageCache, file_etag
+from utils.quality_gate import QualityGate, QualityError
+from utils.metrics import Metrics
+from utils.admission import AdmissionController, Overloaded
+from utils.scheduler import Scheduler, PRIORITIES, INTERACTIVE
+from utils.model_worker import ModelWorker
+from utils.worker_pool import WorkerPool, current_rss_mb
+from utils.ocr_result import OCRResult, WIRE_FORMATS, dumps, json_default
+
+
+class ResultJSONProvider(DefaultJSONProvider):
+    """jsonify 支持 OCRResult（按列輸出）"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, OCRResult):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = ResultJSONProvider(app)
 CORS(app)  # 允許跨域請求
 
 # 配置
 UPLOAD_FOLDER = 'uploads'
+RESULTS_FOLDER = 'results'
+MASKED_FOLDER = 'masked_images'
+PREVIEW_CACHE_FOLDER = 'cache/previews'
+MODEL_REGISTRY_DIR = 'models/registry'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB（每個文件）
+MULTIPART_OVERHEAD = 64 * 1024  # 單文件上傳時 multipart 邊界和表單字段的餘量
+MAX_BATCH_SIZE = 10  # 批量識別單次最多文檔數
+OCR_MODE = os.environ.get('OCR_MODE', 'standard')  # 'standard' 或 'two_tier'
+# 分類順序：'cnn_first'（先CNN分類再OCR）或 'text_first'（先OCR，文本置信度不足時才運行CNN）
+CLASSIFY_MODE = os.environ.get('CLASSIFY_MODE', 'cnn_first')
+TEXT_CONFIDENCE_THRESHOLD = float(os.environ.get('TEXT_CONFIDENCE_THRESHOLD', '0.85'))
+# 上傳圖片最長邊上限（0 表示不限制）；設置後大圖以縮小分辨率解碼，見 benchmark_pipeline.py
+MAX_IMAGE_SIDE = int(os.environ.get('MAX_IMAGE_SIDE', '0'))
+# 圖片質量檢查：'reject'（不合格時返回422）、'flag'（只在結果中標記）或 'off'
+QUALITY_GATE_MODE = os.environ.get('QUALITY_GATE', 'reject')
+# 准入控制：處理中的文檔數超過軟上限時降級，達到硬上限時返回503；最近耗時超過目標時也降級
+ADMISSION_SOFT_LIMIT = int(os.environ.get('ADMISSION_SOFT_LIMIT', '4'))
+ADMISSION_HARD_LIMIT = int(os.environ.get('ADMISSION_HARD_LIMIT', '16'))
+ADMISSION_TARGET_SECONDS = float(os.environ.get('ADMISSION_TARGET_SECONDS', '5.0'))
+# 調度：同時運行的管線數、為交互請求保留的數量、每個租戶的並發上限（0 表示不限制）
+SCHEDULER_CAPACITY = int(os.environ.get('SCHEDULER_CAPACITY', '4'))
+SCHEDULER_RESERVED_INTERACTIVE = int(os.environ.get('SCHEDULER_RESERVED_INTERACTIVE', '1'))
+SCHEDULER_TENANT_LIMIT = int(os.environ.get('SCHEDULER_TENANT_LIMIT', '0'))
+SCHEDULER_TIMEOUT = float(os.environ.get('SCHEDULER_TIMEOUT', '30'))
+# 模型工作進程數（0 表示在Flask進程內運行模型）；進程處理的請求數或內存超過上限時預熱替換進程後回收
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', '0'))
+WORKER_MAX_REQUESTS = int(os.environ.get('WORKER_MAX_REQUESTS', '500'))
+WORKER_MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', '3072'))
+# 等待工作進程返回結果的最長秒數，超過時返回503
+WORKER_TASK_TIMEOUT = float(os.environ.get('WORKER_TASK_TIMEOUT', '120'))
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# 整個請求體的上限按批量識別計算；單文件接口另外按 MAX_FILE_SIZE 檢查（見 upload_too_large）
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE * MAX_BATCH_SIZE + MULTIPART_OVERHEAD
 
 # 確保上傳目錄存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs('results', exist_ok=True)
+os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
 # 初始化處理器
-ocr_processor = OCRProcessor()
 info_extractor = InfoExtractor()
-document_classifier = DocumentClassifier()
-privacy_masker = PrivacyMasker()
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
+privacy_masker = PrivacyMasker(output_dir=MASKED_FOLDER)
+image_cache = ImageCache(PREVIEW_CACHE_FOLDER)
+quality_gate = QualityGate()
+metrics = Metrics()
+admission = AdmissionController(ADMISSION_SOFT_LIMIT, ADMISSION_HARD_LIMIT, ADMISSION_TARGET_SECONDS)
+scheduler = Scheduler(
+    capacity=SCHEDULER_CAPACITY,
+    reserved_interactive=SCHEDULER_RESERVED_INTERACTIVE,
+    tenant_limit=SCHEDULER_TENANT_LIMIT or None,
+    timeout=SCHEDULER_TIMEOUT,
+    metrics=metrics
+)
+
+# 模型（分類、OCR）在本進程或工作進程池中運行
+model_worker = None
+worker_pool = None
+if not PIPELINE_WORKERS:
+    model_worker = ModelWorker(OCR_MODE, MODEL_REGISTRY_DIR)
+elif __name__ != '__mp_main__':
+    # 工作進程以 spawn 啟動時會重新導入本模塊（__mp_main__），其中不能再創建工作進程
+    worker_pool = WorkerPool(
+        partial(ModelWorker, OCR_MODE, MODEL_REGISTRY_DIR),
+        size=PIPELINE_WORKERS,
+        max_requests=WORKER_MAX_REQUESTS,
+        max_rss_mb=WORKER_MAX_RSS_MB,
+        metrics=metrics
+    )
+    worker_pool.start()
+
+# 後台保存上傳文件，不阻塞識別請求
+persist_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def file_size(file):
+    """上傳文件的字節數（Werkzeug 已將內容緩存在內存或臨時文件中）"""
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    return size
+
+
+def upload_too_large():
+    """
+    單文件接口的請求體是否超過每個文件的上限
+    
+    在解析表單之前按 Content-Length 檢查，避免讀取整個請求體
+    """
+    length = request.content_length
+    return length is not None and length > MAX_FILE_SIZE + MULTIPART_OVERHEAD
+
+
+def file_too_large_response():
+    return jsonify({'error': f'File exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit'}), 413
+
+
+def batch_too_large_response():
+    return jsonify({'error': f'At most {MAX_BATCH_SIZE} documents per batch'}), 400
 
 
 def allowed_file(filename):
@@ -40,6 +151,244 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def find_upload(file_id):
+    """根據file_id查找已上傳的文件"""
+    for ext in ['png', 'jpg', 'jpeg', 'pdf']:
+        potential_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}.{ext}")
+        if os.path.exists(potential_path):
+            return potential_path
+    return None
+
+
+def serve_image(directory, filename, immutable):
+    """
+    提供圖片或其預覽（查詢參數 size=thumb/preview/large）
+    
+    帶強ETag，支持條件請求（304）和Range請求。
+    
+    Args:
+        directory: 圖片目錄
+        filename: 文件名
+        immutable: 文件內容是否不會改變（上傳文件按唯一ID命名）
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+    
+    size = request.args.get('size')
+    if size:
+        if size not in image_cache.sizes:
+            return jsonify({'error': f"size must be one of {', '.join(image_cache.sizes)}"}), 400
+        path, etag = image_cache.get(path, size)
+        if path is None:
+            return jsonify({'error': 'Preview not available for this file'}), 415
+    else:
+        etag = file_etag(path)
+    
+    response = send_file(os.path.abspath(path), etag=etag, conditional=True)
+    # 圖片可能含個人信息，只允許瀏覽器緩存；遮蔽圖片重新識別時會被覆蓋，需要重新驗證
+    if immutable:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def save_result(result):
+    """保存識別結果，供 /api/results/<result_id> 讀取"""
+    data = json.dumps(result, ensure_ascii=False, default=json_default).encode('utf-8')
+    save_bytes(data, os.path.join(RESULTS_FOLDER, f"{result['result_id']}.json"))
+
+
+def respond(payload):
+    """
+    成功響應，按 Accept 請求頭協商格式
+    
+    默認JSON；Accept 為 application/msgpack 或 application/cbor（已安裝對應庫時）時返回二進制格式，
+    其中 OCR逐行結果為打包的小端數組（見 OCRResult.to_wire）
+    """
+    mimetype = request.accept_mimetypes.best_match(['application/json', *WIRE_FORMATS])
+    if mimetype in WIRE_FORMATS:
+        response = Response(dumps(payload, WIRE_FORMATS[mimetype]), mimetype=mimetype)
+    else:
+        response = jsonify(payload)
+    response.vary.add('Accept')
+    return response
+
+
+def assess_quality(image, source=None):
+    """
+    在運行任何模型之前檢查圖片質量
+    
+    Args:
+        image: BGR圖片數組（None 表示無法在內存中檢查，例如PDF）
+        source: 原圖的路徑或字節（可選；image 按 MAX_IMAGE_SIDE 縮小解碼時按原圖尺寸檢查分辨率）
+        
+    Returns:
+        dict: 檢查報告；未檢查時返回None
+        
+    Raises:
+        QualityError: reject 模式下圖片不合格
+    """
+    if image is None or QUALITY_GATE_MODE == 'off':
+        return None
+    
+    report = quality_gate.check(image, original_size=image_size(source) if source else None)
+    metrics.observe('quality_gate_seconds', report['elapsed_ms'] / 1000)
+    for reason in report['reasons']:
+        metrics.inc('quality_gate_reasons_total', reason=reason)
+    
+    if report['passed']:
+        metrics.inc('quality_gate_total', outcome='flagged' if report['flags'] else 'passed')
+    elif QUALITY_GATE_MODE == 'reject':
+        metrics.inc('quality_gate_total', outcome='rejected')
+        raise QualityError(report)
+    else:
+        metrics.inc('quality_gate_total', outcome='flagged')
+    return report
+
+
+def quality_error_response(error):
+    """質量檢查不合格時的響應（422，附原因代碼和指標）"""
+    return jsonify({
+        'status': 'error',
+        'message': str(error),
+        'reasons': error.report['reasons'],
+        'quality': error.report
+    }), 422
+
+
+def request_class():
+    """
+    從請求頭讀取調度類別
+    
+    Returns:
+        tuple: (租戶ID, 優先級)；X-Tenant-ID 默認 'default'，X-Priority 為 interactive（默認）或 bulk
+    """
+    tenant = request.headers.get('X-Tenant-ID', 'default').strip()[:64] or 'default'
+    priority = request.headers.get('X-Priority', INTERACTIVE).strip().lower()
+    return tenant, priority
+
+
+def invalid_priority_response():
+    return jsonify({'error': f"X-Priority must be one of {', '.join(PRIORITIES)}"}), 400
+
+
+def overloaded_response(error):
+    """超過准入硬上限時的響應（503 + Retry-After）"""
+    metrics.inc('requests_shed_total')
+    response = jsonify({
+        'status': 'error',
+        'message': str(error)
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def recognize(task):
+    """
+    運行模型階段（分類、OCR），見 ModelWorker.__call__
+    
+    Raises:
+        Overloaded: 工作進程在 WORKER_TASK_TIMEOUT 秒內沒有返回結果
+    """
+    if worker_pool is not None:
+        future = worker_pool.submit(task)
+        try:
+            return future.result(timeout=WORKER_TASK_TIMEOUT)
+        except FutureTimeoutError:
+            # 尚未分配給進程的任務不再處理；已在處理的任務完成後結果被丟棄
+            future.cancel()
+            metrics.inc('worker_timeouts_total')
+            raise Overloaded(max(int(SCHEDULER_TIMEOUT), 1))
+    return model_worker(task)
+
+
+def run_pipeline(file_id, filepath, image=None, classification=None, quality=None,
+                 degradation=None):
+    """
+    執行識別管線：分類 → OCR → 信息提取 → 隱私遮蔽
+    
+    Args:
+        file_id: 文件ID
+        filepath: 文件路徑（image 提供時僅用於命名遮蔽後的圖片）
+        image: 已解碼的BGR圖片數組（可選，提供時全程不讀取磁盤）
+        classification: 已有的 (文檔類型, 置信度, 模型版本)，例如批量分類的結果（可選）
+        quality: 已有的質量檢查報告（可選，未提供時在管線開始時檢查）
+        degradation: 准入控制選擇的降級級別（可選，默認完整質量）
+        
+    Returns:
+        dict: 識別結果
+        
+    Raises:
+        QualityError: 圖片質量不合格（reject 模式）
+    """
+    if quality is None:
+        quality = assess_quality(image, filepath)
+    
+    level = degradation or admission.levels[0]
+    skip_cnn = level.get('skip_cnn', False)
+    
+    # 1-2. 文檔分類和OCR識別
+    # text_first 模式先按OCR文字分類，文本置信度不足時才運行CNN（跳過CNN的降級級別只按文字分類）
+    recognition = recognize({
+        'image': image,
+        'filepath': filepath,
+        'classification': classification,
+        'text_first': classification is None and (CLASSIFY_MODE == 'text_first' or skip_cnn),
+        'text_threshold': 0.0 if skip_cnn else TEXT_CONFIDENCE_THRESHOLD,
+        'ocr_max_side': level.get('ocr_max_side'),
+        'angle_cls': level.get('angle_cls', True)
+    })
+    for stage, seconds in recognition['timings'].items():
+        metrics.observe('stage_seconds', seconds, stage=stage)
+    ocr_output = recognition['ocr_output']
+    ocr_result = ocr_output['text']
+    doc_type = recognition['document_type']
+    confidence = recognition['confidence']
+    model_version = recognition['model_version']
+    classified_by = recognition['classified_by']
+    metrics.inc('documents_classified_total', classified_by=classified_by)
+    metrics.inc('documents_total', degradation=level['name'])
+    
+    # 3. 信息提取
+    extracted_info = info_extractor.extract(ocr_result, doc_type)
+    
+    # 4. 隱私遮蔽
+    start = time.perf_counter()
+    masked_image_path = privacy_masker.mask_info(filepath, extracted_info, image=image,
+                                                 fast=level.get('fast_mask', False))
+    metrics.observe('stage_seconds', time.perf_counter() - start, stage='mask')
+    
+    result = {
+        'result_id': str(uuid.uuid4()),
+        'file_id': file_id,
+        'document_type': doc_type,
+        'confidence': float(confidence),
+        'model_version': model_version,
+        'classified_by': classified_by,
+        'ocr_text': ocr_result,
+        'ocr_info': ocr_output['info'],
+        'ocr_lines': ocr_output['lines'],
+        'extracted_info': extracted_info,
+        'masked_image': masked_image_path,
+        'quality': quality,
+        'degradation': {'level': level['level'], 'name': level['name']}
+    }
+    persist_executor.submit(save_result, dict(result))
+    return result
+
+
+def run_scheduled(tenant, priority, *args):
+    """
+    排隊獲得處理名額後執行識別管線（批量識別的每份文檔單獨排隊）
+    
+    每份文檔都由自己的線程直接進入調度器排隊，並發數和租戶間的公平由調度器決定
+    """
+    with scheduler.slot(tenant, priority):
+        return run_pipeline(*args)
+
+
 @app.route('/')
 def index():
     """健康檢查"""
@@ -52,6 +401,9 @@ def index():
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """處理文檔上傳"""
+    if upload_too_large():
+        return file_too_large_response()
+    
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -60,6 +412,9 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    if file_size(file) > MAX_FILE_SIZE:
+        return file_too_large_response()
+    
     if file and allowed_file(file.filename):
         # 生成唯一文件名
         file_id = str(uuid.uuid4())
@@ -83,6 +438,10 @@ def upload_file():
 @app.route('/api/recognize', methods=['POST'])
 def recognize_document():
     """識別文檔並提取信息"""
+    tenant, priority = request_class()
+    if priority not in PRIORITIES:
+        return invalid_priority_response()
+    
     try:
         data = request.json
         file_id = data.get('file_id')
@@ -91,45 +450,244 @@ def recognize_document():
             return jsonify({'error': 'file_id is required'}), 400
         
         # 查找文件
-        filepath = None
-        for ext in ['png', 'jpg', 'jpeg', 'pdf']:
-            potential_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}.{ext}")
-            if os.path.exists(potential_path):
-                filepath = potential_path
-                break
+        filepath = find_upload(file_id)
         
         if not filepath:
             return jsonify({'error': 'File not found'}), 404
         
-        # 1. 文檔分類
-        doc_type, confidence = document_classifier.classify(filepath)
+        with admission.admit() as level, scheduler.slot(tenant, priority):
+            # 解碼一次，質量檢查和識別管線共用（PDF無法解碼，按路徑處理）
+            image = load_image(filepath, max_side=MAX_IMAGE_SIDE or None)
+            result_data = run_pipeline(file_id, filepath, image=image, degradation=level)
         
-        # 2. OCR識別
-        ocr_result = ocr_processor.process(filepath)
+        return respond({
+            'status': 'success',
+            'data': result_data
+        })
+    
+    except QualityError as e:
+        return quality_error_response(e)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/upload_and_recognize', methods=['POST'])
+def upload_and_recognize():
+    """
+    上傳並識別文檔（單次請求）
+    
+    直接在內存中的圖片上運行識別管線，省去一次網絡往返和磁盤讀寫。
+    表單字段 persist=false 時不保存原文件；否則在後台寫入上傳目錄。
+    """
+    if upload_too_large():
+        return file_too_large_response()
+    
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    
+    if file_size(file) > MAX_FILE_SIZE:
+        return file_too_large_response()
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    tenant, priority = request_class()
+    if priority not in PRIORITIES:
+        return invalid_priority_response()
+    
+    try:
+        file_id = str(uuid.uuid4())
+        filename = secure_filename(file.filename)
+        file_ext = filename.rsplit('.', 1)[1].lower()
+        saved_filename = f"{file_id}.{file_ext}"
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
+        persist = request.form.get('persist', 'true').lower() != 'false'
         
-        # 3. 信息提取
-        extracted_info = info_extractor.extract(ocr_result, doc_type)
+        data = file.read()
         
-        # 4. 隱私遮蔽
-        masked_image_path = privacy_masker.mask_info(filepath, extracted_info)
+        with admission.admit() as level, scheduler.slot(tenant, priority):
+            image = decode_image(data, max_side=MAX_IMAGE_SIDE)
+            
+            if image is None:
+                # 無法在內存中解碼（例如PDF），保存後按路徑處理
+                save_bytes(data, filepath)
+                result_data = run_pipeline(file_id, filepath, degradation=level)
+            else:
+                # 先檢查質量，不合格的圖片不保存也不運行任何模型
+                quality = assess_quality(image, data)
+                if persist:
+                    persist_executor.submit(save_bytes, data, filepath)
+                result_data = run_pipeline(file_id, filepath, image=image, quality=quality,
+                                           degradation=level)
         
-        # 保存結果
-        result_id = str(uuid.uuid4())
-        result_data = {
-            'result_id': result_id,
-            'file_id': file_id,
-            'document_type': doc_type,
-            'confidence': float(confidence),
-            'ocr_text': ocr_result,
-            'extracted_info': extracted_info,
-            'masked_image': masked_image_path
-        }
+        result_data['filename'] = saved_filename
         
-        return jsonify({
+        return respond({
             'status': 'success',
             'data': result_data
         })
     
+    except QualityError as e:
+        return quality_error_response(e)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/batch_recognize', methods=['POST'])
+def batch_recognize():
+    """
+    批量識別多份文檔
+    
+    接受 multipart 的多個 files，或 JSON 的 file_ids 列表。
+    所有文檔一次性批量分類，OCR並行執行，並返回跨文檔一致性檢查結果。
+    後台批量重新處理應設置 X-Priority: bulk，避免佔用交互請求的處理能力。
+    """
+    tenant, priority = request_class()
+    if priority not in PRIORITIES:
+        return invalid_priority_response()
+    
+    try:
+        items = []
+        
+        if request.files:
+            files = request.files.getlist('files')
+            # 先檢查數量，超出時不讀取、不解碼任何文件
+            if len(files) > MAX_BATCH_SIZE:
+                return batch_too_large_response()
+            for file in files:
+                if file.filename == '' or not allowed_file(file.filename):
+                    items.append({'filename': file.filename, 'error': 'Invalid file type'})
+                    continue
+                if file_size(file) > MAX_FILE_SIZE:
+                    items.append({'filename': file.filename, 'error': 'File too large'})
+                    continue
+                
+                file_id = str(uuid.uuid4())
+                file_ext = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}.{file_ext}")
+                data = file.read()
+                image = decode_image(data, max_side=MAX_IMAGE_SIDE)
+                item = {'file_id': file_id, 'filepath': filepath, 'image': image}
+                if image is None:
+                    save_bytes(data, filepath)
+                else:
+                    # 質量檢查通過後才在後台保存
+                    item['data'] = data
+                items.append(item)
+        else:
+            data = request.get_json(silent=True) or {}
+            file_ids = data.get('file_ids', []) if isinstance(data, dict) else None
+            if not isinstance(file_ids, list) or \
+                    not all(isinstance(file_id, str) for file_id in file_ids):
+                return jsonify({'error': 'file_ids must be a list of strings'}), 400
+            if len(file_ids) > MAX_BATCH_SIZE:
+                return batch_too_large_response()
+            for file_id in file_ids:
+                filepath = find_upload(file_id)
+                if not filepath:
+                    items.append({'file_id': file_id, 'error': 'File not found'})
+                    continue
+                items.append({'file_id': file_id, 'filepath': filepath,
+                              'image': load_image(filepath, max_side=MAX_IMAGE_SIDE)})
+        
+        if not items:
+            return jsonify({'error': 'No files or file_ids provided'}), 400
+        
+        # 1. 質量檢查，不合格的文檔不參與分類和OCR
+        for item in items:
+            if 'error' in item:
+                continue
+            try:
+                item['quality'] = assess_quality(item['image'], item.get('data', item['filepath']))
+            except QualityError as e:
+                item['error'] = str(e)
+                item['reasons'] = e.report['reasons']
+        
+        valid = [item for item in items if 'error' not in item]
+        for item in valid:
+            if 'data' in item:
+                persist_executor.submit(save_bytes, item.pop('data'), item['filepath'])
+        
+        with admission.admit(len(valid)) as level:
+            # 2. 批量分類（一次前向傳播）；text_first 模式或跳過CNN的降級級別下在OCR之後逐份分類，
+            #    使用工作進程池時在各工作進程中逐份分類
+            if CLASSIFY_MODE == 'text_first' or level.get('skip_cnn') or not valid or \
+                    worker_pool is not None:
+                classifications = [None] * len(valid)
+            else:
+                with scheduler.slot(tenant, priority):
+                    start = time.perf_counter()
+                    classifications, model_version = model_worker.document_classifier.classify_batch(
+                        [item['image'] if item['image'] is not None else item['filepath']
+                         for item in valid],
+                        with_version=True
+                    )
+                classifications = [c + (model_version,) for c in classifications]
+                elapsed = time.perf_counter() - start
+                for _ in valid:
+                    metrics.observe('stage_seconds', elapsed / len(valid), stage='classify')
+            
+            # 3. 並行執行 OCR、信息提取和遮蔽
+            #    本請求的每份文檔一個線程（最多 MAX_BATCH_SIZE 個），不經過共享的FIFO線程池，
+            #    全部在調度器中排隊，大批量不會擋住其他租戶
+            with ThreadPoolExecutor(max_workers=max(len(valid), 1)) as executor:
+                futures = [
+                    executor.submit(run_scheduled, tenant, priority, item['file_id'],
+                                    item['filepath'], item['image'], classification,
+                                    item['quality'], level)
+                    for item, classification in zip(valid, classifications)
+                ]
+                for item, future in zip(valid, futures):
+                    try:
+                        item['result'] = future.result()
+                    except Exception as e:
+                        item['error'] = str(e)
+        
+        documents = []
+        for item in items:
+            if 'result' in item:
+                documents.append({'status': 'success', 'data': item['result']})
+            else:
+                document = {
+                    'status': 'error',
+                    'file_id': item.get('file_id'),
+                    'filename': item.get('filename'),
+                    'message': item['error']
+                }
+                if 'reasons' in item:
+                    document['reasons'] = item['reasons']
+                documents.append(document)
+        
+        # 4. 跨文檔一致性檢查
+        consistency = info_extractor.check_consistency(
+            [item['result']['extracted_info'] for item in items if 'result' in item]
+        )
+        
+        return respond({
+            'status': 'success',
+            'data': {
+                'documents': documents,
+                'consistency': consistency
+            }
+        })
+    
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -140,18 +698,114 @@ def recognize_document():
 @app.route('/api/results/<result_id>', methods=['GET'])
 def get_result(result_id):
     """獲取識別結果"""
-    # 這裡可以從數據庫讀取結果
-    # 暫時返回示例數據
+    try:
+        result_id = str(uuid.UUID(result_id))
+    except ValueError:
+        return jsonify({'error': 'Result not found'}), 404
+    
+    result_path = os.path.join(RESULTS_FOLDER, f"{result_id}.json")
+    if not os.path.exists(result_path):
+        return jsonify({'error': 'Result not found'}), 404
+    
+    with open(result_path, 'r', encoding='utf-8') as f:
+        result_data = json.load(f)
+    if result_data.get('ocr_lines'):
+        result_data['ocr_lines'] = OCRResult.from_dict(result_data['ocr_lines'])
+    
+    return respond({
+        'status': 'success',
+        'data': result_data
+    })
+
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """列出註冊的模型版本及當前服務中的版本"""
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'active': model_registry.active_version(),
+            'serving': model_worker.document_classifier.model_version if model_worker else None,
+            'versions': model_registry.versions(),
+            'text_classifier': model_worker.text_classifier.version if model_worker else None,
+            'workers': worker_pool.stats() if worker_pool else None,
+            'classify_mode': CLASSIFY_MODE,
+            'classification_counts': {
+                classified_by: metrics.counter('documents_classified_total', classified_by=classified_by)
+                for classified_by in ('text', 'cnn')
+            }
+        }
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    運行指標（?format=prometheus 時返回 Prometheus 文本格式）
+    
+    quality_gate_estimated_seconds_saved 按被拒絕的圖片數乘以分類和OCR的平均耗時估算
+    """
+    model_seconds = 0.0
+    for stage in ('classify', 'ocr'):
+        summary = metrics.summary('stage_seconds', stage=stage)
+        if summary:
+            model_seconds += summary['sum'] / summary['count']
+    rejected = metrics.counter('quality_gate_total', outcome='rejected')
+    metrics.set('quality_gate_estimated_seconds_saved', rejected * model_seconds)
+    metrics.set('in_flight', admission.in_flight)
+    metrics.set('process_rss_mb', round(current_rss_mb(), 1))
+    
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+    
     return jsonify({
         'status': 'success',
-        'message': 'Result retrieval not implemented yet'
+        'data': metrics.snapshot()
+    })
+
+
+@app.route('/api/models/activate', methods=['POST'])
+def activate_model():
+    """
+    切換當前模型版本
+    
+    本進程立即熱切換；其他服務進程和模型工作進程在下一次檢查註冊表時切換
+    """
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not version:
+        return jsonify({'error': 'version is required'}), 400
+    
+    try:
+        model_registry.activate(version)
+        if model_worker is not None:
+            model_worker.document_classifier.reload(version)
+    except KeyError:
+        return jsonify({'error': 'Model version not found'}), 404
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'serving': model_worker.document_classifier.model_version if model_worker else version
+        }
     })
 
 
 @app.route('/api/images/<filename>')
 def uploaded_file(filename):
-    """提供上傳的圖片"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """提供上傳的圖片（?size= 時返回緩存的預覽）"""
+    return serve_image(app.config['UPLOAD_FOLDER'], filename, immutable=True)
+
+
+@app.route('/api/masked/<filename>')
+def masked_file(filename):
+    """提供遮蔽後的圖片（?size= 時返回緩存的預覽）"""
+    return serve_image(MASKED_FOLDER, filename, immutable=False)
 
 
 if __name__ == '__main__':
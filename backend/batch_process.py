@@ -0,0 +1,454 @@
+"""
+離線批量識別腳本
+在Flask之外對整個目錄或清單中的圖片執行識別管線，結果寫入JSONL
+
+各階段（解碼 → 分類 → OCR/信息提取 → 隱私遮蔽）在獨立進程中運行，
+以有界隊列連接，使各階段重疊執行。解碼後的圖片放在共享內存中，
+隊列只傳遞描述符（--transport pickle 時直接傳遞數組，用於對比）。輸出文件同時作為檢查點：
+中斷後重新運行時，已由同一模型版本寫入的圖片會被跳過；
+模型版本變化後，舊版本的結果會被重新處理（新記錄追加在後）。
+
+用法:
+    python batch_process.py <目錄或清單文件> -o results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import multiprocessing as mp
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# 隊列結束標記
+_DONE = None
+
+
+def iter_sources(source):
+    """
+    列出需要處理的圖片
+
+    Args:
+        source: 圖片目錄（遞歸查找），或清單文件（每行一個路徑，或含 path 字段的JSON行）
+
+    Returns:
+        generator: 圖片路徑
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, filename)
+        return
+
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                line = json.loads(line)['path']
+            yield line
+
+
+def resolve_model_version(model_path, registry_dir=None):
+    """
+    確定本次運行使用的模型版本（與 DocumentClassifier.model_version 一致）
+
+    Returns:
+        str: 註冊表當前版本；沒有註冊表時為模型文件的校驗和；沒有模型時為 random
+    """
+    from utils.model_registry import ModelRegistry, file_version
+
+    if registry_dir:
+        active = ModelRegistry(registry_dir).active_version()
+        if active:
+            return active
+    if os.path.exists(model_path):
+        return file_version(model_path)
+    return 'random'
+
+
+def load_checkpoint(output_path, retry_errors=False, model_version=None):
+    """
+    從已有的輸出文件讀取已完成的圖片
+
+    Args:
+        output_path: JSONL輸出文件
+        retry_errors: 是否重新處理之前失敗的圖片
+        model_version: 只把該模型版本產生的結果視為已完成（None 表示不區分版本）
+
+    Returns:
+        set: 已完成的圖片路徑
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 上次中斷時可能留下寫了一半的行
+                continue
+            if retry_errors and 'error' in record:
+                continue
+            if model_version is not None and record.get('model_version') != model_version:
+                continue
+            done.add(record['source'])
+    return done
+
+
+def _masked_name(source):
+    """為遮蔽輸出生成唯一文件名，避免不同目錄中的同名文件互相覆蓋"""
+    digest = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    return f"{digest}_{os.path.basename(source)}"
+
+
+def _make_transport(kind):
+    """在工作進程中創建圖片傳輸（'shm' 或 'pickle'）"""
+    from utils.shm_transport import SharedMemoryTransport, PickleTransport
+
+    return SharedMemoryTransport() if kind == 'shm' else PickleTransport()
+
+
+def _decode_worker(in_queue, out_queue, transport_kind, quality_gate=True):
+    """解碼階段：讀取圖片文件，並在進入分類和OCR之前做質量檢查"""
+    from utils.image_io import load_image
+    from utils.quality_gate import QualityGate
+    from utils.shm_transport import mark_sent, new_stats
+
+    transport = _make_transport(transport_kind)
+    gate = QualityGate() if quality_gate else None
+
+    while True:
+        source = in_queue.get()
+        if source is _DONE:
+            break
+        item = {'source': source}
+        try:
+            image = load_image(source)
+            if image is None:
+                item['error'] = 'Cannot decode image'
+            elif gate is not None:
+                report = gate.check(image)
+                item['quality'] = report
+                if not report['passed']:
+                    item['error'] = f"Quality check failed: {', '.join(report['reasons'])}"
+            # 失敗的圖片不再往下傳遞圖片數據
+            if 'error' not in item:
+                item['image'] = transport.put(image)
+                transport.detach(item['image'])
+            image = None
+        except Exception as e:
+            item['error'] = str(e)
+        item['transport'] = new_stats(transport, item.get('image'))
+        mark_sent(item)
+        out_queue.put(item)
+
+
+def _classify_worker(in_queue, out_queue, transport_kind,
+                     model_path, registry_dir, model_version, batch_size):
+    """分類階段：湊滿一批後一次前向傳播"""
+    import queue
+    from utils.document_classifier import DocumentClassifier
+    from utils.model_registry import ModelRegistry
+    from utils.shm_transport import mark_received, mark_sent
+
+    transport = _make_transport(transport_kind)
+
+    registry = ModelRegistry(registry_dir) if registry_dir else None
+    if registry is not None and model_version not in registry.versions():
+        registry = None
+    # 整個運行固定使用同一版本，檢查點才能按版本判斷是否需要重新處理
+    classifier = DocumentClassifier(model_path, registry=registry,
+                                    version=model_version if registry else None)
+    finished = False
+
+    while not finished:
+        batch = []
+        item = in_queue.get()
+        if item is _DONE:
+            break
+        batch.append(item)
+        while len(batch) < batch_size:
+            try:
+                item = in_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished = True
+                break
+            batch.append(item)
+
+        for item in batch:
+            mark_received(item, transport)
+        valid = [item for item in batch if 'error' not in item]
+        images = [transport.get(item['image']) for item in valid]
+        classifications, version = classifier.classify_batch(images, with_version=True)
+        images = None
+        for item, (doc_type, confidence) in zip(valid, classifications):
+            item['document_type'] = doc_type
+            item['confidence'] = float(confidence)
+            transport.detach(item['image'])
+        for item in batch:
+            item['model_version'] = version
+        for item in batch:
+            mark_sent(item)
+            out_queue.put(item)
+
+
+def _ocr_worker(in_queue, out_queue, transport_kind, ocr_mode):
+    """OCR階段：文字識別和信息提取"""
+    from utils.ocr_processor import OCRProcessor
+    from utils.info_extractor import InfoExtractor
+    from utils.shm_transport import mark_received, mark_sent
+
+    transport = _make_transport(transport_kind)
+    ocr_processor = OCRProcessor(mode=ocr_mode)
+    info_extractor = InfoExtractor()
+
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            break
+        mark_received(item, transport)
+        if 'error' not in item:
+            try:
+                ocr_output = ocr_processor.process_detailed(transport.get(item['image']))
+                item['ocr_text'] = ocr_output['text']
+                item['ocr_info'] = ocr_output['info']
+                item['extracted_info'] = info_extractor.extract(
+                    item['ocr_text'], item['document_type'])
+            except Exception as e:
+                item['error'] = str(e)
+            ocr_output = None
+            transport.detach(item['image'])
+        mark_sent(item)
+        out_queue.put(item)
+
+
+def _mask_worker(in_queue, out_queue, transport_kind, masked_dir):
+    """遮蔽階段：生成隱私保護版本，並釋放圖片數據只保留結果"""
+    from utils.privacy_masker import PrivacyMasker
+    from utils.shm_transport import mark_received
+
+    transport = _make_transport(transport_kind)
+    privacy_masker = PrivacyMasker(output_dir=masked_dir)
+
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            break
+        mark_received(item, transport)
+        if 'error' not in item:
+            try:
+                item['masked_image'] = privacy_masker.mask_info(
+                    _masked_name(item['source']), item['extracted_info'],
+                    image=transport.get(item['image']))
+            except Exception as e:
+                item['error'] = str(e)
+        if 'image' in item:
+            # 最後一個使用圖片的階段，引用計數降到0後刪除共享內存段
+            transport.release(item.pop('image'))
+        out_queue.put(item)
+
+
+class BatchPipeline:
+    def __init__(self, output_path, model_path='models/document_classifier.h5',
+                 masked_dir='masked_images', decode_workers=2, ocr_workers=2,
+                 mask_workers=1, batch_size=16, queue_size=32, ocr_mode='standard',
+                 registry_dir='models/registry', quality_gate=True, transport='shm'):
+        """
+        初始化批量處理管線
+
+        Args:
+            output_path: JSONL輸出文件（同時作為檢查點）
+            model_path: 分類模型路徑（註冊表沒有當前版本時使用）
+            masked_dir: 遮蔽後圖片的輸出目錄
+            decode_workers: 解碼進程數
+            ocr_workers: OCR進程數
+            mask_workers: 遮蔽進程數
+            batch_size: 分類批次大小
+            queue_size: 各階段之間隊列的容量
+            ocr_mode: OCR模式（'standard' 或 'two_tier'）
+            registry_dir: 模型註冊表目錄（None 表示只使用 model_path）
+            quality_gate: 是否在解碼後檢查圖片質量（不合格的圖片不做分類和OCR）
+            transport: 階段之間傳遞圖片的方式：'shm'（共享內存，只傳描述符）或 'pickle'
+        """
+        self.output_path = output_path
+        self.model_path = model_path
+        self.masked_dir = masked_dir
+        self.decode_workers = decode_workers
+        self.ocr_workers = ocr_workers
+        self.mask_workers = mask_workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.ocr_mode = ocr_mode
+        self.registry_dir = registry_dir
+        self.quality_gate = quality_gate
+        self.transport = transport
+
+    def run(self, sources, retry_errors=False):
+        """
+        執行批量處理
+
+        Args:
+            sources: 圖片路徑的可迭代對象
+            retry_errors: 是否重新處理之前失敗的圖片
+
+        Returns:
+            dict: 處理統計
+        """
+        model_version = resolve_model_version(self.model_path, self.registry_dir)
+        print(f"模型版本: {model_version}")
+        done = load_checkpoint(self.output_path, retry_errors, model_version)
+        if done:
+            print(f"從檢查點恢復: 已完成 {len(done)} 張圖片")
+
+        # TensorFlow 和 PaddleOCR 都不適合在 fork 出的子進程中使用
+        ctx = mp.get_context('spawn')
+        path_queue = ctx.Queue(self.queue_size)
+        decoded_queue = ctx.Queue(self.queue_size)
+        classified_queue = ctx.Queue(self.queue_size)
+        ocr_queue = ctx.Queue(self.queue_size)
+        result_queue = ctx.Queue(self.queue_size)
+
+        stages = [
+            (path_queue, [ctx.Process(target=_decode_worker,
+                                      args=(path_queue, decoded_queue, self.transport,
+                                            self.quality_gate))
+                          for _ in range(self.decode_workers)]),
+            (decoded_queue, [ctx.Process(target=_classify_worker,
+                                         args=(decoded_queue, classified_queue, self.transport,
+                                               self.model_path, self.registry_dir,
+                                               model_version, self.batch_size))]),
+            (classified_queue, [ctx.Process(target=_ocr_worker,
+                                            args=(classified_queue, ocr_queue, self.transport,
+                                                  self.ocr_mode))
+                                for _ in range(self.ocr_workers)]),
+            (ocr_queue, [ctx.Process(target=_mask_worker,
+                                     args=(ocr_queue, result_queue, self.transport,
+                                           self.masked_dir))
+                         for _ in range(self.mask_workers)]),
+        ]
+        for _, workers in stages:
+            for worker in workers:
+                worker.start()
+
+        def feed():
+            for source in sources:
+                if source not in done:
+                    path_queue.put(source)
+            # 最後一個來源之後，每個解碼進程各一個結束標記
+            for _ in stages[0][1]:
+                path_queue.put(_DONE)
+
+        def coordinate():
+            # 每個階段的全部進程結束後，才通知下一階段結束
+            for i, (in_queue, workers) in enumerate(stages):
+                for worker in workers:
+                    worker.join()
+                if i + 1 < len(stages):
+                    next_queue, next_workers = stages[i + 1]
+                    for _ in next_workers:
+                        next_queue.put(_DONE)
+            result_queue.put(_DONE)
+
+        threading.Thread(target=feed, daemon=True).start()
+        threading.Thread(target=coordinate, daemon=True).start()
+
+        processed = 0
+        errors = 0
+        quality_rejected = 0
+        copied_bytes = 0
+        ipc_seconds = 0.0
+        start_time = time.time()
+        with open(self.output_path, 'a', encoding='utf-8') as out:
+            while True:
+                record = result_queue.get()
+                if record is _DONE:
+                    break
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                processed += 1
+                copied_bytes += record['transport']['copied_bytes']
+                ipc_seconds += record['transport']['ipc_seconds']
+                if 'error' in record:
+                    errors += 1
+                    if not record.get('quality', {}).get('passed', True):
+                        quality_rejected += 1
+                if processed % 100 == 0:
+                    out.flush()
+                    elapsed = time.time() - start_time
+                    print(f"已處理 {processed} 張圖片 ({processed / elapsed:.1f} 張/秒)")
+
+        elapsed = time.time() - start_time
+        stats = {
+            'processed': processed,
+            'errors': errors,
+            'skipped': len(done),
+            'quality_rejected': quality_rejected,
+            'transport': self.transport,
+            'copied_mb_per_image': copied_bytes / processed / 2 ** 20 if processed else 0.0,
+            'ipc_ms_per_image': ipc_seconds / processed * 1000 if processed else 0.0,
+            'seconds': elapsed,
+            'images_per_second': processed / elapsed if elapsed > 0 else 0.0
+        }
+        print(f"完成: 處理 {processed} 張，失敗 {errors} 張，"
+              f"跳過 {len(done)} 張，質量不合格 {quality_rejected} 張，耗時 {elapsed:.1f} 秒")
+        print(f"圖片傳輸 ({self.transport}): 每張複製 {stats['copied_mb_per_image']:.2f} MB，"
+              f"隊列傳遞 {stats['ipc_ms_per_image']:.1f} ms")
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='離線批量識別文檔')
+    parser.add_argument('source', help='圖片目錄或清單文件')
+    parser.add_argument('-o', '--output', default='results/batch_results.jsonl',
+                        help='JSONL輸出文件（同時作為檢查點）')
+    parser.add_argument('--model', default='models/document_classifier.h5',
+                        help='分類模型路徑（模型註冊表沒有當前版本時使用）')
+    parser.add_argument('--registry-dir', default='models/registry',
+                        help="模型註冊表目錄，'none' 表示不使用")
+    parser.add_argument('--masked-dir', default='masked_images', help='遮蔽後圖片的輸出目錄')
+    parser.add_argument('--decode-workers', type=int, default=2)
+    parser.add_argument('--ocr-workers', type=int, default=2)
+    parser.add_argument('--mask-workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=16, help='分類批次大小')
+    parser.add_argument('--queue-size', type=int, default=32, help='各階段隊列容量')
+    parser.add_argument('--ocr-mode', default='standard', choices=['standard', 'two_tier'],
+                        help='OCR模式：two_tier 先快速識別，只重新識別低置信度的行')
+    parser.add_argument('--no-quality-gate', action='store_true',
+                        help='不檢查圖片質量（模糊、反光、空白的圖片也做完整識別）')
+    parser.add_argument('--transport', default='shm', choices=['shm', 'pickle'],
+                        help='階段之間傳遞圖片的方式：shm 共享內存（默認），pickle 直接傳遞數組（用於對比）')
+    parser.add_argument('--retry-errors', action='store_true', help='重新處理之前失敗的圖片')
+    args = parser.parse_args(argv)
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    pipeline = BatchPipeline(
+        args.output,
+        model_path=args.model,
+        masked_dir=args.masked_dir,
+        decode_workers=args.decode_workers,
+        ocr_workers=args.ocr_workers,
+        mask_workers=args.mask_workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        ocr_mode=args.ocr_mode,
+        registry_dir=None if args.registry_dir == 'none' else args.registry_dir,
+        quality_gate=not args.no_quality_gate,
+        transport=args.transport
+    )
+    pipeline.run(iter_sources(args.source), retry_errors=args.retry_errors)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
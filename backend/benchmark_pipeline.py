@@ -0,0 +1,455 @@
+"""
+識別管線基準測試
+在帶標註的語料上，以多組速度設置運行 分類 → OCR → 信息提取 → 隱私遮蔽，
+同時統計各字段的精確率/召回率、各階段延遲和內存峰值，用於挑選帕累托最優的生產配置
+
+語料格式與 model_training/generate_test_data.py --synthetic 的輸出一致：
+    <語料目錄>/labels.jsonl，每行包含 file、document_type、fields
+
+用法:
+    python benchmark_pipeline.py ../data/synthetic --limit 200 \
+        --ocr-modes standard,two_tier --max-sides 0,1600 --orientation on,off
+
+    # 只比較完整解碼與縮小解碼的耗時和內存峰值
+    python benchmark_pipeline.py <照片目錄的語料> --decode-only --decode-targets classify,1600,960
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+import multiprocessing as mp
+import numpy as np
+
+# 與 InfoExtractor.extract 輸出對應、參與精確率/召回率統計的字段
+FIELDS = ['name', 'address', 'date', 'phone', 'amount', 'id_number',
+          'account_number', 'bill_period', 'account_balance']
+
+STAGES = ['decode', 'classify', 'ocr', 'extract', 'mask', 'total']
+
+
+def peak_rss_mb():
+    """當前進程的內存峰值（MB）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 單位為KB，macOS 為字節
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return None
+
+
+def load_corpus(corpus_dir, limit=None):
+    """讀取語料標註"""
+    samples = []
+    with open(os.path.join(corpus_dir, 'labels.jsonl'), 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                sample = json.loads(line)
+                sample['path'] = os.path.join(corpus_dir, sample['file'])
+                samples.append(sample)
+    if limit:
+        # 按類別輪流取樣，保證每個類別都有覆蓋
+        by_class = {}
+        for sample in samples:
+            by_class.setdefault(sample['document_type'], []).append(sample)
+        interleaved = [s for group in itertools.zip_longest(*by_class.values()) for s in group if s]
+        samples = interleaved[:limit]
+    return samples
+
+
+def _run_isolated(ctx, target, args, timeout=None, poll=5.0):
+    """
+    在獨立進程中運行 target(*args, result_queue) 並等待其結果
+
+    子進程異常退出（內存不足、段錯誤）或超時時不會一直等待
+
+    Args:
+        ctx: multiprocessing 上下文
+        timeout: 最長等待秒數（None 或0表示不限制）
+        poll: 檢查子進程是否仍在運行的間隔秒數
+
+    Returns:
+        dict: 子進程的結果；失敗時為 {'error': 原因, 'exitcode': 退出碼}
+    """
+    result_queue = ctx.Queue()
+    worker = ctx.Process(target=target, args=(*args, result_queue))
+    worker.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    result = None
+    while result is None:
+        try:
+            result = result_queue.get(timeout=poll)
+        except queue.Empty:
+            if not worker.is_alive():
+                # 子進程可能在退出前剛放入結果
+                try:
+                    result = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    result = {'error': 'crashed', 'exitcode': worker.exitcode}
+            elif deadline is not None and time.monotonic() > deadline:
+                worker.terminate()
+                result = {'error': 'timeout', 'exitcode': None}
+    worker.join(10)
+    if 'error' in result:
+        result['exitcode'] = worker.exitcode
+    return result
+
+
+def _run_config(config, samples, masked_dir, result_queue):
+    """在獨立進程中運行一組配置，使內存峰值互不影響"""
+    from utils.document_classifier import DocumentClassifier
+    from utils.ocr_processor import OCRProcessor
+    from utils.info_extractor import InfoExtractor
+    from utils.privacy_masker import PrivacyMasker
+    from utils.image_io import load_image
+    from utils.text_classifier import TextClassifier, classify_text_first
+
+    classifier = DocumentClassifier(config['model'])
+    text_classifier = TextClassifier()
+    text_first = config['classify_mode'] == 'text_first'
+    ocr_processor = OCRProcessor(mode=config['ocr_mode'],
+                                 orientation_check=config['orientation_check'])
+    info_extractor = InfoExtractor()
+    privacy_masker = PrivacyMasker(output_dir=masked_dir)
+    rss_after_load = peak_rss_mb()
+
+    timings = {stage: [] for stage in STAGES}
+    counts = {field: {'tp': 0, 'fp': 0, 'fn': 0} for field in FIELDS}
+    type_correct = 0
+    cnn_skipped = 0
+
+    for sample in samples:
+        start = time.perf_counter()
+        t = start
+
+        def lap(stage):
+            nonlocal t
+            now = time.perf_counter()
+            timings[stage].append(now - t)
+            t = now
+
+        image = load_image(sample['path'], max_side=config['max_side'])
+        lap('decode')
+        if text_first:
+            ocr_text = ocr_processor.process(image)
+            lap('ocr')
+            doc_type, _, _, classified_by = classify_text_first(
+                ocr_text, image, text_classifier, classifier, config['text_threshold'])
+            lap('classify')
+            cnn_skipped += classified_by == 'text'
+        else:
+            doc_type, _ = classifier.classify(image)
+            lap('classify')
+            ocr_text = ocr_processor.process(image)
+            lap('ocr')
+        extracted = info_extractor.extract(ocr_text, doc_type)
+        lap('extract')
+        privacy_masker.mask_info(os.path.basename(sample['path']), extracted, image=image)
+        lap('mask')
+        timings['total'].append(time.perf_counter() - start)
+
+        type_correct += doc_type == sample['document_type']
+        truth = sample.get('fields', {})
+        for field in FIELDS:
+            predicted = extracted.get(field)
+            expected = truth.get(field)
+            if predicted and expected and \
+                    info_extractor.normalize(predicted) == info_extractor.normalize(expected):
+                counts[field]['tp'] += 1
+            else:
+                if predicted:
+                    counts[field]['fp'] += 1
+                if expected:
+                    counts[field]['fn'] += 1
+
+    fields = {}
+    for field, c in counts.items():
+        precision = c['tp'] / (c['tp'] + c['fp']) if c['tp'] + c['fp'] else None
+        recall = c['tp'] / (c['tp'] + c['fn']) if c['tp'] + c['fn'] else None
+        fields[field] = dict(c, precision=precision, recall=recall)
+
+    tp = sum(c['tp'] for c in counts.values())
+    fp = sum(c['fp'] for c in counts.values())
+    fn = sum(c['fn'] for c in counts.values())
+    micro_p = tp / (tp + fp) if tp + fp else 0.0
+    micro_r = tp / (tp + fn) if tp + fn else 0.0
+
+    result_queue.put({
+        'config': config,
+        'documents': len(samples),
+        'document_type_accuracy': type_correct / len(samples) if samples else None,
+        'cnn_skip_rate': cnn_skipped / len(samples) if samples else None,
+        'fields': fields,
+        'micro_f1': 2 * micro_p * micro_r / (micro_p + micro_r) if micro_p + micro_r else 0.0,
+        'latency_ms': {
+            stage: {
+                'mean': float(np.mean(values) * 1000),
+                'p50': float(np.percentile(values, 50) * 1000),
+                'p95': float(np.percentile(values, 95) * 1000)
+            }
+            for stage, values in timings.items() if values
+        },
+        'rss_after_load_mb': rss_after_load,
+        'peak_rss_mb': peak_rss_mb()
+    })
+
+
+def _run_decode(method, target, samples, result_queue):
+    """
+    在獨立進程中測量一種解碼方式的耗時和內存峰值
+
+    Args:
+        method: 'full'（完整解碼後縮小）或 'reduced'（縮小解碼）
+        target: 'classify'（分類器輸入 224×224）或最長邊像素數
+    """
+    import cv2
+    from utils.image_io import load_image_reduced, downscale
+
+    classify_size = (224, 224)
+    rss_before = peak_rss_mb()
+    timings = []
+    megapixels = []
+    for sample in samples:
+        start = time.perf_counter()
+        if target == 'classify':
+            source = cv2.imread(sample['path']) if method == 'full' else sample['path']
+            image = cv2.resize(load_image_reduced(source, classify_size), classify_size,
+                               interpolation=cv2.INTER_AREA)
+        elif method == 'full':
+            image = downscale(cv2.imread(sample['path']), target)
+        else:
+            image = downscale(load_image_reduced(sample['path'], (target, 1)), target)
+        timings.append(time.perf_counter() - start)
+        if image is not None:
+            megapixels.append(image.shape[0] * image.shape[1] / 1e6)
+
+    result_queue.put({
+        'method': method,
+        'target': target,
+        'images': len(samples),
+        'decode_ms': {
+            'mean': float(np.mean(timings) * 1000),
+            'p50': float(np.percentile(timings, 50) * 1000),
+            'p95': float(np.percentile(timings, 95) * 1000)
+        },
+        'output_megapixels': float(np.mean(megapixels)) if megapixels else None,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb()
+    })
+
+
+def run_decode_benchmark(corpus_dir, targets, limit=None, output='results/benchmark_decode',
+                         timeout=None):
+    """
+    對比完整解碼與縮小解碼（分類、預覽、OCR前縮小共用的讀取路徑）
+
+    Args:
+        timeout: 每種解碼方式的最長秒數（None 表示不限制）
+
+    Returns:
+        list: 每種目標尺寸和解碼方式的結果（失敗的帶 error 字段）
+    """
+    from utils.image_io import image_size
+
+    samples = load_corpus(corpus_dir, limit)
+    sizes = [size for size in (image_size(sample['path']) for sample in samples) if size]
+    source_mp = float(np.mean([w * h / 1e6 for w, h in sizes])) if sizes else 0.0
+    print(f"語料: {len(samples)} 張圖片，平均 {source_mp:.1f} MP")
+
+    ctx = mp.get_context('spawn')
+    results = []
+    for target in targets:
+        for method in ('full', 'reduced'):
+            result = _run_isolated(ctx, _run_decode, (method, target, samples), timeout)
+            if 'error' in result:
+                result.update({'method': method, 'target': target})
+                print(f"  {target} {method}: 失敗（{result['error']}，退出碼 {result['exitcode']}）")
+            results.append(result)
+
+    lines = ['| target | method | decode_mean_ms | decode_p95_ms | output_mp | peak_rss_mb |',
+             '|---|---|---|---|---|---|']
+    for r in results:
+        if 'error' in r:
+            lines.append(f"| {r['target']} | {r['method']} | failed: {r['error']} | - | - | - |")
+            continue
+        lines.append(f"| {r['target']} | {r['method']} | {r['decode_ms']['mean']:.1f} | "
+                     f"{r['decode_ms']['p95']:.1f} | {r['output_megapixels'] or 0:.2f} | "
+                     f"{r['peak_rss_mb'] or 0:.0f} |")
+    table = '\n'.join(lines)
+    print()
+    print(table)
+
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(f"{output}.json", 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(f"{output}.md", 'w', encoding='utf-8') as f:
+        f.write(table + '\n')
+    print(f"\n結果已保存到 {output}.json 和 {output}.md")
+
+    return results
+
+
+def build_matrix(models, ocr_modes, max_sides, orientation_checks,
+                 classify_modes=('cnn_first',), text_threshold=0.85):
+    """生成配置矩陣（笛卡爾積）"""
+    return [
+        {'model': model, 'ocr_mode': ocr_mode, 'max_side': max_side, 'orientation_check': orient,
+         'classify_mode': classify_mode, 'text_threshold': text_threshold}
+        for model, ocr_mode, max_side, orient, classify_mode in itertools.product(
+            models, ocr_modes, max_sides, orientation_checks, classify_modes)
+    ]
+
+
+def mark_pareto(results):
+    """標記在平均總延遲和字段F1上不被其他配置同時超越的配置"""
+    for r in results:
+        latency = r['latency_ms']['total']['mean']
+        r['pareto'] = not any(
+            o is not r
+            and o['latency_ms']['total']['mean'] <= latency
+            and o['micro_f1'] >= r['micro_f1']
+            and (o['latency_ms']['total']['mean'] < latency or o['micro_f1'] > r['micro_f1'])
+            for o in results
+        )
+    return results
+
+
+def format_table(results):
+    """將結果格式化為Markdown表格"""
+    header = ['model', 'ocr_mode', 'max_side', 'orientation', 'classify', 'cnn_skip',
+              'type_acc', 'field_f1',
+              'decode', 'classify', 'ocr', 'mask', 'total_p50', 'total_p95', 'peak_rss_mb', 'pareto']
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * len(header)]
+    for r in results:
+        c = r['config']
+        lat = r['latency_ms']
+        row = [
+            os.path.basename(c['model']), c['ocr_mode'], str(c['max_side'] or 'full'),
+            'on' if c['orientation_check'] else 'off',
+            c['classify_mode'], f"{r['cnn_skip_rate']:.2f}",
+            f"{r['document_type_accuracy']:.3f}", f"{r['micro_f1']:.3f}",
+            f"{lat['decode']['mean']:.0f}", f"{lat['classify']['mean']:.0f}",
+            f"{lat['ocr']['mean']:.0f}", f"{lat['mask']['mean']:.0f}",
+            f"{lat['total']['p50']:.0f}", f"{lat['total']['p95']:.0f}",
+            f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] else '-',
+            '*' if r['pareto'] else ''
+        ]
+        lines.append('| ' + ' | '.join(row) + ' |')
+
+    lines.append('')
+    lines.append('各字段 precision / recall:')
+    lines.append('')
+    lines.append('| config | ' + ' | '.join(FIELDS) + ' |')
+    lines.append('|' + '---|' * (len(FIELDS) + 1))
+    for i, r in enumerate(results):
+        cells = []
+        for field in FIELDS:
+            f = r['fields'][field]
+            p = '-' if f['precision'] is None else f"{f['precision']:.2f}"
+            rc = '-' if f['recall'] is None else f"{f['recall']:.2f}"
+            cells.append(f"{p}/{rc}")
+        lines.append(f"| {i} | " + ' | '.join(cells) + ' |')
+    return '\n'.join(lines)
+
+
+def run_benchmark(corpus_dir, configs, limit=None, output='results/benchmark',
+                  masked_dir='results/benchmark_masked', timeout=None):
+    """
+    對每組配置運行基準測試，並寫出JSON和Markdown表格
+
+    Args:
+        timeout: 每組配置的最長秒數（None 表示不限制）
+
+    Returns:
+        list: 每組配置的結果（失敗的配置帶 error 字段，不參與帕累托比較）
+    """
+    samples = load_corpus(corpus_dir, limit)
+    print(f"語料: {len(samples)} 份文檔，{len(configs)} 組配置")
+
+    ctx = mp.get_context('spawn')
+    results = []
+    failed = []
+    for i, config in enumerate(configs):
+        print(f"[{i + 1}/{len(configs)}] {config}")
+        result = _run_isolated(ctx, _run_config, (config, samples, masked_dir), timeout)
+        if 'error' in result:
+            result['config'] = config
+            failed.append(result)
+            print(f"  失敗（{result['error']}，退出碼 {result['exitcode']}）")
+            continue
+        results.append(result)
+        print(f"  字段F1 {result['micro_f1']:.3f}，"
+              f"平均總延遲 {result['latency_ms']['total']['mean']:.0f} ms")
+
+    mark_pareto(results)
+    table = format_table(results)
+    if failed:
+        table += '\n\n失敗的配置:\n\n' + '\n'.join(
+            f"- {r['config']}: {r['error']}（退出碼 {r['exitcode']}）" for r in failed)
+    results = results + failed
+    print()
+    print(table)
+
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(f"{output}.json", 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(f"{output}.md", 'w', encoding='utf-8') as f:
+        f.write(table + '\n')
+    print(f"\n結果已保存到 {output}.json 和 {output}.md")
+
+    return results
+
+
+def _parse_list(value, cast=str):
+    return [cast(v) for v in value.split(',') if v != '']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='識別管線精度/延遲基準測試')
+    parser.add_argument('corpus', help='語料目錄（包含 labels.jsonl）')
+    parser.add_argument('--limit', type=int, default=None, help='最多使用的文檔數')
+    parser.add_argument('--models', default='models/document_classifier.h5',
+                        help='逗號分隔的分類模型路徑（例如原模型和量化/蒸餾模型）')
+    parser.add_argument('--ocr-modes', default='standard,two_tier')
+    parser.add_argument('--max-sides', default='0,1600,1024', help='輸入最長邊，0 表示原尺寸')
+    parser.add_argument('--orientation', default='on,off', help='是否先做整頁方向檢測')
+    parser.add_argument('--classify-modes', default='cnn_first',
+                        help="逗號分隔：cnn_first、text_first（先OCR，文本置信度不足時才運行CNN）")
+    parser.add_argument('--text-threshold', type=float, default=0.85,
+                        help='text_first 模式的文本置信度閾值')
+    parser.add_argument('--output', default='results/benchmark', help='輸出文件前綴')
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help='每組配置的最長秒數，超時或子進程異常退出時記為失敗（0 表示不限制）')
+    parser.add_argument('--decode-only', action='store_true',
+                        help='只比較完整解碼與縮小解碼的耗時和內存峰值')
+    parser.add_argument('--decode-targets', default='classify,1600,960',
+                        help="解碼目標：'classify' 表示分類器輸入，數字表示最長邊")
+    args = parser.parse_args(argv)
+
+    if args.decode_only:
+        targets = [t if t == 'classify' else int(t) for t in _parse_list(args.decode_targets)]
+        run_decode_benchmark(args.corpus, targets, limit=args.limit,
+                             output=f"{args.output}_decode", timeout=args.timeout or None)
+        return
+
+    configs = build_matrix(
+        _parse_list(args.models),
+        _parse_list(args.ocr_modes),
+        _parse_list(args.max_sides, int),
+        [v == 'on' for v in _parse_list(args.orientation)],
+        _parse_list(args.classify_modes),
+        args.text_threshold
+    )
+    run_benchmark(args.corpus, configs, limit=args.limit, output=args.output,
+                  timeout=args.timeout or None)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+准入控制
+根據在處理中的請求數和最近的處理耗時選擇降級級別，超過硬上限時拒絕請求（503）
+
+負載升高時依次：縮小OCR輸入 → 關閉角度分類器、快速遮蔽 → 跳過CNN（只按OCR文字分類），
+使高負載時的尾延遲保持有界，而不是所有請求一起超時。
+"""
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 降級級別：級別越高越便宜
+LEVELS = [
+    {'level': 0, 'name': 'full'},
+    {'level': 1, 'name': 'reduced', 'ocr_max_side': 1280},
+    {'level': 2, 'name': 'fast', 'ocr_max_side': 960, 'angle_cls': False, 'fast_mask': True},
+    {'level': 3, 'name': 'minimal', 'ocr_max_side': 960, 'angle_cls': False, 'fast_mask': True,
+     'skip_cnn': True},
+]
+
+
+class Overloaded(Exception):
+    """請求數超過硬上限"""
+
+    def __init__(self, retry_after):
+        super().__init__('Server is overloaded, please retry later')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, soft_limit=4, hard_limit=16, target_seconds=5.0, window=50,
+                 cooldown=5.0, levels=None):
+        """
+        初始化准入控制
+
+        Args:
+            soft_limit: 處理中的請求數超過此值開始降級
+            hard_limit: 處理中的請求數達到此值時拒絕新請求
+            target_seconds: 最近請求耗時（P90）的目標值，超過時降級
+            window: 計算耗時使用的最近請求數
+            cooldown: 按耗時升高的級別每降一級至少間隔的秒數（避免在級別之間來回切換）
+            levels: 降級級別列表，默認為 LEVELS
+        """
+        self.soft_limit = soft_limit
+        self.hard_limit = max(hard_limit, soft_limit + 1)
+        self.target_seconds = target_seconds
+        self.cooldown = cooldown
+        self.levels = levels or LEVELS
+        self._latencies = deque(maxlen=window)
+        self._in_flight = 0
+        self._latency_level = 0
+        self._level_changed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def _recent_p90(self):
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)]
+
+    def _queue_level(self, depth):
+        """處理中的請求數在 soft_limit 和 hard_limit 之間時按比例選擇級別"""
+        if depth <= self.soft_limit:
+            return 0
+        ratio = (depth - self.soft_limit) / float(self.hard_limit - self.soft_limit)
+        return min(1 + int(ratio * (len(self.levels) - 1)), len(self.levels) - 1)
+
+    def _update_latency_level(self, now):
+        """耗時超過目標時立即升級；恢復後每隔 cooldown 秒降一級"""
+        ratio = self._recent_p90() / self.target_seconds if self.target_seconds else 0.0
+        if ratio < 1.0:
+            target = 0
+        else:
+            target = min(1 + int((ratio - 1.0) * 2), len(self.levels) - 1)
+
+        if target > self._latency_level:
+            self._latency_level = target
+            self._level_changed = now
+        elif target < self._latency_level and now - self._level_changed >= self.cooldown:
+            self._latency_level -= 1
+            self._level_changed = now
+        return self._latency_level
+
+    def acquire(self, count=1):
+        """
+        申請處理 count 份文檔
+
+        Returns:
+            dict: 本次請求使用的降級級別
+
+        Raises:
+            Overloaded: 處理中的請求數將超過硬上限
+        """
+        with self._lock:
+            if self._in_flight + count > self.hard_limit:
+                raise Overloaded(self.retry_after())
+            self._in_flight += count
+            level = max(self._queue_level(self._in_flight),
+                        self._update_latency_level(time.monotonic()))
+            return self.levels[level]
+
+    def release(self, count=1, seconds=None):
+        """
+        處理完成
+
+        Args:
+            count: 文檔數（與 acquire 相同）
+            seconds: 每份文檔的處理耗時（可選，用於計算最近耗時）
+        """
+        with self._lock:
+            self._in_flight = max(self._in_flight - count, 0)
+            if seconds is not None:
+                self._latencies.append(seconds)
+
+    def retry_after(self):
+        """建議客戶端重試前等待的秒數（按最近的平均耗時估算）"""
+        if not self._latencies:
+            return 1
+        return max(int(math.ceil(sum(self._latencies) / len(self._latencies))), 1)
+
+    @contextmanager
+    def admit(self, count=1):
+        """
+        在 with 塊中處理請求，結束時自動釋放並記錄耗時
+
+        超過 hard_limit 份文檔的批量請求按 hard_limit 計算，空閒時總能被接納
+
+        Yields:
+            dict: 降級級別
+        """
+        charged = min(count, self.hard_limit)
+        level = self.acquire(charged)
+        start = time.perf_counter()
+        try:
+            yield level
+        finally:
+            self.release(charged, (time.perf_counter() - start) / max(count, 1))
@@ -3,23 +3,40 @@
 使用訓練好的模型對文檔進行分類
 """
 import os
+import time
+import threading
+import cv2
 import numpy as np
-from PIL import Image
 import tensorflow as tf
 from tensorflow import keras
 
+from .model_registry import file_version
+from .image_io import load_image_reduced
+
 
 class DocumentClassifier:
-    def __init__(self, model_path='models/document_classifier.h5'):
+    def __init__(self, model_path='models/document_classifier.h5', registry=None, version=None,
+                 reload_interval=5.0):
         """
         初始化文檔分類器
         
         Args:
-            model_path: 模型文件路徑
+            model_path: 模型文件路徑（沒有模型註冊表或註冊表為空時使用）
+            registry: 模型註冊表（ModelRegistry），提供時使用其中的當前版本
+            version: 固定使用註冊表中的某個版本（不再跟隨當前版本熱切換）
+            reload_interval: 檢查註冊表當前版本是否變化的最小間隔（秒）
         """
         self.model_path = model_path
-        self.model = None
-        self.img_size = (224, 224)
+        self.registry = registry
+        self.pinned_version = version
+        self.reload_interval = reload_interval
+        
+        # 模型、版本和輸入尺寸放在同一個元組裡整體替換，推理時一次讀取，熱切換不會混用新舊版本
+        # 輸入尺寸 (寬, 高) 取自模型，蒸餾的小模型（例如128×128）可直接加載
+        self._state = (None, 'random', (224, 224))
+        self._reload_lock = threading.Lock()
+        self._last_check = 0.0
+        self._registry_mtime = None
         
         # 文檔類型標籤
         self.class_labels = [
@@ -34,12 +51,39 @@ class DocumentClassifier:
         # 嘗試加載模型
         self._load_model()
     
+    @property
+    def model(self):
+        return self._state[0]
+    
+    @property
+    def model_version(self):
+        """當前模型版本（註冊表版本名，未註冊的模型文件為其校驗和，沒有模型時為 random）"""
+        return self._state[1]
+    
+    @property
+    def img_size(self):
+        """當前模型的輸入尺寸 (寬, 高)"""
+        return self._state[2]
+    
+    @staticmethod
+    def _input_size(model):
+        """從模型輸入形狀 (批次, 高, 寬, 通道) 讀取 (寬, 高)"""
+        height, width = model.input_shape[1:3]
+        return (width, height)
+    
     def _load_model(self):
         """加載訓練好的模型"""
         try:
-            if os.path.exists(self.model_path):
-                self.model = keras.models.load_model(self.model_path)
-                print(f"模型已加載: {self.model_path}")
+            version = None
+            if self.registry is not None:
+                self._registry_mtime = self.registry.manifest_mtime()
+                version = self.pinned_version or self.registry.active_version()
+            if version:
+                self.reload(version)
+            elif os.path.exists(self.model_path):
+                model = keras.models.load_model(self.model_path, compile=False)
+                self._state = (model, file_version(self.model_path), self._input_size(model))
+                print(f"模型已加載: {self.model_path} ({self.model_version}，輸入 {self.img_size})")
             else:
                 print(f"模型文件不存在: {self.model_path}")
                 print("將使用隨機分類結果（僅用於測試）")
@@ -47,67 +91,165 @@ class DocumentClassifier:
             print(f"模型加載失敗: {e}")
             print("將使用隨機分類結果（僅用於測試）")
     
-    def classify(self, image_path):
+    def reload(self, version=None):
+        """
+        從註冊表加載某個版本並原子地替換當前模型
+        
+        新模型在替換前完成加載和預熱，替換期間的請求繼續使用舊模型
+        
+        Args:
+            version: 版本名，默認為註冊表的當前版本
+            
+        Returns:
+            str: 加載後的版本
+        """
+        if self.registry is None:
+            raise ValueError("沒有配置模型註冊表")
+        version = version or self.registry.active_version()
+        with self._reload_lock:
+            if version == self.model_version:
+                return version
+            path = self.registry.model_path(version)
+            if not self.registry.verify(version):
+                raise ValueError(f"模型文件校驗失敗: {path}")
+            model = keras.models.load_model(path, compile=False)
+            img_size = self._input_size(model)
+            # 預熱：第一次推理會構建計算圖，不應由切換後的第一個請求承擔
+            model.predict(np.zeros((1, img_size[1], img_size[0], 3), dtype=np.float32), verbose=0)
+            self._state = (model, version, img_size)
+        print(f"模型已切換: {version} ({path})")
+        return version
+    
+    def maybe_reload(self):
+        """
+        註冊表的當前版本變化時熱切換（按 reload_interval 節流，只檢查清單文件的修改時間）
+        
+        多個服務進程各自檢查，修改註冊表後所有進程都會在下一個請求時切換
+        """
+        if self.registry is None or self.pinned_version is not None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        mtime = self.registry.manifest_mtime()
+        if mtime is None or mtime == self._registry_mtime:
+            return
+        self._registry_mtime = mtime
+        try:
+            active = self.registry.active_version()
+            if active and active != self.model_version:
+                self.reload(active)
+        except Exception as e:
+            print(f"模型熱切換失敗，繼續使用 {self.model_version}: {e}")
+    
+    def classify(self, image_path, with_version=False):
         """
         對文檔進行分類
         
         Args:
-            image_path: 圖片路徑
+            image_path: 圖片路徑，或已解碼的BGR圖片數組
+            with_version: 是否同時返回做出預測的模型版本
             
         Returns:
-            tuple: (文檔類型, 置信度)
+            tuple: (文檔類型, 置信度)，with_version 時為 (文檔類型, 置信度, 模型版本)
         """
-        if self.model is None:
+        self.maybe_reload()
+        model, version, img_size = self._state
+        
+        if model is None:
             # 如果模型未加載，返回隨機結果（僅用於測試）
             import random
             doc_type = random.choice(self.class_labels)
             confidence = random.uniform(0.7, 0.95)
-            return doc_type, confidence
+            return (doc_type, confidence, version) if with_version else (doc_type, confidence)
         
         try:
             # 預處理圖片
-            img = self._preprocess_image(image_path)
+            img = self._preprocess_image(image_path, img_size)
             
             # 預測
-            predictions = self.model.predict(img, verbose=0)
+            predictions = model.predict(img, verbose=0)
             predicted_class_idx = np.argmax(predictions[0])
             confidence = float(predictions[0][predicted_class_idx])
             
             # 獲取類別名稱
             doc_type = self.class_labels[predicted_class_idx]
-            
-            return doc_type, confidence
         
         except Exception as e:
             print(f"分類錯誤: {e}")
             # 返回默認值
-            return 'other', 0.5
+            doc_type, confidence = 'other', 0.5
+        
+        return (doc_type, confidence, version) if with_version else (doc_type, confidence)
+    
+    def classify_batch(self, images, with_version=False):
+        """
+        批量分類文檔（一次前向傳播）
+        
+        Args:
+            images: 圖片路徑或BGR圖片數組的列表
+            with_version: 是否同時返回做出預測的模型版本
+            
+        Returns:
+            list: 每張圖片的 (文檔類型, 置信度)；with_version 時返回 (列表, 模型版本)
+        """
+        self.maybe_reload()
+        model, version, img_size = self._state
+        
+        if model is None:
+            results = [self.classify(image) for image in images]
+            return (results, version) if with_version else results
+        
+        results = [('other', 0.5)] * len(images)
+        batch = []
+        indices = []
+        for i, image in enumerate(images):
+            try:
+                batch.append(self._preprocess_image(image, img_size))
+                indices.append(i)
+            except Exception as e:
+                print(f"分類錯誤: {e}")
+        
+        if not batch:
+            return (results, version) if with_version else results
+        
+        try:
+            predictions = model.predict(np.concatenate(batch, axis=0), verbose=0)
+            for i, prediction in zip(indices, predictions):
+                predicted_class_idx = np.argmax(prediction)
+                results[i] = (self.class_labels[predicted_class_idx],
+                              float(prediction[predicted_class_idx]))
+        except Exception as e:
+            print(f"批量分類錯誤: {e}")
+        
+        return (results, version) if with_version else results
     
-    def _preprocess_image(self, image_path):
+    def _preprocess_image(self, image_path, img_size=None):
         """
         預處理圖片
         
+        從文件讀取時按模型輸入尺寸縮小解碼（大圖只解碼 1/2～1/8 分辨率）
+        
         Args:
-            image_path: 圖片路徑
+            image_path: 圖片路徑，或已解碼的BGR圖片數組
+            img_size: 模型輸入尺寸 (寬, 高)，默認為當前模型的尺寸
             
         Returns:
             numpy array: 預處理後的圖片數組
         """
-        # 讀取圖片
-        img = Image.open(image_path)
-        
-        # 轉換為RGB（如果是RGBA或其他格式）
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        img_size = img_size or self.img_size
+        img = load_image_reduced(image_path, img_size)
+        if img is None:
+            raise ValueError(f"無法讀取圖片: {image_path}")
         
         # 調整大小
-        img = img.resize(self.img_size)
+        img = cv2.resize(img, img_size, interpolation=cv2.INTER_AREA)
         
-        # 轉換為數組並歸一化
-        img_array = np.array(img) / 255.0
+        # BGR轉RGB，轉換為數組並歸一化
+        img_array = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) / 255.0
         
         # 添加批次維度
         img_array = np.expand_dims(img_array, axis=0)
         
         return img_array
-
@@ -0,0 +1,99 @@
+"""
+縮略圖/預覽緩存
+按需生成多種尺寸的預覽圖並緩存在磁盤上，供圖片服務使用
+
+緩存文件名由源文件的路徑、大小、修改時間和預覽尺寸哈希得到：
+源文件改變後自動生成新的預覽，舊文件不會被誤用，哈希同時用作強ETag。
+"""
+import os
+import hashlib
+import threading
+import cv2
+
+from .image_io import load_image
+
+# 預覽尺寸：名稱 → 最長邊像素數
+PREVIEW_SIZES = {
+    'thumb': 160,
+    'preview': 800,
+    'large': 1600
+}
+
+
+def file_etag(path):
+    """
+    根據文件路徑、大小和修改時間生成ETag（不讀取文件內容）
+
+    Args:
+        path: 文件路徑
+
+    Returns:
+        str: 十六進制摘要
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    def __init__(self, cache_dir='cache/previews', sizes=None, quality=85):
+        """
+        初始化預覽緩存
+
+        Args:
+            cache_dir: 緩存目錄
+            sizes: 預覽尺寸（名稱 → 最長邊像素數），默認為 PREVIEW_SIZES
+            quality: JPEG質量
+        """
+        self.cache_dir = cache_dir
+        self.sizes = sizes or PREVIEW_SIZES
+        self.quality = quality
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _lock_for(self, key):
+        """同一預覽只生成一次，並發請求等待第一個請求的結果"""
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, source_path, size):
+        """
+        返回源圖片某個尺寸的預覽，不存在時生成
+
+        Args:
+            source_path: 源圖片路徑
+            size: 預覽尺寸名稱
+
+        Returns:
+            tuple: (預覽文件路徑, ETag)；源文件無法解碼（例如PDF）時返回 (None, None)
+        """
+        if size not in self.sizes:
+            raise ValueError(f"不支持的預覽尺寸: {size}")
+
+        etag = hashlib.sha1(f"{file_etag(source_path)}:{size}:{self.quality}".encode('utf-8')).hexdigest()
+        cached_path = os.path.join(self.cache_dir, etag[:2], f"{etag}.jpg")
+        if os.path.exists(cached_path):
+            return cached_path, etag
+
+        lock = self._lock_for(etag)
+        try:
+            with lock:
+                if not os.path.exists(cached_path):
+                    # 縮小解碼：大圖只解碼接近預覽尺寸的分辨率
+                    image = load_image(source_path, max_side=self.sizes[size])
+                    if image is None:
+                        return None, None
+                    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    if not ok:
+                        return None, None
+
+                    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+                    tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.part"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(encoded.tobytes())
+                    os.replace(tmp_path, cached_path)
+        finally:
+            with self._locks_guard:
+                self._locks.pop(etag, None)
+        return cached_path, etag
@@ -0,0 +1,147 @@
+"""
+圖片讀取工具
+統一處理上傳內容的解碼，讓管線可以直接在記憶體中的圖片上運行
+
+目標尺寸遠小於原圖時（分類、預覽、OCR前縮小），使用縮小解碼：
+JPEG 在DCT域直接按 1/2、1/4、1/8 解碼，不會先解碼出隨後被丟棄的像素。
+"""
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+# OpenCV 縮小解碼標誌（JPEG 由 libjpeg 按比例解碼，其他格式解碼後再縮小）
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _is_bytes(source):
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def image_size(source):
+    """
+    只解析文件頭讀取圖片尺寸
+
+    Args:
+        source: 圖片路徑或字節
+
+    Returns:
+        tuple: (寬, 高)，無法識別時返回None
+    """
+    try:
+        with Image.open(io.BytesIO(source) if _is_bytes(source) else source) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def reduction_factor(size, min_size):
+    """
+    選擇最大的縮小倍數（1、2、4、8），使縮小後的圖片仍不小於 min_size
+
+    按長邊對長邊、短邊對短邊比較，EXIF 旋轉不影響結果
+
+    Args:
+        size: 原圖 (寬, 高)
+        min_size: 解碼結果的最小尺寸 (寬, 高)
+    """
+    short_side, long_side = sorted(size)
+    min_short, min_long = sorted(min_size)
+    for factor in (8, 4, 2):
+        if short_side // factor >= min_short and long_side // factor >= min_long:
+            return factor
+    return 1
+
+
+def load_image_reduced(source, min_size):
+    """
+    以不小於 min_size 的最低分辨率讀取圖片
+
+    Args:
+        source: 圖片路徑、圖片字節或已解碼的BGR數組（數組原樣返回）
+        min_size: 解碼結果的最小尺寸 (寬, 高)
+
+    Returns:
+        numpy array: BGR圖片數組，讀取失敗時返回None
+    """
+    if isinstance(source, np.ndarray):
+        return source
+
+    size = image_size(source)
+    factor = reduction_factor(size, min_size) if size else 1
+    flag = _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    if _is_bytes(source):
+        if not source:
+            return None
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flag)
+    return cv2.imread(source, flag)
+
+
+def downscale(image, max_side):
+    """
+    將圖片最長邊縮小到 max_side（不放大；max_side 為0或None時原樣返回）
+    """
+    if image is None or not max_side:
+        return image
+    height, width = image.shape[:2]
+    if max(height, width) <= max_side:
+        return image
+    scale = max_side / float(max(height, width))
+    return cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                      interpolation=cv2.INTER_AREA)
+
+
+def decode_image(data, max_side=None):
+    """
+    將上傳的圖片字節解碼為BGR數組
+
+    Args:
+        data: 圖片文件的原始字節
+        max_side: 最長邊上限（可選，設置時使用縮小解碼）
+
+    Returns:
+        numpy array: BGR圖片數組，無法解碼（例如PDF）時返回None
+    """
+    if not data:
+        return None
+    if max_side:
+        return downscale(load_image_reduced(data, (max_side, 1)), max_side)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def load_image(image, max_side=None):
+    """
+    讀取圖片為BGR數組
+
+    Args:
+        image: 圖片路徑或已解碼的BGR數組
+        max_side: 最長邊上限（可選，設置時使用縮小解碼）
+
+    Returns:
+        numpy array: BGR圖片數組，讀取失敗時返回None
+    """
+    if isinstance(image, np.ndarray):
+        return downscale(image, max_side)
+    if max_side:
+        return downscale(load_image_reduced(image, (max_side, 1)), max_side)
+    return cv2.imread(image)
+
+
+def save_bytes(data, filepath):
+    """
+    將上傳內容寫入磁盤（先寫臨時文件再改名，避免讀到寫了一半的文件）
+
+    Args:
+        data: 文件字節
+        filepath: 目標路徑
+    """
+    tmp_path = f"{filepath}.part"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
@@ -65,6 +65,36 @@ class InfoExtractor:
         
         return extracted
     
+    def check_consistency(self, extracted_list: List[Dict],
+                          fields: Optional[List[str]] = None) -> Dict:
+        """
+        檢查多份文檔之間關鍵信息是否一致
+        
+        Args:
+            extracted_list: 每份文檔提取的信息字典
+            fields: 需要比對的字段（默認為地址和姓名）
+            
+        Returns:
+            dict: 每個字段的比對結果；少於兩份文檔有該字段時 consistent 為 None
+        """
+        fields = fields or ['address', 'name']
+        summary = {}
+        
+        for field in fields:
+            values = [info.get(field) if info else None for info in extracted_list]
+            normalized = {self.normalize(v) for v in values if v}
+            present = sum(1 for v in values if v)
+            summary[field] = {
+                'values': values,
+                'consistent': len(normalized) == 1 if present >= 2 else None
+            }
+        
+        return summary
+    
+    def normalize(self, value: str) -> str:
+        """統一大小寫並去除空白和標點，用於比對"""
+        return re.sub(r'[\s,.，。:：\-]', '', str(value)).lower()
+    
     def _extract_address(self, text: str) -> Optional[str]:
         """提取地址"""
         for pattern in self.address_patterns:
@@ -0,0 +1,93 @@
+"""
+運行指標
+線程安全的計數器、數值和耗時統計，供 /api/metrics 導出（JSON 或 Prometheus 文本格式）
+"""
+import threading
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Metrics:
+    def __init__(self):
+        """初始化指標註冊表"""
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+
+    def inc(self, name, value=1, **labels):
+        """計數器加 value"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """設置當前數值（例如隊列長度、內存）"""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """記錄一次觀測值（例如耗時），統計次數、總和和最大值"""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+
+    def counter(self, name, **labels):
+        """讀取計數器"""
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def summary(self, name, **labels):
+        """讀取觀測統計（沒有觀測時返回None）"""
+        with self._lock:
+            summary = self._summaries.get(_key(name, labels))
+            return dict(summary) if summary else None
+
+    def snapshot(self):
+        """
+        導出全部指標
+
+        Returns:
+            dict: {'counters': [...], 'gauges': [...], 'summaries': [...]}，每項帶 name 和 labels
+        """
+        with self._lock:
+            def rows(items, field=None):
+                result = []
+                for (name, labels), value in sorted(items.items()):
+                    row = {'name': name, 'labels': dict(labels)}
+                    if field:
+                        row[field] = value
+                    else:
+                        row.update(value)
+                        row['mean'] = value['sum'] / value['count'] if value['count'] else 0.0
+                    result.append(row)
+                return result
+
+            return {
+                'counters': rows(self._counters, 'value'),
+                'gauges': rows(self._gauges, 'value'),
+                'summaries': rows(self._summaries)
+            }
+
+    def to_prometheus(self, prefix='docrec_'):
+        """導出為 Prometheus 文本格式"""
+        def fmt(name, labels, suffix=''):
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            return f"{prefix}{name}{suffix}" + (f"{{{label_text}}}" if label_text else '')
+
+        snapshot = self.snapshot()
+        lines = []
+        for row in snapshot['counters']:
+            lines.append(f"{fmt(row['name'], row['labels'])} {row['value']}")
+        for row in snapshot['gauges']:
+            lines.append(f"{fmt(row['name'], row['labels'])} {row['value']}")
+        for row in snapshot['summaries']:
+            lines.append(f"{fmt(row['name'], row['labels'], '_count')} {row['count']}")
+            lines.append(f"{fmt(row['name'], row['labels'], '_sum')} {row['sum']}")
+            lines.append(f"{fmt(row['name'], row['labels'], '_max')} {row['max']}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,237 @@
+"""
+模型註冊表
+管理分類模型的版本（校驗和、評估指標、導出格式），並記錄當前使用的版本
+
+目錄結構:
+    models/registry/
+    ├── registry.json            # 所有版本及當前版本
+    └── <版本>/document_classifier.h5
+
+用法（在 backend 目錄下）:
+    python -m utils.model_registry list
+    python -m utils.model_registry register models/document_classifier.h5 --activate
+    python -m utils.model_registry activate v2
+    python -m utils.model_registry compare v1 v2 uploads/
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """計算文件的SHA256校驗和"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_version(path):
+    """未註冊的模型文件以校驗和作為版本標識"""
+    return f"sha256:{file_checksum(path)[:12]}"
+
+
+class ModelRegistry:
+    def __init__(self, registry_dir='models/registry'):
+        """
+        初始化模型註冊表
+
+        Args:
+            registry_dir: 註冊表目錄
+        """
+        self.registry_dir = registry_dir
+        self.manifest_path = os.path.join(registry_dir, 'registry.json')
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {'active': None, 'versions': {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, manifest):
+        # 先寫臨時文件再改名，其他進程不會讀到寫了一半的清單
+        os.makedirs(self.registry_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def exists(self):
+        """註冊表是否已創建"""
+        return os.path.exists(self.manifest_path)
+
+    def manifest_mtime(self):
+        """清單文件的修改時間（用於低成本地檢測版本切換）"""
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def versions(self):
+        """返回所有版本的信息"""
+        return self._load()['versions']
+
+    def active_version(self):
+        """返回當前使用的版本"""
+        return self._load()['active']
+
+    def get(self, version):
+        """返回某個版本的信息"""
+        versions = self.versions()
+        if version not in versions:
+            raise KeyError(f"模型版本不存在: {version}")
+        return versions[version]
+
+    def model_path(self, version, fmt='keras'):
+        """返回某個版本某種格式的模型文件路徑"""
+        return os.path.join(self.registry_dir, self.get(version)['formats'][fmt])
+
+    def register(self, model_path, version=None, metrics=None, extra_formats=None,
+                 activate=False, notes=None):
+        """
+        註冊新版本：複製模型文件到註冊表並記錄校驗和與指標
+
+        Args:
+            model_path: Keras 模型文件
+            version: 版本名（默認為 v<序號>）
+            metrics: 評估指標，如 {'val_accuracy': 0.93}
+            extra_formats: 其他導出格式，如 {'tflite': 'model.tflite'}
+            activate: 是否設為當前版本
+            notes: 備註
+
+        Returns:
+            str: 版本名
+        """
+        manifest = self._load()
+        if version is None:
+            version = f"v{len(manifest['versions']) + 1}"
+        if version in manifest['versions']:
+            raise ValueError(f"模型版本已存在: {version}")
+
+        version_dir = os.path.join(self.registry_dir, version)
+        os.makedirs(version_dir, exist_ok=True)
+
+        formats = {}
+        for fmt, src in [('keras', model_path)] + list((extra_formats or {}).items()):
+            filename = os.path.basename(src)
+            shutil.copy2(src, os.path.join(version_dir, filename))
+            formats[fmt] = f"{version}/{filename}"
+
+        manifest['versions'][version] = {
+            'checksum': file_checksum(model_path),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': metrics or {},
+            'formats': formats,
+            'source': os.path.abspath(model_path),
+            'notes': notes
+        }
+        if activate or manifest['active'] is None:
+            manifest['active'] = version
+        self._save(manifest)
+        return version
+
+    def activate(self, version):
+        """切換當前版本；運行中的服務會在下一次檢查時熱切換"""
+        manifest = self._load()
+        if version not in manifest['versions']:
+            raise KeyError(f"模型版本不存在: {version}")
+        manifest['active'] = version
+        self._save(manifest)
+
+    def verify(self, version):
+        """校驗模型文件是否與註冊時一致"""
+        return file_checksum(self.model_path(version)) == self.get(version)['checksum']
+
+
+def compare_latency(registry, versions, image_paths, rounds=3):
+    """
+    交替運行兩個（或多個）版本，比較分類延遲
+
+    Returns:
+        dict: 每個版本的平均和p95延遲（毫秒）
+    """
+    import numpy as np
+    from .document_classifier import DocumentClassifier
+    from .image_io import load_image
+
+    classifiers = {v: DocumentClassifier(registry=registry, version=v) for v in versions}
+    images = [load_image(path) for path in image_paths]
+    images = [image for image in images if image is not None]
+    timings = {v: [] for v in versions}
+
+    for _ in range(rounds):
+        for image in images:
+            # 同一張圖片依次交給各版本，消除輸入差異和系統負載波動的影響
+            for version, classifier in classifiers.items():
+                start = time.perf_counter()
+                classifier.classify(image)
+                timings[version].append(time.perf_counter() - start)
+
+    results = {}
+    for version, values in timings.items():
+        values = np.array(values[len(images):] if rounds > 1 else values)  # 去掉第一輪預熱
+        results[version] = {
+            'mean_ms': float(values.mean() * 1000),
+            'p95_ms': float(np.percentile(values, 95) * 1000)
+        }
+        print(f"{version:12s} 平均 {results[version]['mean_ms']:.1f} ms, "
+              f"p95 {results[version]['p95_ms']:.1f} ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='模型註冊表')
+    parser.add_argument('--registry', default='models/registry')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list')
+
+    p = sub.add_parser('register')
+    p.add_argument('model')
+    p.add_argument('--version')
+    p.add_argument('--metrics', help='JSON格式的評估指標')
+    p.add_argument('--tflite', help='TFLite 導出文件')
+    p.add_argument('--activate', action='store_true')
+
+    p = sub.add_parser('activate')
+    p.add_argument('version')
+
+    p = sub.add_parser('compare')
+    p.add_argument('versions', nargs='+')
+    p.add_argument('images', help='圖片目錄')
+
+    args = parser.parse_args(argv)
+    registry = ModelRegistry(args.registry)
+
+    if args.command == 'list':
+        active = registry.active_version()
+        for version, info in registry.versions().items():
+            mark = '*' if version == active else ' '
+            print(f"{mark} {version:10s} {info['created_at']}  {info['checksum'][:12]}  "
+                  f"{json.dumps(info['metrics'])}  {','.join(info['formats'])}")
+    elif args.command == 'register':
+        version = registry.register(
+            args.model,
+            version=args.version,
+            metrics=json.loads(args.metrics) if args.metrics else None,
+            extra_formats={'tflite': args.tflite} if args.tflite else None,
+            activate=args.activate
+        )
+        print(f"已註冊: {version}")
+    elif args.command == 'activate':
+        registry.activate(args.version)
+        print(f"當前版本: {args.version}")
+    elif args.command == 'compare':
+        image_paths = [os.path.join(args.images, f) for f in sorted(os.listdir(args.images))
+                       if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        compare_latency(registry, args.versions, image_paths)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+模型階段
+識別管線中需要模型的部分（CNN分類、OCR、文本分類），可在Flask進程內直接調用，
+也可作為 WorkerPool 的處理函數在獨立進程中運行（見 worker_pool.py）
+"""
+import time
+import cv2
+import numpy as np
+
+from .ocr_processor import OCRProcessor
+from .document_classifier import DocumentClassifier
+from .text_classifier import TextClassifier, classify_text_first
+from .model_registry import ModelRegistry
+
+
+class ModelWorker:
+    def __init__(self, ocr_mode='standard', registry_dir='models/registry',
+                 model_path='models/document_classifier.h5',
+                 text_model_path='models/text_classifier.npz'):
+        """
+        加載識別管線使用的模型
+
+        Args:
+            ocr_mode: OCR模式（'standard' 或 'two_tier'）
+            registry_dir: 模型註冊表目錄（None 表示只使用 model_path）
+            model_path: 分類模型路徑（註冊表沒有當前版本時使用）
+            text_model_path: 文本分類模型路徑
+        """
+        registry = ModelRegistry(registry_dir) if registry_dir else None
+        self.ocr_processor = OCRProcessor(mode=ocr_mode)
+        self.document_classifier = DocumentClassifier(model_path, registry=registry)
+        self.text_classifier = TextClassifier(text_model_path)
+
+    def warm_up(self):
+        """用一張合成圖片運行一次分類和OCR，使首個真實請求不承擔初始化開銷"""
+        image = np.full((480, 640, 3), 255, dtype=np.uint8)
+        cv2.putText(image, 'WARM UP 0123456789', (40, 240), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.2, (0, 0, 0), 2)
+        self.document_classifier.classify(image)
+        self.ocr_processor.process_detailed(image)
+
+    def recognize(self, source, classification=None, text_first=False, text_threshold=0.85,
+                  ocr_max_side=None, angle_cls=True):
+        """
+        分類並識別文字
+
+        Args:
+            source: 圖片路徑或BGR數組
+            classification: 已有的 (文檔類型, 置信度, 模型版本)（可選）
+            text_first: 先OCR再按文字分類，文本置信度低於 text_threshold 時才運行CNN
+            text_threshold: 文本分類置信度閾值
+            ocr_max_side: OCR輸入的最長邊上限（可選）
+            angle_cls: 是否允許使用角度分類器
+
+        Returns:
+            dict: document_type、confidence、model_version、classified_by、ocr_output 和各階段耗時 timings
+        """
+        timings = {}
+        if classification is None and not text_first:
+            start = time.perf_counter()
+            classification = self.document_classifier.classify(source, with_version=True)
+            timings['classify'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ocr_output = self.ocr_processor.process_detailed(
+            source, max_side=ocr_max_side, angle_cls=angle_cls)
+        timings['ocr'] = time.perf_counter() - start
+
+        if text_first:
+            start = time.perf_counter()
+            doc_type, confidence, model_version, classified_by = classify_text_first(
+                ocr_output['text'], source, self.text_classifier, self.document_classifier,
+                text_threshold)
+            timings['classify'] = time.perf_counter() - start
+        else:
+            doc_type, confidence, model_version = classification
+            classified_by = 'cnn'
+
+        return {
+            'document_type': doc_type,
+            'confidence': float(confidence),
+            'model_version': model_version,
+            'classified_by': classified_by,
+            'ocr_output': ocr_output,
+            'timings': timings
+        }
+
+    def __call__(self, task):
+        """
+        處理一個任務（WorkerPool 調用）
+
+        Args:
+            task: dict，image（BGR數組或None）、filepath，以及 recognize 的其他參數
+        """
+        image = task.get('image')
+        source = image if image is not None else task['filepath']
+        return self.recognize(
+            source,
+            classification=task.get('classification'),
+            text_first=task.get('text_first', False),
+            text_threshold=task.get('text_threshold', 0.85),
+            ocr_max_side=task.get('ocr_max_side'),
+            angle_cls=task.get('angle_cls', True)
+        )
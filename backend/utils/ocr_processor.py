@@ -14,14 +14,38 @@ except ImportError:
 import cv2
 import numpy as np
 
+from .image_io import downscale, load_image
+from .orientation import estimate_orientation, read_exif_orientation, rotate, unrotate_points
+from .ocr_result import OCRResult
+
+MOCK_TEXT = "【模擬模式】PaddleOCR 未安裝，無法進行真實OCR識別。\n請安裝: pip install paddleocr\n\n示例識別文字：\n這是一個示例文檔\n地址：香港九龍\n姓名：張三\n日期：2025-12-11"
+
 
 class OCRProcessor:
-    def __init__(self):
-        """初始化OCR處理器"""
+    def __init__(self, mode='standard', min_confidence=0.5, recheck_confidence=0.8,
+                 fast_max_side=960, fast_det_model_dir=None, orientation_check=True):
+        """
+        初始化OCR處理器
+
+        Args:
+            mode: 'standard' 單次完整識別；'two_tier' 先快速識別，再只對低置信度的行重新識別
+            min_confidence: 低於此置信度的行不會出現在文字結果中
+            recheck_confidence: 兩階段模式下，低於此置信度的行會被重新識別
+            fast_max_side: 快速識別時輸入圖片的最長邊
+            fast_det_model_dir: 快速識別使用的輕量檢測模型目錄（可選）
+            orientation_check: 先檢測整頁方向並轉正，只有不確定時才逐行角度分類
+        """
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.recheck_confidence = recheck_confidence
+        self.fast_max_side = fast_max_side
+        self.orientation_check = orientation_check
+
         # 初始化PaddleOCR，支持中英文
         # use_angle_cls=True 使用角度分類器
         # lang='ch' 支持中文
         self.ocr = None
+        self.fast_ocr = None
         if PADDLEOCR_AVAILABLE:
             try:
                 # 新版本 PaddleOCR 參數
@@ -30,76 +54,239 @@ class OCRProcessor:
                     lang='ch'
                     # use_gpu 參數在新版本中已移除，自動檢測
                 )
+                if mode == 'two_tier':
+                    # 快速識別：不加載角度分類器，檢測時限制輸入尺寸
+                    fast_options = {'det_limit_side_len': fast_max_side}
+                    if fast_det_model_dir:
+                        fast_options['det_model_dir'] = fast_det_model_dir
+                    self.fast_ocr = PaddleOCR(
+                        use_angle_cls=False,
+                        lang='ch',
+                        **fast_options
+                    )
             except Exception as e:
                 print(f"OCR初始化失敗: {e}")
                 self.ocr = None
+                self.fast_ocr = None
         else:
             print("PaddleOCR 未安裝，使用模擬模式")
-    
+
     def process(self, image_path):
         """
         處理圖片並提取文字
-        
+
         Args:
-            image_path: 圖片路徑
-            
+            image_path: 圖片路徑，或已解碼的BGR圖片數組
+
         Returns:
             str: 識別出的文字
         """
+        return self.process_detailed(image_path)['text']
+
+    def process_detailed(self, image_path, max_side=None, angle_cls=True):
+        """
+        處理圖片並返回文字、逐行結果和識別過程信息
+
+        Args:
+            image_path: 圖片路徑，或已解碼的BGR圖片數組
+            max_side: 識別前將圖片縮小到的最長邊（可選，負載高時用於降級，文本框座標仍對應原圖）
+            angle_cls: 是否允許使用角度分類器
+
+        Returns:
+            dict: text（文字）、lines（逐行結果 OCRResult）、info（識別模式和重新識別的行數等）
+        """
         if self.ocr is None:
             # 模擬模式：返回示例文字
-            return "【模擬模式】PaddleOCR 未安裝，無法進行真實OCR識別。\n請安裝: pip install paddleocr\n\n示例識別文字：\n這是一個示例文檔\n地址：香港九龍\n姓名：張三\n日期：2025-12-11"
-        
+            return {'text': MOCK_TEXT, 'lines': OCRResult.empty(), 'info': {'mode': 'mock'}}
+
         try:
-            # 執行OCR
-            result = self.ocr.ocr(image_path, cls=True)
-            
-            # 提取文字
-            text_lines = []
-            if result and result[0]:
-                for line in result[0]:
-                    if line and len(line) >= 2:
-                        text = line[1][0]  # 文字內容
-                        confidence = line[1][1]  # 置信度
-                        if confidence > 0.5:  # 只保留置信度高的結果
-                            text_lines.append(text)
-            
-            return '\n'.join(text_lines) if text_lines else "未識別到文字"
-        
+            lines, info = self._recognize(image_path, max_side, angle_cls)
+
+            # 只保留置信度高的結果
+            text_lines = [line['text'] for line in lines
+                          if line['confidence'] > self.min_confidence]
+            text = '\n'.join(text_lines) if text_lines else "未識別到文字"
+
+            return {'text': text, 'lines': OCRResult.from_lines(lines), 'info': info}
+
         except Exception as e:
             print(f"OCR處理錯誤: {e}")
-            return f"OCR處理失敗: {str(e)}"
-    
+            return {'text': f"OCR處理失敗: {str(e)}", 'lines': OCRResult.empty(),
+                    'info': {'mode': self.mode}}
+
     def process_with_boxes(self, image_path):
         """
         處理圖片並返回帶位置信息的文字
-        
+
+        Args:
+            image_path: 圖片路徑，或已解碼的BGR圖片數組
+
         Returns:
             list: 包含文字和位置的列表
         """
         if self.ocr is None:
             return []
-        
+
         try:
-            result = self.ocr.ocr(image_path, cls=True)
-            
-            boxes = []
-            if result and result[0]:
-                for line in result[0]:
-                    if line and len(line) >= 2:
-                        box = line[0]  # 位置信息
-                        text = line[1][0]  # 文字
-                        confidence = line[1][1]  # 置信度
-                        
-                        boxes.append({
-                            'box': box,
-                            'text': text,
-                            'confidence': float(confidence)
-                        })
-            
-            return boxes
-        
+            lines, _ = self._recognize(image_path)
+            return lines
+
         except Exception as e:
             print(f"OCR處理錯誤: {e}")
             return []
 
+    def _recognize(self, image_path, max_side=None, angle_cls=True):
+        """
+        按當前模式執行OCR
+
+        Returns:
+            tuple: (逐行結果列表, 識別過程信息)
+        """
+        scale = 1.0
+        if max_side:
+            original = load_image(image_path)
+            if original is not None:
+                small = downscale(original, max_side)
+                scale = small.shape[1] / float(original.shape[1])
+                image_path = small
+
+        image = image_path
+        use_cls = angle_cls
+        orientation = None
+        two_tier = self.mode == 'two_tier' and self.fast_ocr is not None
+
+        if self.orientation_check or two_tier:
+            image = load_image(image_path)
+            if image is None:
+                # 無法解碼為數組的文件（例如PDF）交給完整識別處理
+                image = image_path
+                two_tier = False
+            elif self.orientation_check:
+                unrotated_size = image.shape[1], image.shape[0]
+                image, orientation = self._orient(image, image_path)
+                use_cls = angle_cls and orientation['angle_cls']
+
+        if two_tier:
+            lines, info = self._recognize_two_tier(image, angle_cls)
+        else:
+            result = self.ocr.ocr(image, cls=use_cls)
+            lines, info = self._parse_result(result), {'mode': 'standard'}
+
+        # 文本框座標映射回轉正前、縮小前的原圖
+        if orientation is not None and orientation['rotation']:
+            for line in lines:
+                line['box'] = unrotate_points(line['box'], orientation['rotation'], *unrotated_size)
+        if scale < 1.0:
+            for line in lines:
+                line['box'] = [[x / scale, y / scale] for x, y in line['box']]
+            info['input_scale'] = scale
+        if not angle_cls:
+            info['angle_cls'] = False
+        if orientation is not None:
+            info['orientation'] = orientation
+        return lines, info
+
+    def _orient(self, image, image_path):
+        """
+        檢測整頁方向並轉正
+
+        Returns:
+            tuple: (轉正後的圖片, 方向檢測信息)
+        """
+        estimate = estimate_orientation(image)
+        image = rotate(image, estimate['rotation'])
+
+        if estimate['uncertain']:
+            path = 'angle_cls'
+        elif estimate['rotation']:
+            path = 'rotated'
+        else:
+            path = 'upright'
+
+        orientation = {
+            'path': path,
+            'rotation': estimate['rotation'],
+            'score': estimate['score'],
+            'angle_cls': estimate['uncertain'],
+            # OpenCV解碼時已按EXIF方向轉正，這裡只作記錄
+            'exif': read_exif_orientation(image_path) if isinstance(image_path, str) else None
+        }
+        return image, orientation
+
+    def _recognize_two_tier(self, image, angle_cls=True):
+        """
+        兩階段識別：縮小圖片快速識別，再在原圖上重新識別低置信度的行
+        """
+        height, width = image.shape[:2]
+        scale = min(1.0, self.fast_max_side / float(max(height, width)))
+        small = image
+        if scale < 1.0:
+            small = cv2.resize(image, (int(width * scale), int(height * scale)),
+                               interpolation=cv2.INTER_AREA)
+
+        # 第一階段：快速識別（無角度分類）
+        lines = self._parse_result(self.fast_ocr.ocr(small, cls=False))
+        for line in lines:
+            line['box'] = [[x / scale, y / scale] for x, y in line['box']]
+
+        # 第二階段：在原始分辨率上重新識別低置信度的行，並開啟角度分類（降級時關閉）
+        rechecked = 0
+        recovered = 0
+        for line in lines:
+            if line['confidence'] >= self.recheck_confidence:
+                continue
+            crop = self._crop_line(image, line['box'])
+            if crop is None:
+                continue
+            rechecked += 1
+            result = self.ocr.ocr(crop, det=False, cls=angle_cls)
+            if result and result[0]:
+                text, confidence = result[0][0]
+                if confidence > line['confidence']:
+                    if line['confidence'] <= self.min_confidence < confidence:
+                        recovered += 1
+                    line['text'] = text
+                    line['confidence'] = float(confidence)
+
+        info = {
+            'mode': 'two_tier',
+            'scale': scale,
+            'lines': len(lines),
+            'rechecked': rechecked,
+            'recovered': recovered
+        }
+        return lines, info
+
+    def _crop_line(self, image, box, padding=4, min_height=48):
+        """
+        按文本框從原圖裁剪出一行，過小時放大到識別模型的輸入高度
+        """
+        pts = np.array(box, dtype=np.float32)
+        height, width = image.shape[:2]
+        x1 = max(int(pts[:, 0].min()) - padding, 0)
+        y1 = max(int(pts[:, 1].min()) - padding, 0)
+        x2 = min(int(np.ceil(pts[:, 0].max())) + padding, width)
+        y2 = min(int(np.ceil(pts[:, 1].max())) + padding, height)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        crop = image[y1:y2, x1:x2]
+        if crop.shape[0] < min_height:
+            factor = min_height / float(crop.shape[0])
+            crop = cv2.resize(crop, (int(crop.shape[1] * factor), min_height),
+                              interpolation=cv2.INTER_CUBIC)
+        return crop
+
+    def _parse_result(self, result):
+        """將PaddleOCR的輸出轉換為逐行結果列表（多頁文件按頁順序排列）"""
+        lines = []
+        for page, page_result in enumerate(result or []):
+            for line in page_result or []:
+                if line and len(line) >= 2:
+                    lines.append({
+                        'box': line[0],  # 位置信息
+                        'text': line[1][0],  # 文字
+                        'confidence': float(line[1][1]),  # 置信度
+                        'page': page
+                    })
+        return lines
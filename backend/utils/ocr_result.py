@@ -0,0 +1,263 @@
+"""
+OCR結果
+以數組保存逐行OCR結果，代替每行一個字典、座標為嵌套列表的表示：
+    boxes        (N, 4, 2) float32  文本框四個角點
+    confidences  (N,)      float32  置信度
+    pages        (N,)      int32    頁碼
+    spans        (N, 2)    int64    每行文字在UTF-8緩衝區中的 [起始, 結束) 字節位置
+全部文字存放在一個 bytes 緩衝區中。
+
+按頁或按行區間切片時共享底層數組和文字緩衝區（零複製）；
+按區域篩選時只複製被選中行的數組，文字緩衝區仍然共享。
+
+序列化：
+    to_dict()  JSON，按列保存（每行的角點展平為8個數）
+    to_wire()  緊湊格式，數組打包為小端字節，供 MessagePack / CBOR 使用（見 dumps）
+"""
+import numpy as np
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import cbor2
+    CBOR_AVAILABLE = True
+except ImportError:
+    CBOR_AVAILABLE = False
+
+# 可協商的二進制格式：MIME類型 → 格式（只包含已安裝對應庫的格式）
+WIRE_FORMATS = {}
+if MSGPACK_AVAILABLE:
+    WIRE_FORMATS['application/msgpack'] = 'msgpack'
+    WIRE_FORMATS['application/x-msgpack'] = 'msgpack'
+if CBOR_AVAILABLE:
+    WIRE_FORMATS['application/cbor'] = 'cbor'
+
+
+def _to_quad(box):
+    """將文本框轉為四個角點；不是四點時取外接矩形"""
+    points = np.asarray(box, dtype=np.float32).reshape(-1, 2)
+    if points.shape == (4, 2):
+        return points
+    if not len(points):
+        return np.zeros((4, 2), dtype=np.float32)
+    (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+
+
+class OCRResult:
+    def __init__(self, boxes, confidences, text, spans, pages):
+        """
+        初始化OCR結果（通常使用 from_lines 創建）
+
+        Args:
+            boxes: (N, 4, 2) 文本框角點
+            confidences: (N,) 置信度
+            text: UTF-8文字緩衝區（bytes）
+            spans: (N, 2) 每行文字在緩衝區中的字節位置
+            pages: (N,) 頁碼
+        """
+        self.boxes = boxes
+        self.confidences = confidences
+        self.pages = pages
+        self.spans = spans
+        self._text = text
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        由逐行結果創建
+
+        Args:
+            lines: [{'box', 'text', 'confidence', 'page'（可選）}, ...]
+        """
+        count = len(lines)
+        boxes = np.zeros((count, 4, 2), dtype=np.float32)
+        confidences = np.zeros(count, dtype=np.float32)
+        pages = np.zeros(count, dtype=np.int32)
+        spans = np.zeros((count, 2), dtype=np.int64)
+        chunks = []
+        position = 0
+        for i, line in enumerate(lines):
+            data = line['text'].encode('utf-8')
+            boxes[i] = _to_quad(line['box'])
+            confidences[i] = line['confidence']
+            pages[i] = line.get('page', 0)
+            spans[i] = (position, position + len(data))
+            position += len(data)
+            chunks.append(data)
+        return cls(boxes, confidences, b''.join(chunks), spans, pages)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_lines([])
+
+    def __len__(self):
+        return len(self.confidences)
+
+    def __getitem__(self, key):
+        """整數返回一行的字典；切片、整數數組或布爾數組返回 OCRResult（切片不複製）"""
+        if isinstance(key, (int, np.integer)):
+            return self.line(key)
+        return OCRResult(self.boxes[key], self.confidences[key], self._text,
+                         self.spans[key], self.pages[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.line(i)
+
+    def text_at(self, index):
+        start, end = self.spans[index]
+        return self._text[start:end].decode('utf-8')
+
+    def line(self, index):
+        """第 index 行，格式與 OCRProcessor.process_with_boxes 的元素相同"""
+        return {
+            'box': self.boxes[index].tolist(),
+            'text': self.text_at(index),
+            'confidence': float(self.confidences[index]),
+            'page': int(self.pages[index])
+        }
+
+    def to_lines(self):
+        return list(self)
+
+    @property
+    def texts(self):
+        return [self.text_at(i) for i in range(len(self))]
+
+    @property
+    def num_pages(self):
+        return int(self.pages.max()) + 1 if len(self) else 0
+
+    @property
+    def nbytes(self):
+        """數組和本結果引用的文字的字節數"""
+        return (self.boxes.nbytes + self.confidences.nbytes + self.pages.nbytes +
+                self.spans.nbytes + int((self.spans[:, 1] - self.spans[:, 0]).sum()))
+
+    def page(self, number):
+        """
+        某一頁的行
+
+        逐頁識別的結果按頁碼排列，返回共享數組的切片；否則按頁碼篩選
+        """
+        if len(self) < 2 or np.all(self.pages[:-1] <= self.pages[1:]):
+            start, end = np.searchsorted(self.pages, [number, number + 1])
+            return self[int(start):int(end)]
+        return self[self.pages == number]
+
+    def region(self, x1, y1, x2, y2, page=None):
+        """
+        文本框中心落在矩形 [x1, x2) × [y1, y2) 內的行
+
+        Args:
+            page: 只在該頁中篩選（可選）
+        """
+        centers = self.boxes.mean(axis=1)
+        mask = ((centers[:, 0] >= x1) & (centers[:, 0] < x2) &
+                (centers[:, 1] >= y1) & (centers[:, 1] < y2))
+        if page is not None:
+            mask &= self.pages == page
+        return self[np.flatnonzero(mask)]
+
+    def _packed_text(self):
+        """返回只包含本結果各行文字的緩衝區和偏移量 (N + 1)"""
+        lengths = self.spans[:, 1] - self.spans[:, 0]
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(self) and self.spans[0, 0] == 0 and offsets[-1] == len(self._text) and \
+                np.array_equal(self.spans[:, 0], offsets[:-1]):
+            return self._text, offsets
+        text = b''.join(self._text[start:end] for start, end in self.spans)
+        return text, offsets
+
+    def to_dict(self):
+        """JSON格式（按列保存）"""
+        return {
+            'texts': self.texts,
+            'confidences': [round(float(c), 4) for c in self.confidences],
+            'boxes': np.round(self.boxes.reshape(-1, 8), 1).tolist(),
+            'pages': self.pages.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        lines = [{'box': np.asarray(box).reshape(4, 2), 'text': text,
+                  'confidence': confidence, 'page': page}
+                 for text, confidence, box, page in zip(
+                     data['texts'], data['confidences'], data['boxes'], data['pages'])]
+        return cls.from_lines(lines)
+
+    def to_wire(self):
+        """
+        緊湊格式：數組打包為小端字節
+
+        Returns:
+            dict: count、boxes（float32 N×8）、confidences（float32）、pages（int32）、
+                  offsets（uint32 N+1，文字的字節偏移）、text（UTF-8 bytes）
+        """
+        text, offsets = self._packed_text()
+        return {
+            'count': len(self),
+            'boxes': self.boxes.astype('<f4').tobytes(),
+            'confidences': self.confidences.astype('<f4').tobytes(),
+            'pages': self.pages.astype('<i4').tobytes(),
+            'offsets': offsets.astype('<u4').tobytes(),
+            'text': text
+        }
+
+    @classmethod
+    def from_wire(cls, data):
+        """由 to_wire 的結果創建（數組直接建立在接收到的字節上，不複製）"""
+        count = data['count']
+        offsets = np.frombuffer(data['offsets'], dtype='<u4').astype(np.int64)
+        return cls(
+            np.frombuffer(data['boxes'], dtype='<f4').reshape(count, 4, 2),
+            np.frombuffer(data['confidences'], dtype='<f4'),
+            bytes(data['text']),
+            np.stack([offsets[:-1], offsets[1:]], axis=1),
+            np.frombuffer(data['pages'], dtype='<i4')
+        )
+
+
+def json_default(value):
+    """json.dumps 的 default：OCRResult 和 numpy 標量"""
+    if isinstance(value, OCRResult):
+        return value.to_dict()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _wire_default(value):
+    if isinstance(value, OCRResult):
+        return value.to_wire()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} cannot be serialized")
+
+
+def dumps(obj, fmt):
+    """
+    以二進制格式序列化（OCRResult 使用緊湊格式）
+
+    Args:
+        obj: 要序列化的對象
+        fmt: 'msgpack' 或 'cbor'
+
+    Returns:
+        bytes
+    """
+    if fmt == 'msgpack':
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError('msgpack 未安裝: pip install msgpack')
+        return msgpack.packb(obj, default=_wire_default, use_bin_type=True)
+    if fmt == 'cbor':
+        if not CBOR_AVAILABLE:
+            raise RuntimeError('cbor2 未安裝: pip install cbor2')
+        return cbor2.dumps(obj, default=lambda encoder, value: encoder.encode(_wire_default(value)))
+    raise ValueError(f"不支持的格式: {fmt}")
@@ -0,0 +1,150 @@
+"""
+頁面方向檢測
+在OCR之前用EXIF和投影輪廓快速判斷整頁方向，只有判斷不確定時才需要逐行角度分類
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+# EXIF Orientation 標籤
+EXIF_ORIENTATION_TAG = 274
+
+# EXIF方向值對應的順時針旋轉角度
+EXIF_ROTATIONS = {3: 180, 6: 90, 8: 270}
+
+_ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def read_exif_orientation(image_path):
+    """
+    讀取圖片的EXIF方向標籤（只解析文件頭，不解碼像素）
+
+    Args:
+        image_path: 圖片路徑或文件對象
+
+    Returns:
+        int: EXIF方向值，沒有時返回None
+    """
+    try:
+        with Image.open(image_path) as img:
+            return img.getexif().get(EXIF_ORIENTATION_TAG)
+    except Exception:
+        return None
+
+
+def rotate(image, rotation):
+    """
+    按順時針角度旋轉圖片
+
+    Args:
+        image: BGR圖片數組
+        rotation: 0、90、180 或 270
+
+    Returns:
+        numpy array: 旋轉後的圖片
+    """
+    if rotation not in _ROTATE_CODES:
+        return image
+    return cv2.rotate(image, _ROTATE_CODES[rotation])
+
+
+def unrotate_points(points, rotation, width, height):
+    """
+    將旋轉後圖片上的座標映射回旋轉前的圖片
+
+    Args:
+        points: [[x, y], ...]
+        rotation: 圖片被順時針旋轉的角度（0、90、180 或 270）
+        width: 旋轉前圖片的寬
+        height: 旋轉前圖片的高
+
+    Returns:
+        list: 旋轉前圖片上的 [[x, y], ...]
+    """
+    if rotation == 90:
+        return [[y, height - x] for x, y in points]
+    if rotation == 180:
+        return [[width - x, height - y] for x, y in points]
+    if rotation == 270:
+        return [[width - y, x] for x, y in points]
+    return [[x, y] for x, y in points]
+
+
+def _is_upside_down(binary, ratio=0.7):
+    """
+    按文字行的對齊判斷橫排文字是否上下顛倒
+
+    文檔的文字行通常左對齊、右邊參差不齊；顛倒後變為右對齊。
+    比較各文字行最左和最右墨跡位置的離散程度
+
+    Returns:
+        bool: 是否顛倒；無法判斷時返回None
+    """
+    rows = binary[binary.sum(axis=1) >= 3]
+    if len(rows) < 10:
+        return None
+    left = rows.argmax(axis=1)
+    right = rows.shape[1] - 1 - rows[:, ::-1].argmax(axis=1)
+    left_spread = float(np.std(left))
+    right_spread = float(np.std(right))
+    if left_spread < right_spread * ratio:
+        return False
+    if right_spread < left_spread * ratio:
+        return True
+    return None
+
+
+def estimate_orientation(image, max_side=512, threshold=2.0):
+    """
+    用投影輪廓估計整頁文字方向
+
+    橫排文字的行投影在文字行和行距之間急劇變化，列投影則因多行疊加而平滑；
+    比較兩個方向投影的變化能量即可判斷文字是橫向還是縱向。
+    再按文字行的對齊方式區分 0° 與 180°（橫向）或 90° 與 270°（縱向），
+    對齊方式無法判斷時交給逐行角度分類。
+
+    Args:
+        image: BGR圖片數組（OpenCV解碼時已按EXIF方向轉正）
+        max_side: 檢測時縮小到的最長邊
+        threshold: 兩個方向能量之比超過此值才視為確定
+
+    Returns:
+        dict: rotation（建議的順時針旋轉角度）、uncertain（是否需要逐行角度分類）、score
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    scale = min(1.0, max_side / float(max(height, width)))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                          interpolation=cv2.INTER_AREA)
+
+    # 文字為1，背景為0
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    density = float(binary.mean())
+    if density < 0.005 or density > 0.5:
+        # 幾乎空白或大面積深色，投影輪廓不可靠
+        return {'rotation': 0, 'uncertain': True, 'score': 0.0}
+
+    row_profile = binary.mean(axis=1)
+    col_profile = binary.mean(axis=0)
+    row_energy = float(np.mean(np.diff(row_profile) ** 2))
+    col_energy = float(np.mean(np.diff(col_profile) ** 2))
+    score = row_energy / max(col_energy, 1e-12)
+
+    if score >= threshold:
+        # 文字行是橫向的：按左對齊判斷是否上下顛倒
+        upside_down = _is_upside_down(binary)
+        if upside_down is None:
+            return {'rotation': 0, 'uncertain': True, 'score': score}
+        return {'rotation': 180 if upside_down else 0, 'uncertain': False, 'score': score}
+    if score <= 1.0 / threshold:
+        # 文字行是縱向的：順時針轉90°後為橫向，再按左對齊判斷是否需要改為轉270°
+        upside_down = _is_upside_down(rotate(binary, 90))
+        if upside_down is None:
+            return {'rotation': 90, 'uncertain': True, 'score': score}
+        return {'rotation': 270 if upside_down else 90, 'uncertain': False, 'score': score}
+    return {'rotation': 0, 'uncertain': True, 'score': score}
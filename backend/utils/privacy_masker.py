@@ -7,27 +7,38 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import os
 
+from .image_io import downscale
+
 
 class PrivacyMasker:
-    def __init__(self):
-        """初始化隱私遮蔽器"""
-        self.output_dir = 'masked_images'
+    def __init__(self, output_dir='masked_images', fast_max_side=1280):
+        """
+        初始化隱私遮蔽器
+        
+        Args:
+            output_dir: 遮蔽後圖片的輸出目錄
+            fast_max_side: 快速遮蔽時輸出圖片的最長邊
+        """
+        self.output_dir = output_dir
+        self.fast_max_side = fast_max_side
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def mask_info(self, image_path, extracted_info):
+    def mask_info(self, image_path, extracted_info, image=None, fast=False):
         """
         遮蔽圖片中的敏感信息
         
         Args:
-            image_path: 原始圖片路徑
+            image_path: 原始圖片路徑（圖片已在內存中時僅用於命名輸出文件）
             extracted_info: 提取的信息字典
+            image: 已解碼的BGR圖片數組（可選，提供時不再讀取磁盤）
+            fast: 快速模式：縮小輸出圖片並使用最低壓縮級別（負載高時用於降級）
             
         Returns:
             str: 遮蔽後的圖片路徑
         """
         try:
             # 讀取圖片
-            img = cv2.imread(image_path)
+            img = image if image is not None else cv2.imread(image_path)
             if img is None:
                 return image_path  # 如果讀取失敗，返回原圖
             
@@ -41,7 +52,10 @@ class PrivacyMasker:
             
             # 這裡應該使用OCR的框位置信息來精確遮蔽
             # 目前使用簡單的矩形遮蔽作為示例
-            masked_img = img.copy()
+            if fast and max(img.shape[:2]) > self.fast_max_side:
+                masked_img = downscale(img, self.fast_max_side)
+            else:
+                masked_img = img.copy()
             
             # 在圖片上添加遮蔽矩形（示例位置，實際應該根據OCR結果定位）
             height, width = masked_img.shape[:2]
@@ -63,7 +77,8 @@ class PrivacyMasker:
             # 保存遮蔽後的圖片
             filename = os.path.basename(image_path)
             output_path = os.path.join(self.output_dir, f"masked_{filename}")
-            cv2.imwrite(output_path, masked_img)
+            params = [cv2.IMWRITE_PNG_COMPRESSION, 1, cv2.IMWRITE_JPEG_QUALITY, 80] if fast else []
+            cv2.imwrite(output_path, masked_img, params)
             
             return output_path
         
@@ -0,0 +1,134 @@
+"""
+圖片質量檢查
+在分類和OCR之前用OpenCV快速檢查模糊、反光、分辨率和文字密度，
+明顯無法識別的圖片直接拒絕並返回原因，臨界的圖片只標記
+"""
+import time
+import cv2
+import numpy as np
+
+from .image_io import downscale
+
+# 原因代碼
+TOO_SMALL = 'too_small'
+BLURRY = 'blurry'
+GLARE = 'glare'
+BLANK = 'blank'
+
+# 視為過曝的灰度
+_CLIPPED = 250
+
+
+class QualityError(Exception):
+    """圖片未通過質量檢查"""
+
+    def __init__(self, report):
+        super().__init__(f"圖片質量不合格: {', '.join(report['reasons'])}")
+        self.report = report
+
+
+class QualityGate:
+    def __init__(self, min_side=480, blur_threshold=60.0, glare_ratio=0.08,
+                 min_text_density=0.01, analysis_side=1024, glare_margin=12, glare_min_blob=0.0005):
+        """
+        初始化質量檢查
+
+        Args:
+            min_side: 短邊最少像素數
+            blur_threshold: 拉普拉斯方差下限（在 analysis_side 尺寸上計算）
+            glare_ratio: 反光斑塊面積佔比上限
+            min_text_density: 邊緣像素比例下限（近似文字密度）
+            analysis_side: 檢查前將圖片縮小到的最長邊（保持檢查耗時在毫秒級）
+            glare_margin: 紙張背景至少比飽和值暗多少灰度，過曝斑塊才算反光
+            glare_min_blob: 單個反光斑塊的最小面積佔比（忽略零星的亮點）
+        """
+        self.min_side = min_side
+        self.blur_threshold = blur_threshold
+        self.glare_ratio = glare_ratio
+        self.min_text_density = min_text_density
+        self.analysis_side = analysis_side
+        self.glare_margin = glare_margin
+        self.glare_min_blob = glare_min_blob
+
+    def _glare(self, gray):
+        """
+        反光斑塊的面積佔比
+
+        反光是紙面上局部的過曝斑塊，亮度明顯高於紙張背景。白紙掃描件的背景本身接近飽和，
+        按全頁亮像素比例會被誤判，所以只在背景明顯低於飽和值時，把成片的飽和像素計為反光
+
+        Returns:
+            tuple: (反光面積佔比, 紙張背景灰度)
+        """
+        # 紙張背景：比中位數亮的一半像素的中位數（排除文字和深色背景）
+        background = float(np.percentile(gray, 75))
+        if background > _CLIPPED - self.glare_margin:
+            return 0.0, background
+
+        clipped = (gray >= _CLIPPED).astype(np.uint8)
+        clipped = cv2.morphologyEx(clipped, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(clipped, connectivity=8)
+        areas = stats[1:count, cv2.CC_STAT_AREA]
+        blobs = areas[areas >= self.glare_min_blob * gray.size]
+        return float(blobs.sum()) / gray.size, background
+
+    def check(self, image, original_size=None):
+        """
+        檢查圖片質量
+
+        每項指標超過閾值時拒絕；接近閾值（2倍範圍內）時只標記
+
+        Args:
+            image: BGR圖片數組
+            original_size: 原圖 (寬, 高)（可選；image 是縮小解碼的結果時按原圖檢查分辨率）
+
+        Returns:
+            dict: passed、reasons（拒絕原因）、flags（標記）、metrics 和 elapsed_ms
+        """
+        start = time.perf_counter()
+        height, width = image.shape[:2]
+        if original_size:
+            width, height = original_size
+        reasons = []
+        flags = []
+
+        if min(height, width) < self.min_side:
+            reasons.append(TOO_SMALL)
+
+        gray = cv2.cvtColor(downscale(image, self.analysis_side), cv2.COLOR_BGR2GRAY)
+
+        # 模糊：拉普拉斯響應的方差，失焦或抖動的圖片邊緣弱，方差小
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        if sharpness < self.blur_threshold:
+            reasons.append(BLURRY)
+        elif sharpness < self.blur_threshold * 2:
+            flags.append(BLURRY)
+
+        # 反光：比紙張背景明顯更亮的過曝斑塊
+        clipped, background = self._glare(gray)
+        if clipped > self.glare_ratio:
+            reasons.append(GLARE)
+        elif clipped > self.glare_ratio / 2:
+            flags.append(GLARE)
+
+        # 文字密度：邊緣像素比例，空白頁或純色圖片幾乎沒有邊緣
+        density = float(np.count_nonzero(cv2.Canny(gray, 50, 150))) / gray.size
+        if density < self.min_text_density:
+            reasons.append(BLANK)
+        elif density < self.min_text_density * 2:
+            flags.append(BLANK)
+
+        return {
+            'passed': not reasons,
+            'reasons': reasons,
+            'flags': flags,
+            'metrics': {
+                'width': width,
+                'height': height,
+                'sharpness': sharpness,
+                'glare_ratio': clipped,
+                'background': background,
+                'text_density': density
+            },
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        }
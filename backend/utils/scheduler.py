@@ -0,0 +1,167 @@
+"""
+優先級調度
+在識別管線前排隊：交互請求優先於批量請求，同一優先級內按租戶輪流分配（公平隊列），
+並限制每個租戶的並發數，為交互請求保留一部分處理能力，避免大批量重新處理拖慢在線用戶。
+"""
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from .admission import Overloaded
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class _Ticket:
+    def __init__(self, tenant, priority):
+        self.tenant = tenant
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.granted = threading.Event()
+
+
+class Scheduler:
+    def __init__(self, capacity=4, reserved_interactive=1, tenant_limit=None, tenant_limits=None,
+                 max_queue=100, timeout=30.0, metrics=None):
+        """
+        初始化調度器
+
+        Args:
+            capacity: 同時運行的管線數
+            reserved_interactive: 為交互請求保留的數量（批量請求最多使用 capacity - reserved_interactive）
+            tenant_limit: 每個租戶的默認並發上限（None 表示不限制）
+            tenant_limits: 個別租戶的並發上限 {租戶: 上限}
+            max_queue: 每個優先級的最大排隊數，超過時拒絕
+            timeout: 最長排隊秒數，超過時拒絕
+            metrics: Metrics 實例（可選），記錄各優先級的排隊時間和隊列長度
+        """
+        self.capacity = capacity
+        self.reserved_interactive = min(reserved_interactive, capacity - 1)
+        self.tenant_limit = tenant_limit
+        self.tenant_limits = tenant_limits or {}
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.metrics = metrics
+
+        # 每個優先級：租戶 → 排隊的請求；租戶的順序即輪流分配的順序
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._tenant_running = {}
+        self._lock = threading.Lock()
+
+    def _limit_for(self, tenant):
+        return self.tenant_limits.get(tenant, self.tenant_limit)
+
+    def _can_run(self, tenant, priority):
+        """在不考慮排隊順序的情況下，此租戶和優先級現在能否運行"""
+        if sum(self._running.values()) >= self.capacity:
+            return False
+        if priority == BULK and self._running[BULK] >= self.capacity - self.reserved_interactive:
+            return False
+        limit = self._limit_for(tenant)
+        return limit is None or self._tenant_running.get(tenant, 0) < limit
+
+    def _start(self, tenant, priority):
+        self._running[priority] += 1
+        self._tenant_running[tenant] = self._tenant_running.get(tenant, 0) + 1
+
+    def _dispatch(self):
+        """按優先級、租戶輪流的順序分配空閒的處理能力（調用時持有鎖）"""
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            progress = True
+            while progress and queues:
+                progress = False
+                for tenant in list(queues):
+                    if not self._can_run(tenant, priority):
+                        continue
+                    ticket = queues[tenant].popleft()
+                    if queues[tenant]:
+                        # 移到隊尾，下一個名額輪到其他租戶
+                        queues.move_to_end(tenant)
+                    else:
+                        del queues[tenant]
+                    self._queued[priority] -= 1
+                    self._start(tenant, priority)
+                    ticket.granted.set()
+                    progress = True
+                    break
+        self._export()
+
+    def _export(self):
+        if self.metrics is None:
+            return
+        for priority in PRIORITIES:
+            self.metrics.set('scheduler_queued', self._queued[priority], priority=priority)
+            self.metrics.set('scheduler_running', self._running[priority], priority=priority)
+
+    def acquire(self, tenant='default', priority=INTERACTIVE):
+        """
+        排隊等待一個處理名額
+
+        Returns:
+            float: 排隊等待的秒數
+
+        Raises:
+            ValueError: 未知的優先級
+            Overloaded: 隊列已滿或排隊超時
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的優先級: {priority}")
+
+        ticket = _Ticket(tenant, priority)
+        with self._lock:
+            if self._queued[priority] >= self.max_queue:
+                raise Overloaded(max(int(self.timeout), 1))
+            # 先入隊再分配，有空閒名額時按公平順序立即獲得
+            self._queues[priority].setdefault(tenant, deque()).append(ticket)
+            self._queued[priority] += 1
+            self._dispatch()
+
+        if not ticket.granted.wait(self.timeout):
+            with self._lock:
+                queue = self._queues[priority].get(tenant)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[priority][tenant]
+                    self._queued[priority] -= 1
+                    self._export()
+                    if self.metrics is not None:
+                        self.metrics.inc('scheduler_timeouts_total', priority=priority)
+                    raise Overloaded(max(int(self.timeout), 1))
+            # 超時的同時已獲得名額，繼續處理
+        return self._record_wait(ticket)
+
+    def _record_wait(self, ticket):
+        wait = time.perf_counter() - ticket.enqueued
+        if self.metrics is not None:
+            self.metrics.observe('scheduler_wait_seconds', wait, priority=ticket.priority)
+        return wait
+
+    def release(self, tenant='default', priority=INTERACTIVE):
+        """釋放名額並分配給下一個排隊的請求"""
+        with self._lock:
+            self._running[priority] -= 1
+            self._tenant_running[tenant] -= 1
+            if not self._tenant_running[tenant]:
+                del self._tenant_running[tenant]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant='default', priority=INTERACTIVE):
+        """
+        在 with 塊中佔用一個處理名額
+
+        Yields:
+            float: 排隊等待的秒數
+        """
+        wait = self.acquire(tenant, priority)
+        try:
+            yield wait
+        finally:
+            self.release(tenant, priority)
@@ -0,0 +1,318 @@
+"""
+文本分類器
+根據OCR文字判斷文檔類型的輕量線性模型（關鍵詞/n-gram 哈希特徵 + softmax）
+
+OCR文字通常已能直接確定類型（身份證號碼格式、"Bank Statement"、中華電力/水務署抬頭、租約等），
+先用文本分類，只有文本置信度不足時才運行CNN。
+
+沒有訓練好的權重時，使用內置關鍵詞作為先驗權重；可用人工標註的圖片訓練（先對每張圖片做OCR）:
+    python -m utils.text_classifier train ../data/raw          # 按類別目錄 <目錄>/<類別>/* 標註
+    python -m utils.text_classifier train ../data/synthetic    # 按目錄中 labels.jsonl 的 file、document_type 標註
+與 model_training/evaluate.py 使用相同的哈希劃分，測試集中的圖片不參與訓練（留給 evaluate.py --text-first）。
+不要使用批量處理的輸出（results/*.jsonl）訓練：其中的 document_type 是CNN的預測，
+用它訓練只會讓文本分類器模仿CNN，失去作為後備的意義。
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+import numpy as np
+
+from .model_registry import file_checksum
+
+CLASS_LABELS = [
+    'identity_card',
+    'utility_bill',
+    'bank_statement',
+    'address_proof',
+    'lease_agreement',
+    'other'
+]
+
+# 先驗關鍵詞（每命中一個關鍵詞，對應類別得分增加 KEYWORD_WEIGHT）
+KEYWORDS = {
+    'identity_card': [
+        'identity card', '香港永久性居民身份證', '身份證',
+        'date of issue', '簽發日期', 'permanent identity card', '出生日期'
+    ],
+    'utility_bill': [
+        'clp', 'clp power', '中華電力', 'hk electric', '港燈', 'water supplies department',
+        '水務署', 'towngas', '煤氣', 'kwh', '用電量', '電費', '水費', 'bill period', '賬單日期'
+    ],
+    'bank_statement': [
+        'bank statement', 'statement of account', '結單', '銀行', 'hsbc', '滙豐', 'hang seng',
+        '恒生', 'balance', '結餘', 'deposit', 'withdrawal', '存款', '提款'
+    ],
+    'address_proof': [
+        'proof of address', 'address proof', '地址證明', 'to whom it may concern', '茲證明',
+        'residential address', '住址證明'
+    ],
+    'lease_agreement': [
+        'tenancy agreement', 'lease agreement', '租約', '租賃協議', 'landlord', 'tenant',
+        '業主', '租客', 'monthly rent', '月租', '租期'
+    ],
+    'other': []
+}
+
+KEYWORD_WEIGHT = 3.0
+
+# 香港身份證號碼格式，例如 A123456(7)
+HKID_PATTERN = re.compile(r'\b[A-Z]{1,2}\d{6}\s?\(?[0-9A]\)?')
+
+_LATIN_WORD = re.compile(r'[a-z]{2,}')
+_STOPWORDS = {'of', 'the', 'to', 'and', 'in', 'on', 'for', 'it', 'may', 'is', 'at', 'by'}
+_CJK_RUN = re.compile(r'[一-鿿]+')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# 訓練/驗證/測試劃分規則在 model_training/dataset_shards.py 中
+MODEL_TRAINING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model_training')
+
+
+def tokenize(text):
+    """
+    提取特徵：英文單詞、英文詞二元組、中文字二元組，以及身份證號碼格式標記
+
+    Returns:
+        list: 特徵字符串
+    """
+    features = []
+    if HKID_PATTERN.search(text):
+        features.append('__hkid__')
+
+    words = [w for w in _LATIN_WORD.findall(text.lower()) if w not in _STOPWORDS]
+    features.extend(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            features.append(run)
+        features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+class TextClassifier:
+    def __init__(self, model_path='models/text_classifier.npz', dim=2 ** 16):
+        """
+        初始化文本分類器
+
+        Args:
+            model_path: 訓練好的權重文件（不存在時使用關鍵詞先驗）
+            dim: 特徵哈希空間大小
+        """
+        self.model_path = model_path
+        self.class_labels = list(CLASS_LABELS)
+        self.dim = dim
+
+        if os.path.exists(model_path):
+            data = np.load(model_path)
+            self.weights = data['weights']
+            self.bias = data['bias']
+            self.dim = self.weights.shape[0]
+            self.version = f"text:{file_checksum(model_path)[:12]}"
+            print(f"文本分類模型已加載: {model_path}")
+        else:
+            self.weights, self.bias = self._keyword_prior()
+            self.version = 'text:keywords'
+
+    def _index(self, feature):
+        return zlib.crc32(feature.encode('utf-8')) % self.dim
+
+    def _features(self, text):
+        """將文本轉為 (特徵序號, 計數)"""
+        indices = [self._index(f) for f in tokenize(text or '')]
+        if not indices:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indices, counts = np.unique(indices, return_counts=True)
+        # 次線性計數，避免長文本中重複出現的詞主導得分
+        return indices, (1.0 + np.log(counts)).astype(np.float32)
+
+    def _keyword_prior(self):
+        """由關鍵詞構建初始權重：關鍵詞的每個特徵平分該關鍵詞的權重"""
+        weights = np.zeros((self.dim, len(self.class_labels)), dtype=np.float32)
+        bias = np.zeros(len(self.class_labels), dtype=np.float32)
+        for label, keywords in KEYWORDS.items():
+            column = self.class_labels.index(label)
+            for keyword in keywords:
+                features = tokenize(keyword)
+                for feature in features:
+                    weights[self._index(feature), column] += KEYWORD_WEIGHT / len(features)
+        weights[self._index('__hkid__'), self.class_labels.index('identity_card')] += KEYWORD_WEIGHT
+        # 沒有任何關鍵詞時偏向"其他"，但不足以超過置信度閾值
+        bias[self.class_labels.index('other')] = 0.5
+        return weights, bias
+
+    def predict_proba(self, text):
+        """
+        返回各類別的概率
+
+        Args:
+            text: OCR文字
+
+        Returns:
+            numpy array: 與 class_labels 對應的概率
+        """
+        indices, counts = self._features(text)
+        scores = self.bias + counts @ self.weights[indices]
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    def classify(self, text):
+        """
+        根據OCR文字分類
+
+        Returns:
+            tuple: (文檔類型, 置信度)
+        """
+        probabilities = self.predict_proba(text)
+        index = int(np.argmax(probabilities))
+        return self.class_labels[index], float(probabilities[index])
+
+    def fit(self, texts, labels, epochs=10, learning_rate=0.1, l2=1e-4, seed=0):
+        """
+        在關鍵詞先驗的基礎上，用帶標註的OCR文本訓練（逐樣本SGD的多類邏輯回歸）
+
+        Args:
+            texts: OCR文字列表
+            labels: 文檔類型列表
+            epochs: 訓練輪數
+            learning_rate: 學習率
+            l2: L2正則化係數
+            seed: 隨機種子
+        """
+        samples = [(self._features(text), self.class_labels.index(label))
+                   for text, label in zip(texts, labels)]
+        rng = np.random.default_rng(seed)
+
+        for epoch in range(epochs):
+            correct = 0
+            for i in rng.permutation(len(samples)):
+                (indices, counts), target = samples[i]
+                scores = self.bias + counts @ self.weights[indices]
+                probabilities = np.exp(scores - scores.max())
+                probabilities /= probabilities.sum()
+                correct += int(np.argmax(probabilities)) == target
+
+                gradient = probabilities
+                gradient[target] -= 1.0
+                self.weights[indices] -= learning_rate * (
+                    np.outer(counts, gradient) + l2 * self.weights[indices])
+                self.bias -= learning_rate * gradient
+            print(f"Epoch {epoch + 1}/{epochs}: 訓練準確率 {correct / max(len(samples), 1):.4f}")
+
+    def save(self, model_path=None):
+        """保存權重"""
+        model_path = model_path or self.model_path
+        directory = os.path.dirname(model_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(model_path, weights=self.weights, bias=self.bias)
+        self.version = f"text:{file_checksum(model_path)[:12]}"
+        print(f"文本分類模型已保存到 {model_path}")
+
+
+def classify_text_first(ocr_text, source, text_classifier, document_classifier, threshold=0.85):
+    """
+    先按OCR文字分類，文本置信度低於閾值時才運行CNN
+
+    Args:
+        ocr_text: OCR文字
+        source: 圖片路徑或BGR數組（CNN使用）
+        text_classifier: TextClassifier
+        document_classifier: DocumentClassifier
+        threshold: 文本置信度閾值
+
+    Returns:
+        tuple: (文檔類型, 置信度, 模型版本, 分類方式 'text' 或 'cnn')
+    """
+    doc_type, confidence = text_classifier.classify(ocr_text)
+    if confidence >= threshold:
+        return doc_type, confidence, text_classifier.version, 'text'
+    doc_type, confidence, version = document_classifier.classify(source, with_version=True)
+    return doc_type, confidence, version, 'cnn'
+
+
+def load_labelled_images(data_dir):
+    """
+    讀取人工標註的圖片：目錄中有 labels.jsonl 時按其中的 file 和 document_type，
+    否則按類別子目錄 data_dir/<類別>/*；跳過劃分到測試集的圖片
+
+    Returns:
+        list: [(圖片路徑, 文檔類型), ...]
+    """
+    sys.path.insert(0, MODEL_TRAINING_DIR)
+    from dataset_shards import SPLITS, split_for
+
+    test = SPLITS.index('test')
+    samples = []
+    labels_path = os.path.join(data_dir, 'labels.jsonl')
+    if os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('document_type') in CLASS_LABELS and split_for(record['file']) != test:
+                    samples.append((os.path.join(data_dir, record['file']), record['document_type']))
+        return samples
+
+    for label in CLASS_LABELS:
+        class_dir = os.path.join(data_dir, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if (filename.lower().endswith(IMAGE_EXTENSIONS)
+                    and split_for(f"{label}/{filename}") != test):
+                samples.append((os.path.join(class_dir, filename), label))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='訓練文本分類器')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('train')
+    p.add_argument('data', help='標註圖片目錄：包含 labels.jsonl，或按類別分子目錄')
+    p.add_argument('--model', default='models/text_classifier.npz')
+    p.add_argument('--epochs', type=int, default=10)
+
+    p = sub.add_parser('predict')
+    p.add_argument('text')
+    p.add_argument('--model', default='models/text_classifier.npz')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        from .ocr_processor import OCRProcessor
+
+        samples = load_labelled_images(args.data)
+        if not samples:
+            print(f"錯誤: {args.data} 中沒有標註的圖片")
+            return 1
+        ocr_processor = OCRProcessor()
+        if ocr_processor.ocr is None:
+            print("錯誤: PaddleOCR 不可用，無法提取訓練文本")
+            return 1
+
+        texts, labels = [], []
+        for i, (path, label) in enumerate(samples, start=1):
+            texts.append(ocr_processor.process(path))
+            labels.append(label)
+            if i % 100 == 0:
+                print(f"  已識別 {i}/{len(samples)}")
+        print(f"訓練樣本數: {len(texts)}")
+        # 從關鍵詞先驗開始訓練，不加載已有權重
+        classifier = TextClassifier(model_path='')
+        classifier.model_path = args.model
+        classifier.fit(texts, labels, epochs=args.epochs)
+        classifier.save()
+    elif args.command == 'predict':
+        classifier = TextClassifier(args.model)
+        doc_type, confidence = classifier.classify(args.text)
+        print(f"{doc_type} ({confidence:.3f})")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
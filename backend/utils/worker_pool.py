@@ -0,0 +1,391 @@
+"""
+工作進程池
+在獨立進程中運行模型（TensorFlow、PaddleOCR），並監控每個進程的常駐內存（RSS）。
+長時間運行的進程內存會持續增長（predict 重新追蹤計算圖、不同尺寸圖片造成的內存碎片），
+處理的請求數達到上限或內存超過閾值時回收該進程：
+
+1. 為同一槽位啟動替換進程並預熱（加載模型、運行一次識別）
+2. 替換進程就緒後開始接收新請求，舊進程不再分配請求
+3. 舊進程處理完已分配的請求後退出，不丟棄任何請求
+
+進程意外退出時，其未完成的請求重新分配給其他進程；同一請求導致進程退出達到 max_attempts 次後
+不再重試，直接失敗（例如使 OCR 崩潰的圖片），避免輪流拖垮每個替換進程。
+數組參數（例如圖片）通過共享內存傳遞，隊列只傳遞描述符（見 shm_transport.py）。
+"""
+import os
+import sys
+import queue
+import itertools
+import threading
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+from .shm_transport import SharedMemoryTransport
+
+
+def current_rss_mb():
+    """當前進程的常駐內存（MB）"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # 沒有 /proc 時只能取峰值；Linux 單位為KB，macOS 為字節
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def _worker_main(worker_id, factory, inbox, outbox):
+    """工作進程：創建處理函數並預熱，然後逐個處理任務，收到 None 後退出"""
+    transport = SharedMemoryTransport()
+    try:
+        handler = factory()
+        warm_up = getattr(handler, 'warm_up', None)
+        if warm_up is not None:
+            warm_up()
+    except Exception as e:
+        outbox.put(('failed', worker_id, None, f"{type(e).__name__}: {e}", current_rss_mb()))
+        return
+    outbox.put(('ready', worker_id, None, None, current_rss_mb()))
+
+    while True:
+        task = inbox.get()
+        if task is None:
+            break
+        task_id, payload, shared = task
+        for key, descriptor in shared.items():
+            payload[key] = transport.get(descriptor)
+        try:
+            outcome = ('ok', handler(payload))
+        except Exception as e:
+            outcome = ('error', f"{type(e).__name__}: {e}")
+        payload = None
+        for descriptor in shared.values():
+            transport.detach(descriptor)
+        outbox.put(('done', worker_id, task_id, outcome, current_rss_mb()))
+
+    transport.close()
+    outbox.put(('exit', worker_id, None, None, current_rss_mb()))
+
+
+class _Worker:
+    def __init__(self, worker_id, slot, process, inbox, replaces=None):
+        self.worker_id = worker_id
+        self.slot = slot
+        self.process = process
+        self.inbox = inbox
+        self.replaces = replaces
+        self.replacement = None
+        self.recycle_reason = None
+        self.state = 'starting'
+        self.handled = 0
+        self.rss_mb = 0.0
+        self.outstanding = {}
+
+
+class WorkerPool:
+    def __init__(self, factory, size=2, max_requests=500, max_rss_mb=0, prefetch=2,
+                 start_timeout=600, max_attempts=2, metrics=None):
+        """
+        初始化工作進程池
+
+        Args:
+            factory: 在工作進程中創建處理函數的可調用對象（需可pickle，例如類或 functools.partial）；
+                     處理函數有 warm_up 方法時在就緒前調用
+            size: 進程數
+            max_requests: 每個進程處理多少個請求後回收（0 表示不限制）
+            max_rss_mb: 進程內存超過此值（MB）時回收（0 表示不限制）
+            prefetch: 每個進程最多分配的未完成任務數，其餘任務在池中等待
+                      （回收或崩潰時只影響少量已分配的任務，新進程就緒後立即分擔）
+            start_timeout: 等待初始進程就緒的秒數
+            max_attempts: 每個任務最多分配的次數（處理中進程意外退出算一次）
+            metrics: Metrics 實例（可選），導出各槽位的內存、請求數和回收次數
+        """
+        self.factory = factory
+        self.size = size
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.prefetch = max(prefetch, 1)
+        self.start_timeout = start_timeout
+        self.max_attempts = max(max_attempts, 1)
+        self.metrics = metrics
+
+        # TensorFlow 和 PaddleOCR 都不適合在 fork 出的子進程中使用
+        self._ctx = mp.get_context('spawn')
+        self._outbox = self._ctx.Queue()
+        self._transport = SharedMemoryTransport()
+        self._workers = {}
+        self._backlog = deque()
+        self._worker_ids = itertools.count()
+        self._task_ids = itertools.count()
+        # 已移除、等待 join 的進程（在鎖外 join，不阻塞 submit）
+        self._exited = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._errors = []
+        self._closed = False
+        self._collector = None
+
+    def start(self):
+        """
+        啟動全部進程並等待預熱完成
+
+        Raises:
+            RuntimeError: 進程初始化失敗或超時
+        """
+        with self._lock:
+            for slot in range(self.size):
+                self._spawn(slot)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+        with self._changed:
+            ready = self._changed.wait_for(
+                lambda: self._errors or all(w.state == 'active' for w in self._workers.values()),
+                timeout=self.start_timeout)
+            error = self._errors[0] if self._errors else (None if ready else 'timeout')
+        if error is not None:
+            self.shutdown()
+            raise RuntimeError(f"工作進程啟動失敗: {error}")
+        print(f"工作進程池已就緒: {self.size} 個進程")
+
+    def _spawn(self, slot, replaces=None):
+        """啟動一個工作進程（調用時持有鎖）"""
+        worker_id = next(self._worker_ids)
+        inbox = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.factory, inbox, self._outbox),
+            daemon=True
+        )
+        worker = _Worker(worker_id, slot, process, inbox, replaces)
+        self._workers[worker_id] = worker
+        process.start()
+        return worker
+
+    def submit(self, payload):
+        """
+        提交任務
+
+        Args:
+            payload: dict，頂層的 numpy 數組通過共享內存傳遞
+
+        Returns:
+            concurrent.futures.Future: 處理函數的返回值；處理函數拋出異常時為 RuntimeError。
+                                       分配給進程之前可以 cancel（例如等待超時），之後不再處理
+        """
+        future = Future()
+        payload = dict(payload)
+        shared = {}
+        for key, value in payload.items():
+            if isinstance(value, np.ndarray):
+                shared[key] = self._transport.put(value)
+                payload[key] = shared[key]
+
+        with self._lock:
+            if self._closed:
+                for descriptor in shared.values():
+                    self._transport.release(descriptor)
+                raise RuntimeError('工作進程池已關閉')
+            self._backlog.append([next(self._task_ids), payload, shared, future, 0])
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """將等待中的任務分配給未完成任務最少的可用進程（調用時持有鎖）"""
+        while self._backlog:
+            available = [w for w in self._workers.values()
+                         if w.state == 'active' and len(w.outstanding) < self.prefetch]
+            if not available:
+                break
+            task = self._backlog.popleft()
+            future = task[3]
+            # 重新分配的任務已在運行狀態；新任務在提交者取消（等待超時）後不再處理
+            if not future.running() and not future.set_running_or_notify_cancel():
+                self._release(task)
+                continue
+            task[4] += 1
+            worker = min(available, key=lambda w: len(w.outstanding))
+            worker.outstanding[task[0]] = task
+            worker.inbox.put(tuple(task[:3]))
+
+    def _release(self, task):
+        """釋放任務的共享內存"""
+        for descriptor in task[2].values():
+            self._transport.release(descriptor)
+
+    def _collect(self):
+        """接收工作進程的消息，並檢查進程是否意外退出"""
+        while True:
+            try:
+                message = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                message = None
+            with self._changed:
+                if message is not None:
+                    self._handle(*message)
+                # 隊列中還有消息時先處理，避免把正常退出前的結果當作進程崩潰
+                if self._outbox.empty():
+                    self._check_alive()
+                self._dispatch()
+                self._changed.notify_all()
+                exited, self._exited = self._exited, []
+                finished = self._closed and not self._workers
+            for process in exited:
+                process.join(timeout=5)
+            if finished:
+                break
+
+    def _handle(self, kind, worker_id, task_id, outcome, rss_mb):
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            return
+        worker.rss_mb = rss_mb
+        self._export(worker)
+
+        if kind == 'ready':
+            if worker.state == 'starting':
+                worker.state = 'active'
+            old = self._workers.get(worker.replaces) if worker.replaces is not None else None
+            if old is not None:
+                self._drain(old)
+        elif kind == 'failed':
+            print(f"工作進程 {worker_id} 初始化失敗: {outcome}")
+            self._remove(worker)
+            old = self._workers.get(worker.replaces) if worker.replaces is not None else None
+            if old is not None:
+                # 替換失敗時舊進程繼續服務，下一次達到回收條件時再嘗試
+                old.replacement = None
+            else:
+                self._errors.append(outcome)
+        elif kind == 'done':
+            worker.handled += 1
+            task = worker.outstanding.pop(task_id, None)
+            if task is not None:
+                self._release(task)
+                future = task[3]
+                status, value = outcome
+                if status == 'ok':
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+            reason = self._recycle_reason(worker)
+            if reason is not None and not self._closed:
+                worker.recycle_reason = reason
+                worker.replacement = self._spawn(worker.slot, replaces=worker.worker_id).worker_id
+        elif kind == 'exit':
+            self._remove(worker)
+
+    def _recycle_reason(self, worker):
+        if worker.state != 'active' or worker.replacement is not None:
+            return None
+        if self.max_requests and worker.handled >= self.max_requests:
+            return 'requests'
+        if self.max_rss_mb and worker.rss_mb > self.max_rss_mb:
+            return 'memory'
+        return None
+
+    def _drain(self, worker):
+        """停止向舊進程分配請求；已分配的請求處理完後進程退出"""
+        worker.state = 'draining'
+        worker.inbox.put(None)
+        if worker.recycle_reason is not None:
+            print(f"回收工作進程 {worker.worker_id}（槽位 {worker.slot}，原因 {worker.recycle_reason}，"
+                  f"已處理 {worker.handled} 個請求，內存 {worker.rss_mb:.0f} MB）")
+            if self.metrics is not None:
+                self.metrics.inc('worker_recycles_total', reason=worker.recycle_reason)
+
+    def _remove(self, worker):
+        """移除進程（調用時持有鎖；join 在 _collect 中釋放鎖後進行）"""
+        self._workers.pop(worker.worker_id, None)
+        self._exited.append(worker.process)
+
+    def _check_alive(self):
+        """進程意外退出時重新分配其未完成的請求，並為該槽位啟動新進程"""
+        for worker in list(self._workers.values()):
+            if worker.process.is_alive():
+                continue
+            self._remove(worker)
+            if worker.state == 'draining' and not worker.outstanding:
+                continue
+
+            print(f"工作進程 {worker.worker_id} 意外退出（退出碼 {worker.process.exitcode}）")
+            for task_id in sorted(worker.outstanding, reverse=True):
+                task = worker.outstanding[task_id]
+                if task[4] >= self.max_attempts:
+                    # 同一任務多次使進程退出，很可能是輸入本身導致崩潰
+                    self._release(task)
+                    task[3].set_exception(RuntimeError(
+                        f"任務處理中工作進程退出 {task[4]} 次（退出碼 {worker.process.exitcode}）"))
+                    if self.metrics is not None:
+                        self.metrics.inc('worker_poison_tasks_total')
+                    continue
+                self._backlog.appendleft(task)
+            old = self._workers.get(worker.replaces) if worker.replaces is not None else None
+
+            if worker.state == 'starting':
+                # 初始化時退出：替換進程失敗時舊進程繼續服務；否則不再重試，避免反復重啟
+                if old is not None:
+                    old.replacement = None
+                else:
+                    self._errors.append(f"exit code {worker.process.exitcode}")
+                continue
+
+            if self.metrics is not None:
+                self.metrics.inc('worker_recycles_total', reason='crash')
+            replacement = self._workers.get(worker.replacement)
+            if replacement is not None:
+                # 替換進程已在啟動，就緒後直接接替
+                replacement.replaces = None
+            elif not self._closed:
+                self._spawn(worker.slot)
+
+        if self._backlog and (self._closed or not self._workers):
+            for task in self._backlog:
+                self._release(task)
+                if not task[3].cancelled():
+                    task[3].set_exception(RuntimeError('沒有可用的工作進程'))
+            self._backlog.clear()
+
+    def _export(self, worker):
+        if self.metrics is None:
+            return
+        self.metrics.set('worker_rss_mb', round(worker.rss_mb, 1), slot=worker.slot)
+        self.metrics.set('worker_handled', worker.handled, slot=worker.slot)
+
+    def stats(self):
+        """
+        各工作進程的狀態
+
+        Returns:
+            list: 每個進程的 slot、pid、state、handled、rss_mb、outstanding
+        """
+        with self._lock:
+            return [{
+                'slot': w.slot,
+                'pid': w.process.pid,
+                'state': w.state,
+                'handled': w.handled,
+                'rss_mb': round(w.rss_mb, 1),
+                'outstanding': len(w.outstanding)
+            } for w in sorted(self._workers.values(), key=lambda w: (w.slot, w.worker_id))]
+
+    def shutdown(self, timeout=30):
+        """處理完已分配的請求後關閉全部進程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for worker in self._workers.values():
+                if worker.state != 'draining':
+                    worker.state = 'draining'
+                    worker.inbox.put(None)
+        if self._collector is not None:
+            self._collector.join(timeout)
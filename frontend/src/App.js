@@ -42,43 +42,26 @@ function App() {
     setProgress(0);
 
     try {
-      // 1. 上傳文件
+      // 上傳並識別文檔（單次請求）
       setProgress(10);
       const formData = new FormData();
       formData.append('file', file);
 
-      const uploadResponse = await fetch(`${API_BASE_URL}/api/upload`, {
-        method: 'POST',
-        body: formData,
-      });
-
-      if (!uploadResponse.ok) {
-        const errorData = await uploadResponse.json().catch(() => ({}));
-        throw new Error(errorData.message || '文件上傳失敗');
-      }
-
-      const uploadData = await uploadResponse.json();
-      const fileId = uploadData.file_id;
       setProgress(30);
-
-      // 2. 識別文檔
-      setProgress(50);
-      const recognizeResponse = await fetch(`${API_BASE_URL}/api/recognize`, {
+      const recognizeResponse = await fetch(`${API_BASE_URL}/api/upload_and_recognize`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ file_id: fileId }),
+        body: formData,
       });
 
       if (!recognizeResponse.ok) {
         const errorData = await recognizeResponse.json().catch(() => ({}));
-        throw new Error(errorData.message || '文檔識別失敗');
+        throw new Error(errorData.message || errorData.error || '文檔識別失敗');
       }
 
       setProgress(80);
       const recognizeData = await recognizeResponse.json();
       const resultData = recognizeData.data;
+      const fileId = resultData.file_id;
       
       // 添加時間戳
       resultData.timestamp = new Date().toISOString();
@@ -242,11 +225,18 @@ function App() {
                 隱私保護版本
               </h2>
               <div className="flex justify-center">
-                <img
-                  src={`${API_BASE_URL}/api/images/${result.masked_image.split('/').pop()}`}
-                  alt="遮蔽後的文檔"
-                  className="max-w-full h-auto rounded-lg shadow-md"
-                />
+                {/* 顯示緩存的預覽圖，點擊查看原尺寸 */}
+                <a
+                  href={`${API_BASE_URL}/api/masked/${result.masked_image.split('/').pop()}`}
+                  target="_blank"
+                  rel="noopener noreferrer"
+                >
+                  <img
+                    src={`${API_BASE_URL}/api/masked/${result.masked_image.split('/').pop()}?size=preview`}
+                    alt="遮蔽後的文檔"
+                    className="max-w-full h-auto rounded-lg shadow-md"
+                  />
+                </a>
               </div>
             </div>
           )}
@@ -1,5 +1,7 @@
 import React from 'react';
 
+const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+
 const HistoryPanel = ({ history, onLoad, onClose, onClear }) => {
   const documentTypeNames = {
     identity_card: '身份證',
@@ -65,6 +67,14 @@ const HistoryPanel = ({ history, onLoad, onClose, onClear }) => {
                   onClick={() => onLoad(item)}
                 >
                   <div className="flex items-start justify-between">
+                    {item.masked_image && (
+                      <img
+                        src={`${API_BASE_URL}/api/masked/${item.masked_image.split('/').pop()}?size=thumb`}
+                        alt=""
+                        loading="lazy"
+                        className="w-16 h-16 object-cover rounded mr-3 flex-shrink-0"
+                      />
+                    )}
                     <div className="flex-1">
                       <div className="flex items-center space-x-2 mb-2">
                         <span className="px-2 py-1 bg-blue-100 text-blue-700 rounded text-sm font-medium">
@@ -0,0 +1,51 @@
+"""
+數據增強
+訓練管線和離線增強共用的按批次增強設置
+"""
+import os
+import json
+
+# 不落盤增強時寫入數據目錄的配置文件，訓練時據此在線生成增強樣本
+AUGMENTATION_CONFIG = 'augmentation.json'
+
+
+def build_augmentation(seed=None):
+    """
+    構建按批次執行的數據增強層
+
+    與原 ImageDataGenerator 的設置對應（Keras預處理層沒有剪切變換）
+
+    Args:
+        seed: 隨機種子（相同種子生成相同的增強序列；各層使用不同的種子，避免隨機數相關）
+    """
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    def layer_seed(offset):
+        return None if seed is None else seed + offset
+
+    return keras.Sequential([
+        layers.RandomRotation(15 / 360, fill_mode='nearest', seed=layer_seed(0)),
+        layers.RandomTranslation(0.1, 0.1, fill_mode='nearest', seed=layer_seed(1)),
+        layers.RandomZoom(0.1, fill_mode='nearest', seed=layer_seed(2)),
+    ], name='augmentation')
+
+
+def save_config(data_dir, augment_per_image, seed):
+    """保存在線增強配置"""
+    with open(os.path.join(data_dir, AUGMENTATION_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump({'augment_per_image': augment_per_image, 'seed': seed}, f)
+
+
+def load_config(data_dir):
+    """
+    讀取在線增強配置
+
+    Returns:
+        dict: augment_per_image 和 seed；沒有配置時返回None
+    """
+    path = os.path.join(data_dir, AUGMENTATION_CONFIG)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -3,22 +3,107 @@
 整理和預處理文檔圖片數據
 """
 import os
+import re
+import json
+import time
 import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 import numpy as np
 
+from feature_cache import file_hash
+from augmentation import build_augmentation, save_config as save_augmentation_config
+from dataset_shards import SPLITS, has_index, load_meta as load_shard_meta, pack_dataset
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 預處理時每處理多少張圖片寫一次清單（中斷後從最近一次寫入處繼續）
+MANIFEST_FLUSH_EVERY = 1000
+# 離線增強生成的文件名：aug_<序號>_<原文件名>
+_AUGMENTED_NAME = re.compile(r'aug_\d+_')
+
+
+def _save_manifest(manifest, manifest_path):
+    """原子地寫入清單（先寫臨時文件再改名，中斷時不會留下寫了一半的清單）"""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def _resize_image(src_path, dst_path, target_size, format):
+    """
+    縮放單張圖片並保存到輸出目錄（在子進程中執行）
+
+    Returns:
+        str: 出錯時返回錯誤信息，否則為None
+    """
+    try:
+        img = Image.open(src_path)
+        
+        # 轉換格式
+        if format and img.mode != format:
+            img = img.convert(format)
+        
+        # 調整大小
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+        
+        # 先寫臨時文件再改名，中斷時不會留下損壞的輸出
+        tmp_path = f"{dst_path}.part"
+        image_format = Image.registered_extensions()[os.path.splitext(dst_path)[1].lower()]
+        img.save(tmp_path, format=image_format, optimize=True, quality=95)
+        os.replace(tmp_path, dst_path)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _augment_chunk(class_dir, filenames, augment_per_image, seed):
+    """
+    對一批圖片執行向量化增強並保存（在子進程中執行）
+
+    同一批中尺寸相同的圖片疊成一個張量，一次完成變換
+
+    Returns:
+        tuple: (生成的圖片數, 錯誤信息列表)
+    """
+    augmentation = build_augmentation(seed)
+    errors = []
+    groups = {}
+    for filename in filenames:
+        try:
+            img = Image.open(os.path.join(class_dir, filename)).convert('RGB')
+            array = np.asarray(img)
+            groups.setdefault(array.shape, []).append((filename, array))
+        except Exception as e:
+            errors.append(f"增強 {filename} 時出錯: {e}")
+    
+    written = 0
+    for items in groups.values():
+        batch = np.stack([array for _, array in items]).astype('float32')
+        for i in range(augment_per_image):
+            augmented = augmentation(batch, training=True).numpy()
+            augmented = np.clip(augmented, 0, 255).astype('uint8')
+            for (filename, _), aug_img in zip(items, augmented):
+                Image.fromarray(aug_img).save(os.path.join(class_dir, f"aug_{i}_{filename}"))
+                written += 1
+    
+    return written, errors
+
 
 class DataPreprocessor:
-    def __init__(self, raw_data_dir='../data/raw', output_dir='../data/processed'):
+    def __init__(self, raw_data_dir='../data/raw', output_dir='../data/processed',
+                 shard_dir='../data/shards'):
         """
         初始化數據預處理器
         
         Args:
             raw_data_dir: 原始數據目錄
             output_dir: 輸出目錄
+            shard_dir: 分片數據集目錄
         """
         self.raw_data_dir = raw_data_dir
         self.output_dir = output_dir
+        self.shard_dir = shard_dir
         
         # 文檔類型目錄
         self.classes = [
@@ -32,8 +117,9 @@ class DataPreprocessor:
     
     def organize_data(self):
         """整理數據到對應的類別文件夾"""
-        # 創建輸出目錄結構
+        # 創建原始數據和輸出目錄結構
         for class_name in self.classes:
+            os.makedirs(os.path.join(self.raw_data_dir, class_name), exist_ok=True)
             class_dir = os.path.join(self.output_dir, class_name)
             os.makedirs(class_dir, exist_ok=True)
         
@@ -42,107 +128,223 @@ class DataPreprocessor:
         print(f"原始數據目錄: {self.raw_data_dir}")
         print(f"處理後數據目錄: {self.output_dir}")
     
-    def preprocess_images(self, target_size=(224, 224), format='RGB'):
+    def _prune_outputs(self, manifest, seen):
+        """
+        刪除源文件已不存在的清單條目，以及對應的輸出圖片和離線增強圖片
+        
+        Returns:
+            int: 刪除的條目數
+        """
+        removed = [key for key in manifest if key not in seen]
+        for key in removed:
+            entry = manifest.pop(key)
+            class_name, filename = os.path.split(entry.get('output', key))
+            class_dir = os.path.join(self.output_dir, class_name)
+            outputs = [filename]
+            if os.path.isdir(class_dir):
+                outputs += [name for name in os.listdir(class_dir)
+                            if _AUGMENTED_NAME.match(name) and
+                            _AUGMENTED_NAME.sub('', name, count=1) == filename]
+            for name in outputs:
+                path = os.path.join(class_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        return len(removed)
+    
+    def preprocess_images(self, target_size=(224, 224), format='RGB', workers=None,
+                          flush_every=MANIFEST_FLUSH_EVERY):
         """
-        預處理圖片
+        預處理圖片：將原始數據目錄中的圖片縮放後寫入輸出目錄
+        
+        原圖不會被覆蓋。輸出目錄中的清單記錄每個源文件的哈希，
+        重新運行時只處理新增或修改過的圖片；源文件已刪除的圖片從輸出目錄和清單中移除。
+        處理過程中每 flush_every 張圖片寫一次清單，中斷後不會丟失已完成的部分。
         
         Args:
             target_size: 目標圖片大小
             format: 圖片格式
+            workers: 並行進程數（默認為CPU核數）
+            flush_every: 每處理多少張圖片寫一次清單
+            
+        Returns:
+            dict: 處理統計
         """
+        manifest_path = os.path.join(self.output_dir, 'preprocess_manifest.json')
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        settings = {'target_size': list(target_size), 'format': format}
+        
+        # 找出需要處理的圖片
+        tasks = {}
+        seen = set()
+        skipped = 0
         for class_name in self.classes:
-            class_dir = os.path.join(self.output_dir, class_name)
-            if not os.path.exists(class_dir):
+            src_dir = os.path.join(self.raw_data_dir, class_name)
+            if not os.path.exists(src_dir):
                 continue
+            dst_dir = os.path.join(self.output_dir, class_name)
+            os.makedirs(dst_dir, exist_ok=True)
             
-            print(f"處理 {class_name} 類別...")
-            count = 0
-            
-            for filename in os.listdir(class_dir):
-                if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            for filename in sorted(os.listdir(src_dir)):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
                     continue
                 
-                filepath = os.path.join(class_dir, filename)
+                src_path = os.path.join(src_dir, filename)
+                key = f"{class_name}/{filename}"
+                seen.add(key)
+                stat = os.stat(src_path)
+                entry = manifest.get(key)
+                dst_path = os.path.join(dst_dir, filename)
                 
-                try:
-                    # 打開圖片
-                    img = Image.open(filepath)
-                    
-                    # 轉換格式
-                    if format and img.mode != format:
-                        img = img.convert(format)
-                    
-                    # 調整大小
-                    img = img.resize(target_size, Image.Resampling.LANCZOS)
-                    
-                    # 保存處理後的圖片
-                    img.save(filepath, optimize=True, quality=95)
-                    count += 1
+                if entry and entry.get('settings') == settings and os.path.exists(dst_path):
+                    # 大小和修改時間未變時不必重新計算哈希
+                    if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                        skipped += 1
+                        continue
+                    digest = file_hash(src_path)
+                    if entry['hash'] == digest:
+                        entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                        skipped += 1
+                        continue
+                else:
+                    digest = file_hash(src_path)
                 
-                except Exception as e:
-                    print(f"處理 {filename} 時出錯: {e}")
-                    continue
-            
-            print(f"  {class_name}: 處理了 {count} 張圖片")
+                tasks[key] = (src_path, dst_path, {
+                    'hash': digest,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'output': f"{class_name}/{filename}",
+                    'settings': settings
+                })
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        pruned = 0
+        if seen:
+            # 一張源圖片都找不到時多半是原始數據目錄設置錯誤，不做清理
+            pruned = self._prune_outputs(manifest, seen)
+        if pruned:
+            _save_manifest(manifest, manifest_path)
+            print(f"移除 {pruned} 張源文件已刪除的圖片")
+        
+        print(f"需要處理 {len(tasks)} 張圖片，跳過 {skipped} 張未變化的圖片")
+        
+        processed = 0
+        failed = 0
+        start_time = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_resize_image, src_path, dst_path, target_size, format): key
+                for key, (src_path, dst_path, _) in tasks.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                error = future.result()
+                if error:
+                    failed += 1
+                    print(f"處理 {key} 時出錯: {error}")
+                else:
+                    manifest[key] = tasks[key][2]
+                    processed += 1
+                
+                done = processed + failed
+                if done % flush_every == 0:
+                    _save_manifest(manifest, manifest_path)
+                if done % 500 == 0 or done == len(tasks):
+                    elapsed = time.time() - start_time
+                    print(f"  進度: {done}/{len(tasks)} ({done / max(elapsed, 1e-6):.1f} 張/秒)")
+        
+        _save_manifest(manifest, manifest_path)
+        
+        elapsed = time.time() - start_time
+        print(f"預處理完成: 處理 {processed} 張，失敗 {failed} 張，跳過 {skipped} 張，"
+              f"耗時 {elapsed:.1f} 秒")
+        
+        return {
+            'processed': processed,
+            'failed': failed,
+            'skipped': skipped,
+            'pruned': pruned,
+            'seconds': elapsed,
+            'images_per_second': processed / elapsed if elapsed > 0 else 0.0
+        }
     
-    def augment_data(self, augment_per_image=3):
+    def augment_data(self, augment_per_image=3, chunk_size=64, workers=2,
+                     materialize=True, seed=42):
         """
         數據增強
         
+        按批次讀取圖片，在整個批次上一次性執行隨機變換，多個進程並行處理不同批次。
+        materialize=False 時不寫入任何圖片，只保存增強配置，
+        訓練時由 tf.data 管線按相同種子在線生成增強樣本，磁盤佔用保持不變。
+        
         Args:
             augment_per_image: 每張圖片生成的增強版本數量
+            chunk_size: 每批讀取的圖片數量
+            workers: 並行進程數
+            materialize: 是否將增強後的圖片寫入磁盤
+            seed: 隨機種子
         """
-        from tensorflow.keras.preprocessing.image import ImageDataGenerator
-        
-        datagen = ImageDataGenerator(
-            rotation_range=15,
-            width_shift_range=0.1,
-            height_shift_range=0.1,
-            shear_range=0.1,
-            zoom_range=0.1,
-            horizontal_flip=False,
-            fill_mode='nearest'
-        )
+        if not materialize:
+            save_augmentation_config(self.output_dir, augment_per_image, seed)
+            print(f"已保存在線增強配置（每張圖片 {augment_per_image} 個增強版本，種子 {seed}），"
+                  f"訓練時生成，不寫入磁盤")
+            return
         
+        tasks = []
         for class_name in self.classes:
             class_dir = os.path.join(self.output_dir, class_name)
             if not os.path.exists(class_dir):
                 continue
             
-            print(f"增強 {class_name} 類別...")
-            
-            for filename in os.listdir(class_dir):
-                if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    continue
-                
-                filepath = os.path.join(class_dir, filename)
-                
-                try:
-                    img = Image.open(filepath)
-                    img_array = np.array(img)
-                    img_array = np.expand_dims(img_array, axis=0)
-                    
-                    # 生成增強圖片
-                    aug_iter = datagen.flow(img_array, batch_size=1)
-                    
-                    for i in range(augment_per_image):
-                        aug_img = next(aug_iter)[0].astype('uint8')
-                        aug_filename = f"aug_{i}_{filename}"
-                        aug_filepath = os.path.join(class_dir, aug_filename)
-                        
-                        Image.fromarray(aug_img).save(aug_filepath)
-                
-                except Exception as e:
-                    print(f"增強 {filename} 時出錯: {e}")
-                    continue
-            
-            print(f"  {class_name}: 數據增強完成")
+            # 跳過之前生成的增強圖片，避免重複增強
+            filenames = sorted(f for f in os.listdir(class_dir)
+                               if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith('aug_'))
+            for start in range(0, len(filenames), chunk_size):
+                tasks.append((class_dir, filenames[start:start + chunk_size]))
+        
+        print(f"增強 {sum(len(names) for _, names in tasks)} 張圖片，共 {len(tasks)} 批...")
+        
+        written = 0
+        start_time = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_augment_chunk, class_dir, filenames, augment_per_image, seed + i)
+                for i, (class_dir, filenames) in enumerate(tasks)
+            ]
+            for future in as_completed(futures):
+                count, errors = future.result()
+                written += count
+                for error in errors:
+                    print(error)
+        
+        elapsed = time.time() - start_time
+        print(f"數據增強完成: 生成 {written} 張圖片，耗時 {elapsed:.1f} 秒")
+    
+    def pack_shards(self, shard_size=4096):
+        """將輸出目錄中的圖片打包為分片數據集（見 dataset_shards.py）"""
+        return pack_dataset(self.output_dir, self.shard_dir, self.classes, shard_size=shard_size)
     
     def check_data_distribution(self):
         """檢查數據分布"""
         print("\n數據分布統計:")
         print("-" * 50)
         
+        if self.shard_dir and has_index(self.shard_dir):
+            # 直接從分片索引讀取，不必列出目錄
+            counts = load_shard_meta(self.shard_dir)['counts']
+            total = 0
+            for class_name in self.classes:
+                per_split = [counts[split].get(class_name, 0) for split in SPLITS]
+                total += sum(per_split)
+                detail = ', '.join(f"{split} {n}" for split, n in zip(SPLITS, per_split))
+                print(f"{class_name:20s}: {sum(per_split):4d} 張圖片 ({detail})")
+            print("-" * 50)
+            print(f"{'總計':20s}: {total:4d} 張圖片（分片索引: {self.shard_dir}）")
+            print()
+            return
+        
         total = 0
         for class_name in self.classes:
             class_dir = os.path.join(self.output_dir, class_name)
@@ -169,6 +371,9 @@ if __name__ == '__main__':
     # 3. 數據增強（可選）
     # preprocessor.augment_data(augment_per_image=3)
     
-    # 4. 檢查數據分布
+    # 4. 打包為分片數據集（可選，訓練和評估可直接讀取分片）
+    # preprocessor.pack_shards()
+    
+    # 5. 檢查數據分布
     preprocessor.check_data_distribution()
 
@@ -0,0 +1,257 @@
+"""
+分片數據集
+將大量小圖片文件打包為少量連續的NumPy分片，並在索引中保存固定的訓練/驗證/測試劃分
+
+目錄結構:
+    shards/
+    ├── index.json          # 類別、圖片尺寸、分片列表、各劃分各類別的數量
+    ├── index.npz           # 每個樣本的分片號、行號、標籤和劃分
+    └── images-00000.npy    # (N, H, W, 3) uint8，可內存映射讀取
+
+用法:
+    python dataset_shards.py --data-dir ../data/processed --shard-dir ../data/shards
+"""
+import os
+import re
+import json
+import zlib
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+SPLITS = ('train', 'val', 'test')
+
+# 增強生成的圖片與原圖劃分到同一側
+AUGMENTED_PREFIX = re.compile(r'(?<=/)aug_\d+_')
+
+
+def split_for(key, val_fraction=0.1, test_fraction=0.1):
+    """
+    按文件相對路徑的哈希穩定地決定劃分
+
+    Returns:
+        int: SPLITS 中的序號
+    """
+    key = AUGMENTED_PREFIX.sub('', key)
+    bucket = zlib.crc32(key.encode('utf-8')) % 1000
+    if bucket < test_fraction * 1000:
+        return SPLITS.index('test')
+    if bucket < (test_fraction + val_fraction) * 1000:
+        return SPLITS.index('val')
+    return SPLITS.index('train')
+
+
+def _load_resized(args):
+    """讀取並縮放單張圖片（在子進程中執行）"""
+    path, img_size = args
+    try:
+        img = Image.open(path).convert('RGB')
+        if img.size != tuple(img_size):
+            img = img.resize(tuple(img_size))
+        return np.asarray(img, dtype=np.uint8)
+    except Exception as e:
+        print(f"讀取 {path} 時出錯: {e}")
+        return None
+
+
+def pack_dataset(data_dir, shard_dir, class_names, img_size=(224, 224), shard_size=4096,
+                 val_fraction=0.1, test_fraction=0.1, workers=None):
+    """
+    將按類別存放的圖片打包為分片
+
+    Args:
+        data_dir: 圖片目錄（data_dir/<類別>/*.png）
+        shard_dir: 輸出目錄
+        class_names: 類別列表（標籤按此順序編號）
+        img_size: 圖片尺寸 (寬, 高)
+        shard_size: 每個分片的圖片數
+        val_fraction: 驗證集比例
+        test_fraction: 測試集比例
+        workers: 解碼進程數
+
+    Returns:
+        dict: 索引元數據
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.exists(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                key = f"{class_name}/{filename}"
+                samples.append((os.path.join(class_dir, filename), label,
+                                split_for(key, val_fraction, test_fraction)))
+
+    # 打亂後再寫入，使每個分片內各類別混合，順序讀取時也能充分打亂
+    random.Random(0).shuffle(samples)
+
+    shard_ids, rows, labels, splits = [], [], [], []
+    shards = []
+    width, height = img_size
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(samples), shard_size):
+            chunk = samples[start:start + shard_size]
+            images = list(executor.map(_load_resized, [(path, img_size) for path, _, _ in chunk],
+                                       chunksize=32))
+            valid = [(image, sample) for image, sample in zip(images, chunk) if image is not None]
+
+            filename = f"images-{len(shards):05d}.npy"
+            shard = np.lib.format.open_memmap(
+                os.path.join(shard_dir, filename), mode='w+', dtype=np.uint8,
+                shape=(len(valid), height, width, 3))
+            for row, (image, (_, label, split)) in enumerate(valid):
+                shard[row] = image
+                shard_ids.append(len(shards))
+                rows.append(row)
+                labels.append(label)
+                splits.append(split)
+            shard.flush()
+            del shard
+
+            shards.append({'file': filename, 'count': len(valid)})
+            print(f"  已寫入 {filename}: {len(valid)} 張圖片")
+
+    labels = np.array(labels, dtype=np.int16)
+    splits = np.array(splits, dtype=np.int8)
+    np.savez(os.path.join(shard_dir, 'index.npz'),
+             shard=np.array(shard_ids, dtype=np.int32),
+             row=np.array(rows, dtype=np.int32),
+             label=labels,
+             split=splits)
+
+    counts = {
+        split_name: {
+            class_name: int(np.sum((splits == i) & (labels == label)))
+            for label, class_name in enumerate(class_names)
+        }
+        for i, split_name in enumerate(SPLITS)
+    }
+    meta = {
+        'class_names': list(class_names),
+        'img_size': list(img_size),
+        'shards': shards,
+        'counts': counts
+    }
+    with open(os.path.join(shard_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    print(f"打包完成: {len(labels)} 張圖片，{len(shards)} 個分片")
+    return meta
+
+
+def has_index(shard_dir):
+    """分片目錄中是否有索引"""
+    return os.path.exists(os.path.join(shard_dir, 'index.json'))
+
+
+def load_meta(shard_dir):
+    """只讀取索引元數據（不加載分片）"""
+    with open(os.path.join(shard_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ShardDataset:
+    def __init__(self, shard_dir):
+        """
+        讀取分片數據集
+
+        Args:
+            shard_dir: 分片目錄
+        """
+        self.shard_dir = shard_dir
+        self.meta = load_meta(shard_dir)
+        self.class_names = self.meta['class_names']
+        self.img_size = tuple(self.meta['img_size'])
+        index = np.load(os.path.join(shard_dir, 'index.npz'))
+        self.shard = index['shard']
+        self.row = index['row']
+        self.label = index['label']
+        self.split = index['split']
+        self._shards = {}
+
+    def _open_shard(self, shard_id):
+        """內存映射打開分片"""
+        if shard_id not in self._shards:
+            path = os.path.join(self.shard_dir, self.meta['shards'][shard_id]['file'])
+            self._shards[shard_id] = np.load(path, mmap_mode='r')
+        return self._shards[shard_id]
+
+    def indices(self, split):
+        """返回某個劃分的樣本序號（按分片、行號排列，讀取時連續）"""
+        return np.flatnonzero(self.split == SPLITS.index(split))
+
+    def labels(self, split):
+        """返回某個劃分的標籤"""
+        return self.label[self.indices(split)]
+
+    def size(self, split):
+        return len(self.indices(split))
+
+    def iter_batches(self, split, batch_size=32):
+        """
+        按順序逐批讀取圖片
+
+        Returns:
+            generator: (uint8 圖片批次, 標籤批次)
+        """
+        indices = self.indices(split)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            images = np.stack([self._open_shard(self.shard[i])[self.row[i]] for i in batch])
+            yield images, self.label[batch]
+
+    def as_tf_dataset(self, split):
+        """
+        以 tf.data.Dataset 形式逐張讀取某個劃分（未分批，uint8圖片和整數標籤）
+        """
+        import tensorflow as tf
+
+        indices = self.indices(split)
+        height, width = self.img_size[1], self.img_size[0]
+
+        def generate():
+            for i in indices:
+                yield self._open_shard(self.shard[i])[self.row[i]], self.label[i]
+
+        return tf.data.Dataset.from_generator(
+            generate,
+            output_signature=(
+                tf.TensorSpec(shape=(height, width, 3), dtype=tf.uint8),
+                tf.TensorSpec(shape=(), dtype=tf.int16)
+            )
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='將圖片數據集打包為分片')
+    parser.add_argument('--data-dir', default='../data/processed')
+    parser.add_argument('--shard-dir', default='../data/shards')
+    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--shard-size', type=int, default=4096)
+    parser.add_argument('--val-fraction', type=float, default=0.1)
+    parser.add_argument('--test-fraction', type=float, default=0.1)
+    args = parser.parse_args()
+
+    pack_dataset(
+        args.data_dir,
+        args.shard_dir,
+        class_names=[
+            'identity_card',
+            'utility_bill',
+            'bank_statement',
+            'address_proof',
+            'lease_agreement',
+            'other'
+        ],
+        img_size=(args.img_size, args.img_size),
+        shard_size=args.shard_size,
+        val_fraction=args.val_fraction,
+        test_fraction=args.test_fraction
+    )
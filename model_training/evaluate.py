@@ -3,29 +3,96 @@
 評估訓練好的模型性能
 """
 import os
+import sys
+import time
+import queue
+import argparse
+import multiprocessing as mp
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from PIL import Image
 from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from dataset_shards import ShardDataset, has_index, split_for, SPLITS, IMAGE_EXTENSIONS
+
+# 文本優先分類的對比需要使用後端的 OCR 和分類組件
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+
+def _benchmark_worker(model_path, tflite_path, threads, batch_sizes, num_batches, result_queue):
+    """
+    在獨立進程中測量推理延遲（TensorFlow 線程數只能在運行時初始化前設置）
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    def measure(run, batch_size, input_shape):
+        batch = np.random.rand(batch_size, *input_shape).astype(np.float32)
+        run(batch)  # 預熱
+        latencies = []
+        for _ in range(num_batches):
+            start = time.perf_counter()
+            run(batch)
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies)
+        return {
+            'threads': threads,
+            'batch_size': batch_size,
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p95_ms': float(np.percentile(latencies, 95) * 1000),
+            'per_image_ms': float(latencies.mean() / batch_size * 1000),
+            'images_per_sec': float(batch_size / latencies.mean())
+        }
+
+    results = []
+
+    model = keras.models.load_model(model_path)
+    input_shape = model.input_shape[1:]
+    for batch_size in batch_sizes:
+        result = measure(lambda batch: model(batch, training=False), batch_size, input_shape)
+        result['runtime'] = 'keras'
+        results.append(result)
+
+    if tflite_path:
+        interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=threads)
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        tflite_shape = tuple(interpreter.get_input_details()[0]['shape'][1:])
+        for batch_size in batch_sizes:
+            interpreter.resize_tensor_input(input_index, [batch_size, *tflite_shape])
+            interpreter.allocate_tensors()
+
+            def run(batch):
+                interpreter.set_tensor(input_index, batch)
+                interpreter.invoke()
+                return interpreter.get_tensor(output_index)
+
+            result = measure(run, batch_size, tflite_shape)
+            result['runtime'] = 'tflite'
+            results.append(result)
+
+    result_queue.put(results)
+
 
 class ModelEvaluator:
-    def __init__(self, model_path='../backend/models/document_classifier.h5', 
-                 test_data_dir='../data/processed'):
+    def __init__(self, model_path='../backend/models/document_classifier.h5',
+                 test_data_dir='../data/processed', shard_dir='../data/shards'):
         """
         初始化評估器
-        
+
         Args:
             model_path: 模型文件路徑
-            test_data_dir: 測試數據目錄
+            test_data_dir: 測試數據目錄（沒有分片數據集時，使用其中按哈希劃分出的測試集）
+            shard_dir: 分片數據集目錄，存在時使用其中的測試集
         """
         self.model_path = model_path
         self.test_data_dir = test_data_dir
+        self.shard_dir = shard_dir
         self.model = None
-        
+
         self.class_names = [
             'identity_card',
             'utility_bill',
@@ -34,7 +101,7 @@ class ModelEvaluator:
             'lease_agreement',
             'other'
         ]
-    
+
     def load_model(self):
         """加載模型"""
         if os.path.exists(self.model_path):
@@ -42,49 +109,289 @@ class ModelEvaluator:
             print(f"模型已加載: {self.model_path}")
         else:
             raise FileNotFoundError(f"模型文件不存在: {self.model_path}")
-    
-    def evaluate(self):
-        """評估模型"""
+
+    def test_batches(self, batch_size=32, img_size=None):
+        """
+        逐批讀取留出的測試集
+
+        有分片數據集時使用其索引中的測試集；否則對測試數據目錄按與
+        dataset_shards 相同的哈希規則劃分，只取測試部分（訓練時不會用到）。
+
+        Args:
+            batch_size: 批次大小
+            img_size: 模型輸入尺寸 (高, 寬)，默認取自模型
+
+        Returns:
+            generator: (float32 圖片批次, 標籤批次)
+        """
+        if img_size is None:
+            img_size = tuple(self.model.input_shape[1:3])
+
+        if self.shard_dir and has_index(self.shard_dir):
+            shards = ShardDataset(self.shard_dir)
+            print(f"使用分片數據集的測試集: {shards.size('test')} 張圖片")
+            for images, labels in shards.iter_batches('test', batch_size):
+                images = images.astype(np.float32) / 255.0
+                if images.shape[1:3] != img_size:
+                    images = tf.image.resize(images, img_size).numpy()
+                yield images, labels.astype(np.int64)
+            return
+
+        samples = []
+        for label, class_name in enumerate(self.class_names):
+            class_dir = os.path.join(self.test_data_dir, class_name)
+            if not os.path.exists(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir)):
+                if (filename.lower().endswith(IMAGE_EXTENSIONS)
+                        and split_for(f"{class_name}/{filename}") == SPLITS.index('test')):
+                    samples.append((os.path.join(class_dir, filename), label))
+        print(f"使用 {self.test_data_dir} 中劃分出的測試集: {len(samples)} 張圖片")
+
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start:start + batch_size]
+            images = np.stack([
+                np.asarray(Image.open(path).convert('RGB').resize((img_size[1], img_size[0])),
+                           dtype=np.float32) / 255.0
+                for path, _ in chunk
+            ])
+            yield images, np.array([label for _, label in chunk], dtype=np.int64)
+
+    def evaluate(self, plot=True):
+        """
+        評估模型
+
+        只做一次推理，同時計算損失、準確率、分類報告和混淆矩陣
+
+        Args:
+            plot: 是否保存混淆矩陣圖
+
+        Returns:
+            list: [測試損失, 測試準確率]
+        """
         if self.model is None:
             self.load_model()
-        
-        # 創建測試數據生成器
-        test_datagen = ImageDataGenerator(rescale=1./255)
-        
-        test_generator = test_datagen.flow_from_directory(
-            self.test_data_dir,
-            target_size=(224, 224),
-            batch_size=32,
-            class_mode='categorical',
-            shuffle=False
-        )
-        
-        # 評估
+
         print("開始評估...")
-        results = self.model.evaluate(test_generator, verbose=1)
-        
-        print(f"\n測試損失: {results[0]:.4f}")
-        print(f"測試準確率: {results[1]:.4f}")
-        
-        # 預測
-        predictions = self.model.predict(test_generator, verbose=1)
-        predicted_classes = np.argmax(predictions, axis=1)
-        true_classes = test_generator.classes
-        
+        losses = []
+        predicted = []
+        true = []
+        for images, labels in self.test_batches():
+            probabilities = self.model(images, training=False).numpy()
+            picked = probabilities[np.arange(len(labels)), labels]
+            losses.append(-np.log(np.clip(picked, 1e-7, 1.0)))
+            predicted.append(np.argmax(probabilities, axis=1))
+            true.append(labels)
+
+        if not true:
+            raise ValueError("測試集為空")
+
+        true_classes = np.concatenate(true)
+        predicted_classes = np.concatenate(predicted)
+        loss = float(np.concatenate(losses).mean())
+        accuracy = float(np.mean(true_classes == predicted_classes))
+        results = [loss, accuracy]
+
+        print(f"\n測試損失: {loss:.4f}")
+        print(f"測試準確率: {accuracy:.4f}")
+
         # 分類報告
         print("\n分類報告:")
         print(classification_report(
             true_classes,
             predicted_classes,
-            target_names=self.class_names
+            labels=list(range(len(self.class_names))),
+            target_names=self.class_names,
+            zero_division=0
         ))
-        
+
         # 混淆矩陣
-        cm = confusion_matrix(true_classes, predicted_classes)
-        self.plot_confusion_matrix(cm)
-        
+        cm = confusion_matrix(true_classes, predicted_classes,
+                              labels=list(range(len(self.class_names))))
+        if plot:
+            self.plot_confusion_matrix(cm)
+
+        return results
+
+    def benchmark(self, batch_sizes=(1, 8, 32), thread_counts=(1, 2, 4), num_batches=20,
+                  tflite_path=None, timeout=600, poll=5.0):
+        """
+        測量推理延遲和吞吐量
+
+        每種線程數在獨立進程中測試 Keras 模型（以及可選的 TFLite 導出模型）在不同批次大小下的表現；
+        子進程異常退出（模型無法加載、內存不足、段錯誤）或超時時記錄為失敗，不會一直等待
+
+        Args:
+            batch_sizes: 要測試的批次大小
+            thread_counts: 要測試的線程數
+            num_batches: 每種配置計時的批次數
+            tflite_path: TFLite 模型路徑（可選）
+            timeout: 每種線程數最長等待秒數（None 或0表示不限制）
+            poll: 檢查子進程是否仍在運行的間隔秒數
+
+        Returns:
+            list: 每種配置的結果；失敗的線程數為 {'runtime': 'failed', 'threads', 'error', 'exitcode'}
+        """
+        ctx = mp.get_context('spawn')
+        results = []
+        for threads in thread_counts:
+            result_queue = ctx.Queue()
+            worker = ctx.Process(target=_benchmark_worker, args=(
+                self.model_path, tflite_path, threads, list(batch_sizes), num_batches, result_queue))
+            worker.start()
+            deadline = time.monotonic() + timeout if timeout else None
+            rows = None
+            while rows is None:
+                try:
+                    rows = result_queue.get(timeout=poll)
+                except queue.Empty:
+                    if not worker.is_alive():
+                        # 子進程可能在退出前剛放入結果
+                        try:
+                            rows = result_queue.get(timeout=1.0)
+                        except queue.Empty:
+                            rows = [{'runtime': 'failed', 'threads': threads, 'error': 'crashed'}]
+                    elif deadline is not None and time.monotonic() > deadline:
+                        worker.terminate()
+                        rows = [{'runtime': 'failed', 'threads': threads, 'error': 'timeout'}]
+            worker.join(10)
+            for row in rows:
+                if row['runtime'] == 'failed':
+                    row['exitcode'] = worker.exitcode
+            results.extend(rows)
+
+        print(f"\n{'運行時':8s} {'線程':>4s} {'批次':>4s} {'p50(ms)':>9s} {'p95(ms)':>9s} "
+              f"{'每張(ms)':>9s} {'張/秒':>9s}")
+        for r in results:
+            if r['runtime'] == 'failed':
+                print(f"{r['runtime']:8s} {r['threads']:4d} 失敗: {r['error']}（退出碼 {r['exitcode']}）")
+                continue
+            print(f"{r['runtime']:8s} {r['threads']:4d} {r['batch_size']:4d} {r['p50_ms']:9.2f} "
+                  f"{r['p95_ms']:9.2f} {r['per_image_ms']:9.2f} {r['images_per_sec']:9.1f}")
+
+        return results
+
+    def compare(self, candidate_path, threads=1, num_batches=50):
+        """
+        對比候選模型（例如蒸餾的學生模型）與當前模型的準確率和單張推理延遲
+
+        兩個模型各自按自己的輸入尺寸讀取同一測試集
+
+        Args:
+            candidate_path: 候選模型文件
+            threads: 測量延遲時的線程數
+            num_batches: 計時的推理次數
+
+        Returns:
+            dict: 兩個模型的準確率、p50延遲，以及準確率差（百分點）和加速比
+        """
+        results = {}
+        for name, path in (('baseline', self.model_path), ('candidate', candidate_path)):
+            print(f"\n===== {name}: {path} =====")
+            evaluator = ModelEvaluator(path, self.test_data_dir, self.shard_dir)
+            _, accuracy = evaluator.evaluate(plot=False)
+            latency = evaluator.benchmark(batch_sizes=(1,), thread_counts=(threads,),
+                                          num_batches=num_batches)
+            keras_latency = [r for r in latency if r['runtime'] == 'keras']
+            if not keras_latency:
+                raise RuntimeError(f"{path} 延遲測試失敗: {latency[0]['error']}")
+            keras_latency = keras_latency[0]
+            results[name] = {
+                'model': path,
+                'accuracy': accuracy,
+                'p50_ms': keras_latency['p50_ms'],
+                'input_shape': list(evaluator.model.input_shape[1:])
+            }
+
+        results['accuracy_drop_points'] = \
+            (results['baseline']['accuracy'] - results['candidate']['accuracy']) * 100
+        results['speedup'] = results['baseline']['p50_ms'] / results['candidate']['p50_ms']
+
+        print(f"\n{'模型':10s} {'輸入':>14s} {'準確率':>8s} {'p50(ms)':>9s}")
+        for name in ('baseline', 'candidate'):
+            r = results[name]
+            print(f"{name:10s} {str(tuple(r['input_shape'])):>14s} {r['accuracy']:8.4f} {r['p50_ms']:9.2f}")
+        print(f"準確率下降 {results['accuracy_drop_points']:.2f} 個百分點，"
+              f"單張推理加速 {results['speedup']:.1f}x（{threads} 線程）")
+
         return results
-    
+
+    def evaluate_text_first(self, raw_data_dir='../data/raw', thresholds=(0.7, 0.8, 0.85, 0.9, 0.95),
+                            text_model_path='../backend/models/text_classifier.npz', limit=None):
+        """
+        對比"先OCR、文本置信度不足時才運行CNN"與只用CNN的分類準確率
+
+        使用原始分辨率圖片（OCR需要）中與 dataset_shards 相同哈希規則劃分出的測試集。
+        每張圖片只做一次OCR和一次CNN推理，再在各閾值下組合結果。
+
+        Args:
+            raw_data_dir: 原始圖片目錄（raw_data_dir/<類別>/*）
+            thresholds: 要比較的文本置信度閾值
+            text_model_path: 文本分類模型（不存在時使用關鍵詞先驗）
+            limit: 最多使用的圖片數
+
+        Returns:
+            dict: CNN準確率，以及每個閾值下的準確率和跳過CNN的比例
+        """
+        from utils.document_classifier import DocumentClassifier
+        from utils.ocr_processor import OCRProcessor
+        from utils.text_classifier import TextClassifier
+
+        samples = []
+        for label, class_name in enumerate(self.class_names):
+            class_dir = os.path.join(raw_data_dir, class_name)
+            if not os.path.exists(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir)):
+                if (filename.lower().endswith(IMAGE_EXTENSIONS)
+                        and split_for(f"{class_name}/{filename}") == SPLITS.index('test')):
+                    samples.append((os.path.join(class_dir, filename), label))
+        if limit:
+            samples = samples[:limit]
+        if not samples:
+            raise ValueError("測試集為空")
+        print(f"使用 {raw_data_dir} 中劃分出的測試集: {len(samples)} 張圖片")
+
+        document_classifier = DocumentClassifier(self.model_path)
+        ocr_processor = OCRProcessor()
+        text_classifier = TextClassifier(text_model_path)
+
+        true = np.array([label for _, label in samples])
+        cnn_predicted = []
+        text_predicted = []
+        text_confidence = []
+        for path, _ in samples:
+            doc_type, _ = document_classifier.classify(path)
+            cnn_predicted.append(self.class_names.index(doc_type))
+            doc_type, confidence = text_classifier.classify(ocr_processor.process(path))
+            text_predicted.append(self.class_names.index(doc_type))
+            text_confidence.append(confidence)
+        cnn_predicted = np.array(cnn_predicted)
+        text_predicted = np.array(text_predicted)
+        text_confidence = np.array(text_confidence)
+
+        cnn_accuracy = float(np.mean(cnn_predicted == true))
+        results = {'cnn_accuracy': cnn_accuracy, 'thresholds': []}
+        print(f"\n只用CNN: 準確率 {cnn_accuracy:.4f}")
+        print(f"{'閾值':>6s} {'準確率':>8s} {'與CNN差':>8s} {'跳過CNN':>8s} {'文本部分準確率':>12s}")
+        for threshold in thresholds:
+            use_text = text_confidence >= threshold
+            predicted = np.where(use_text, text_predicted, cnn_predicted)
+            accuracy = float(np.mean(predicted == true))
+            text_accuracy = float(np.mean(text_predicted[use_text] == true[use_text])) \
+                if use_text.any() else None
+            results['thresholds'].append({
+                'threshold': threshold,
+                'accuracy': accuracy,
+                'skip_rate': float(use_text.mean()),
+                'text_accuracy': text_accuracy
+            })
+            print(f"{threshold:6.2f} {accuracy:8.4f} {accuracy - cnn_accuracy:+8.4f} "
+                  f"{use_text.mean():8.2%} "
+                  f"{'-' if text_accuracy is None else f'{text_accuracy:.4f}':>12s}")
+
+        return results
+
     def plot_confusion_matrix(self, cm):
         """繪製混淆矩陣"""
         plt.figure(figsize=(10, 8))
@@ -105,6 +412,42 @@ class ModelEvaluator:
 
 
 if __name__ == '__main__':
-    evaluator = ModelEvaluator()
-    evaluator.evaluate()
+    parser = argparse.ArgumentParser(description='評估文檔分類模型')
+    parser.add_argument('--model', default='../backend/models/document_classifier.h5')
+    parser.add_argument('--data-dir', default='../data/processed')
+    parser.add_argument('--shard-dir', default='../data/shards')
+    parser.add_argument('--benchmark', action='store_true', help='測量推理延遲和吞吐量')
+    parser.add_argument('--batch-sizes', default='1,8,32')
+    parser.add_argument('--threads', default='1,2,4')
+    parser.add_argument('--tflite', default=None, help='同時測試的 TFLite 模型')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='延遲測試中每種線程數最長等待秒數（0表示不限制）')
+    parser.add_argument('--compare', default=None,
+                        help='與 --model 對比的候選模型（例如蒸餾的學生模型）')
+    parser.add_argument('--text-first', action='store_true',
+                        help='對比文本優先分類（先OCR，文本置信度不足時才運行CNN）與只用CNN的準確率')
+    parser.add_argument('--raw-dir', default='../data/raw', help='文本優先對比使用的原始圖片目錄')
+    parser.add_argument('--text-model', default='../backend/models/text_classifier.npz')
+    parser.add_argument('--thresholds', default='0.7,0.8,0.85,0.9,0.95')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
 
+    evaluator = ModelEvaluator(args.model, args.data_dir, args.shard_dir)
+    if args.benchmark:
+        evaluator.benchmark(
+            batch_sizes=[int(x) for x in args.batch_sizes.split(',')],
+            thread_counts=[int(x) for x in args.threads.split(',')],
+            tflite_path=args.tflite,
+            timeout=args.timeout
+        )
+    elif args.compare:
+        evaluator.compare(args.compare, threads=int(args.threads.split(',')[0]))
+    elif args.text_first:
+        evaluator.evaluate_text_first(
+            raw_data_dir=args.raw_dir,
+            thresholds=[float(x) for x in args.thresholds.split(',')],
+            text_model_path=args.text_model,
+            limit=args.limit
+        )
+    else:
+        evaluator.evaluate()
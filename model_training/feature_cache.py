@@ -0,0 +1,99 @@
+"""
+特徵緩存
+以圖片內容哈希為鍵，將凍結骨幹網絡輸出的特徵保存在內存映射的NumPy文件中
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """計算文件內容的SHA1哈希"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, dim):
+        """
+        初始化特徵緩存
+
+        Args:
+            cache_dir: 緩存目錄（不同骨幹網絡或輸入尺寸應使用不同目錄）
+            dim: 特徵維度
+        """
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.features_path = os.path.join(cache_dir, 'features.npy')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.index = {}
+        self.features = None
+        if os.path.exists(self.index_path) and os.path.exists(self.features_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+            self.features = np.load(self.features_path, mmap_mode='r+')
+            if self.features.shape[1] != dim:
+                raise ValueError(f"緩存特徵維度 {self.features.shape[1]} 與 {dim} 不一致")
+
+    def __len__(self):
+        return len(self.index)
+
+    def missing(self, hashes):
+        """返回緩存中沒有的哈希"""
+        return [h for h in dict.fromkeys(hashes) if h not in self.index]
+
+    def get(self, hashes):
+        """
+        按哈希讀取特徵
+
+        Returns:
+            numpy array: (len(hashes), dim) 的特徵數組
+        """
+        rows = [self.index[h] for h in hashes]
+        return np.asarray(self.features[rows])
+
+    def add(self, hashes, features):
+        """
+        寫入新特徵，容量不足時擴展內存映射文件
+
+        Args:
+            hashes: 哈希列表
+            features: (len(hashes), dim) 的特徵數組
+        """
+        if len(hashes) == 0:
+            return
+        count = len(self.index)
+        capacity = 0 if self.features is None else self.features.shape[0]
+        needed = count + len(hashes)
+
+        if needed > capacity:
+            new_capacity = max(needed, capacity * 2, 1024)
+            tmp_path = self.features_path + '.tmp'
+            grown = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32, shape=(new_capacity, self.dim))
+            if count:
+                grown[:count] = self.features[:count]
+            grown.flush()
+            del grown
+            self.features = None
+            os.replace(tmp_path, self.features_path)
+            self.features = np.load(self.features_path, mmap_mode='r+')
+
+        self.features[count:needed] = features
+        for i, h in enumerate(hashes):
+            self.index[h] = count + i
+
+    def save(self):
+        """將特徵和索引寫回磁盤"""
+        if self.features is not None:
+            self.features.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
@@ -3,9 +3,48 @@
 用于快速测试训练流程（仅用于测试，不推荐用于生产环境）
 """
 import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 import random
 
+CLASSES = [
+    'identity_card',
+    'utility_bill',
+    'bank_statement',
+    'address_proof',
+    'lease_agreement',
+    'other'
+]
+
+# 常见中文字体位置（找不到时只渲染英文内容）
+CJK_FONT_CANDIDATES = [
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/System/Library/Fonts/PingFang.ttc',
+    'C:/Windows/Fonts/msjh.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+]
+LATIN_FONT_CANDIDATES = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+
+SURNAMES = [('CHAN', '陳'), ('WONG', '黃'), ('LEUNG', '梁'), ('LEE', '李'), ('CHEUNG', '張'),
+            ('LAU', '劉'), ('HO', '何'), ('NG', '吳'), ('LAM', '林'), ('TSANG', '曾')]
+GIVEN_NAMES = [('TAI MAN', '大文'), ('SIU MING', '小明'), ('KA YAN', '嘉欣'), ('WING SZE', '詠詩'),
+               ('CHI KEUNG', '志強'), ('MEI LING', '美玲'), ('HO YIN', '浩賢'), ('YUK LAN', '玉蘭')]
+DISTRICTS = [('Mong Kok', '旺角', 'Kowloon', '九龍'), ('Sha Tin', '沙田', 'New Territories', '新界'),
+             ('Causeway Bay', '銅鑼灣', 'Hong Kong', '香港'), ('Tsuen Wan', '荃灣', 'New Territories', '新界'),
+             ('Kwun Tong', '觀塘', 'Kowloon', '九龍'), ('Wan Chai', '灣仔', 'Hong Kong', '香港')]
+STREETS = [('Nathan Road', '彌敦道'), ('Queen\'s Road', '皇后大道'), ('Hennessy Road', '軒尼詩道'),
+           ('Castle Peak Road', '青山公路'), ('King\'s Road', '英皇道')]
+BUILDINGS = [('Harbour View Building', '海景大廈'), ('Golden Court', '金庭'), ('Sunrise Mansion', '旭日大廈'),
+             ('Park Tower', '公園大廈')]
+
 
 def generate_test_image(class_name, index, output_dir):
     """生成一张简单的测试图片"""
@@ -95,17 +134,246 @@ def generate_test_dataset(output_dir='../data/processed', samples_per_class=10):
     print("   实际训练需要使用真实的文档图片数据。")
 
 
-if __name__ == '__main__':
-    import sys
-    
-    # 检查是否提供了参数
-    if len(sys.argv) > 1:
-        try:
-            samples = int(sys.argv[1])
-        except:
-            samples = 10
+def hkid_check_digit(prefix, digits):
+    """计算香港身份证号码的校验位"""
+    letters = prefix.rjust(2, ' ')
+    values = [36 if c == ' ' else ord(c) - 55 for c in letters] + [int(d) for d in digits]
+    total = sum(v * w for v, w in zip(values, range(9, 1, -1)))
+    check = (11 - total % 11) % 11
+    return 'A' if check == 10 else str(check)
+
+
+def _random_fields(rng):
+    """生成一组合成的个人信息"""
+    surname, surname_zh = rng.choice(SURNAMES)
+    given, given_zh = rng.choice(GIVEN_NAMES)
+    district, district_zh, region, region_zh = rng.choice(DISTRICTS)
+    street, street_zh = rng.choice(STREETS)
+    building, building_zh = rng.choice(BUILDINGS)
+    number = rng.randint(1, 999)
+    floor = rng.randint(1, 40)
+    flat = rng.choice('ABCDEFGH')
+
+    prefix = rng.choice('ACDEGHKPRVWYZ')
+    digits = ''.join(str(rng.randint(0, 9)) for _ in range(6))
+    year, month = rng.randint(2023, 2025), rng.randint(1, 12)
+
+    return {
+        'name': f"{surname} {given}",
+        'name_zh': f"{surname_zh}{given_zh}",
+        'id_number': f"{prefix}{digits}({hkid_check_digit(prefix, digits)})",
+        'address': f"Flat {flat}, {floor}/F, {building}, {number} {street}, {district}, {region}",
+        'address_zh': f"{region_zh}{district_zh}{street_zh}{number}號{building_zh}{floor}樓{flat}室",
+        'date': f"{year}-{month:02d}-{rng.randint(1, 28):02d}",
+        'bill_period': f"{year}-{month:02d}-01 至 {year}-{month:02d}-28",
+        'amount': f"HK${rng.randint(100, 9999)}.{rng.randint(0, 99):02d}",
+        'account_balance': f"HK${rng.randint(1000, 999999)}.{rng.randint(0, 99):02d}",
+        'account_number': ''.join(str(rng.randint(0, 9)) for _ in range(12)),
+        'phone': f"{rng.choice('2369')}{rng.randint(100, 999)} {rng.randint(1000, 9999)}",
+        'birth_date': f"{rng.randint(1950, 2004)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    }
+
+
+def _load_font(size, cjk):
+    """加载字体；cjk=True 时优先使用中文字体"""
+    candidates = (CJK_FONT_CANDIDATES if cjk else []) + LATIN_FONT_CANDIDATES
+    for path in candidates:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size), path in CJK_FONT_CANDIDATES
+            except OSError:
+                continue
+    return ImageFont.load_default(), False
+
+
+# 各类文档的版式：(标题, [(标签, 字段)])；字段为 None 时只画标签文本
+LAYOUTS = {
+    'identity_card': (('HONG KONG IDENTITY CARD', '香港永久性居民身份證'), [
+        (('Name', '姓名'), 'name'),
+        (('Date of Birth', '出生日期'), 'birth_date'),
+        (('Date of Issue', '簽發日期'), 'date'),
+        (('', ''), 'id_number'),
+    ]),
+    'utility_bill': (('CLP Power Hong Kong Limited - Electricity Bill', '中華電力有限公司 電費單'), [
+        (('Name', '姓名'), 'name'),
+        (('Service Address', '供電地址'), 'address'),
+        (('Account', '賬戶'), 'account_number'),
+        (('Bill Period', '賬單週期'), 'bill_period'),
+        (('Issue Date', '發單日期'), 'date'),
+        (('Amount Due', '應繳金額'), 'amount'),
+    ]),
+    'bank_statement': (('Bank Statement', '銀行月結單'), [
+        (('Name', '姓名'), 'name'),
+        (('Address', '地址'), 'address'),
+        (('Account', '賬戶'), 'account_number'),
+        (('Statement Date', '結單日期'), 'date'),
+        (('Balance', '餘額'), 'account_balance'),
+    ]),
+    'address_proof': (('Proof of Address', '住址證明'), [
+        (('Name', '姓名'), 'name'),
+        (('Address', '地址'), 'address'),
+        (('Date', '日期'), 'date'),
+        (('Phone', '電話'), 'phone'),
+    ]),
+    'lease_agreement': (('Tenancy Agreement', '租約'), [
+        (('Tenant Name', '租客姓名'), 'name'),
+        (('Premises', '物業地址'), 'address'),
+        (('Commencement Date', '生效日期'), 'date'),
+        (('Monthly Rent', '每月租金'), 'amount'),
+        (('Phone', '電話'), 'phone'),
+    ]),
+    'other': (('Official Receipt', '收據'), [
+        (('Received from', '茲收到'), 'name'),
+        (('Date', '日期'), 'date'),
+        (('Amount', '金額'), 'amount'),
+    ]),
+}
+
+
+def render_document(class_name, index, output_dir, seed):
+    """
+    渲染一张全尺寸的合成文档，并返回字段和文本框标注
+
+    Args:
+        class_name: 文档类别
+        index: 序号
+        output_dir: 输出目录（图片写入 output_dir/<类别>/）
+        seed: 随机种子（相同种子生成相同图片）
+
+    Returns:
+        dict: 文件路径、类别、字段真值和每个字段的文本框
+    """
+    rng = random.Random(seed)
+    fields = _random_fields(rng)
+
+    if class_name == 'identity_card':
+        size = (1012, 638)
+        background = (rng.randint(215, 235), rng.randint(225, 240), rng.randint(235, 250))
     else:
-        samples = 10
-    
-    generate_test_dataset(samples_per_class=samples)
+        size = (1240, 1754)  # A4 @ 150dpi
+        shade = rng.randint(240, 255)
+        background = (shade, shade, shade)
+
+    img = Image.new('RGB', size, color=background)
+    draw = ImageDraw.Draw(img)
+    title_font, has_cjk = _load_font(40 if class_name != 'identity_card' else 34, cjk=True)
+    body_font, _ = _load_font(28 if class_name != 'identity_card' else 26, cjk=True)
+
+    (title_en, title_zh), rows = LAYOUTS[class_name]
+    margin = 60
+    y = 50
+    title = f"{title_zh} {title_en}" if has_cjk else title_en
+    draw.text((margin, y), title, fill=(20, 40, 90), font=title_font)
+    y += 90
+    draw.line([(margin, y - 20), (size[0] - margin, y - 20)], fill=(20, 40, 90), width=3)
 
+    boxes = []
+    truth = {}
+    line_gap = 56 if class_name != 'identity_card' else 70
+    for (label_en, label_zh), field in rows:
+        value = fields[field]
+        label = f"{label_zh} {label_en}" if has_cjk and label_zh else label_en
+        text = f"{label}: {value}" if label else value
+        if field == 'address' and has_cjk and rng.random() < 0.5:
+            value = fields['address_zh']
+            text = f"{label}: {value}"
+
+        draw.text((margin, y), text, fill=(10, 10, 10), font=body_font)
+        value_x = margin + (draw.textlength(f"{label}: ", font=body_font) if label else 0)
+        box = draw.textbbox((value_x, y), value, font=body_font)
+        boxes.append({'field': field, 'text': value, 'box': [int(v) for v in box]})
+        truth[field] = value
+        y += line_gap
+
+    # 账单和月结单加上交易明细，使版面更接近真实文档
+    if class_name in ('utility_bill', 'bank_statement'):
+        y += 30
+        for _ in range(rng.randint(5, 15)):
+            if y > size[1] - 120:
+                break
+            row = (f"{fields['date']}   {rng.choice(['DEPOSIT', 'PAYMENT', 'TRANSFER', 'CHARGE'])}"
+                   f"   {rng.randint(10, 9999)}.{rng.randint(0, 99):02d}")
+            draw.text((margin, y), row, fill=(60, 60, 60), font=body_font)
+            y += 44
+
+    # 轻微噪点模拟扫描效果
+    pixels = img.load()
+    for _ in range(size[0] * size[1] // 200):
+        x, yy = rng.randrange(size[0]), rng.randrange(size[1])
+        v = rng.randint(120, 200)
+        pixels[x, yy] = (v, v, v)
+
+    class_dir = os.path.join(output_dir, class_name)
+    os.makedirs(class_dir, exist_ok=True)
+    filename = f"synth_{class_name}_{index:06d}.png"
+    img.save(os.path.join(class_dir, filename), 'PNG')
+
+    return {
+        'file': f"{class_name}/{filename}",
+        'document_type': class_name,
+        'fields': truth,
+        'boxes': boxes,
+        'seed': seed
+    }
+
+
+def _render_task(args):
+    return render_document(*args)
+
+
+def generate_synthetic_corpus(output_dir='../data/synthetic', samples_per_class=100,
+                              workers=None, seed=0):
+    """
+    并行生成带标注的合成文档语料，用于端到端的负载测试和精度/速度基准
+
+    每张图片的种子由 seed、类别和序号决定，结果与进程数无关，可完全复现。
+    标注写入 output_dir/labels.jsonl。
+
+    Args:
+        output_dir: 输出目录
+        samples_per_class: 每个类别的样本数量
+        workers: 进程数（默认为CPU核数）
+        seed: 基础随机种子
+    """
+    tasks = [
+        (class_name, i, seed * 1000003 + class_idx * 100000007 + i)
+        for class_idx, class_name in enumerate(CLASSES)
+        for i in range(samples_per_class)
+    ]
+
+    print(f"生成合成文档语料: 每个类别 {samples_per_class} 张，共 {len(tasks)} 张")
+    os.makedirs(output_dir, exist_ok=True)
+    labels_path = os.path.join(output_dir, 'labels.jsonl')
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(labels_path, 'w', encoding='utf-8') as f:
+        for done, label in enumerate(executor.map(_render_task, [
+                (class_name, i, output_dir, task_seed) for class_name, i, task_seed in tasks
+        ], chunksize=16), start=1):
+            f.write(json.dumps(label, ensure_ascii=False) + '\n')
+            if done % 500 == 0:
+                print(f"  已生成 {done}/{len(tasks)}")
+
+    print(f"输出目录: {output_dir}")
+    print(f"标注文件: {labels_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成测试数据')
+    parser.add_argument('samples', nargs='?', type=int, default=10, help='每个类别的样本数量')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='生成带字段标注的全尺寸合成文档（用于基准测试）')
+    parser.add_argument('--output', default=None, help='输出目录')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        generate_synthetic_corpus(
+            output_dir=args.output or '../data/synthetic',
+            samples_per_class=args.samples,
+            workers=args.workers,
+            seed=args.seed
+        )
+    else:
+        generate_test_dataset(output_dir=args.output or '../data/processed',
+                              samples_per_class=args.samples)
@@ -3,6 +3,10 @@
 使用TensorFlow/Keras訓練文檔分類模型
 """
 import os
+import sys
+import time
+import zlib
+import argparse
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -12,6 +16,33 @@ from tensorflow.keras.applications import MobileNetV2, EfficientNetB0
 from tensorflow.keras.optimizers import Adam
 import matplotlib.pyplot as plt
 
+from feature_cache import FeatureCache, file_hash
+from training_callbacks import EpochTimer, TrainingStateCheckpoint
+from augmentation import build_augmentation, load_config as load_augmentation_config
+from dataset_shards import ShardDataset, AUGMENTED_PREFIX
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from utils.model_registry import ModelRegistry  # noqa: E402
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# cache='auto' 時，uint8 圖片總大小不超過此值時緩存在內存，否則緩存到 DISK_CACHE_DIR
+MEMORY_CACHE_LIMIT = 2 * 1024 ** 3
+DISK_CACHE_DIR = '../data/tf_cache'
+BEST_MODEL_PATH = '../backend/models/document_classifier.h5'
+FINAL_MODEL_PATH = '../backend/models/document_classifier_final.h5'
+
+
+def float32_config(config):
+    """將模型配置中各層的混合精度策略換成 float32"""
+    if isinstance(config, dict):
+        if config.get('class_name') == 'Policy':
+            return 'float32'
+        return {key: float32_config(value) for key, value in config.items()}
+    if isinstance(config, list):
+        return [float32_config(value) for value in config]
+    return config
+
 
 class DocumentClassifierTrainer:
     def __init__(self, data_dir='../data/processed', img_size=(224, 224), batch_size=32):
@@ -75,9 +106,224 @@ class DocumentClassifierTrainer:
         
         return train_generator, validation_generator
     
-    def build_model(self, base_model_name='mobilenetv2'):
+    def list_image_files(self):
         """
-        構建模型
+        列出數據目錄中的圖片及其標籤
+
+        標籤按 self.class_names 的順序編號，與 DocumentClassifier.class_labels 一致
+        
+        Returns:
+            tuple: (圖片路徑列表, 標籤列表)
+        """
+        paths = []
+        labels = []
+        for label, class_name in enumerate(self.class_names):
+            class_dir = os.path.join(self.data_dir, class_name)
+            if not os.path.exists(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(class_dir, filename))
+                    labels.append(label)
+        return paths, labels
+    
+    def split_files(self, paths, labels, validation_split=0.2):
+        """
+        按文件名哈希穩定地劃分訓練集和驗證集（新增圖片不會改變已有圖片的劃分）
+        
+        Returns:
+            tuple: ((訓練路徑, 訓練標籤), (驗證路徑, 驗證標籤))
+        """
+        train, val = ([], []), ([], [])
+        for path, label in zip(paths, labels):
+            key = os.path.relpath(path, self.data_dir).replace(os.sep, '/')
+            # 增強生成的圖片與原圖劃分到同一側，避免驗證集洩漏
+            key = AUGMENTED_PREFIX.sub('', key)
+            bucket = zlib.crc32(key.encode('utf-8')) % 1000
+            target = val if bucket < validation_split * 1000 else train
+            target[0].append(path)
+            target[1].append(label)
+        return train, val
+    
+    def _read_image(self, path, img_size=None):
+        """讀取、解碼並縮放單張圖片，保持 uint8（緩存佔用只有 float32 的四分之一）"""
+        image = tf.io.read_file(path)
+        image = tf.io.decode_image(image, channels=3, expand_animations=False)
+        image = tf.image.resize(image, img_size or self.img_size)
+        return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    
+    def _decode_image(self, path, label, img_size=None):
+        """讀取、解碼並縮放單張圖片，歸一化到 [0, 1]"""
+        image = tf.cast(self._read_image(path, img_size), tf.float32) / 255.0
+        return image, tf.one_hot(label, self.num_classes)
+    
+    def _make_dataset(self, paths, labels, training, cache):
+        """
+        構建 tf.data 管線：並行解碼 → 緩存 → 打亂 → 分批 → 歸一化和批量增強 → 預取
+        """
+        dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+        dataset = dataset.map(
+            lambda path, label: (self._read_image(path), tf.one_hot(label, self.num_classes)),
+            num_parallel_calls=tf.data.AUTOTUNE)
+        return self._prepare_dataset(dataset, len(paths), training, cache)
+    
+    def _split_cache(self, cache, split, num_samples):
+        """
+        某個數據劃分的緩存設置
+        
+        Args:
+            cache: True（內存）、False、磁盤緩存路徑前綴，或 'auto'（按數據量選擇內存或磁盤）
+            split: 劃分名稱（加在磁盤緩存路徑後）
+            num_samples: 樣本數
+        """
+        if cache == 'auto':
+            size = num_samples * self.img_size[0] * self.img_size[1] * 3
+            if size <= MEMORY_CACHE_LIMIT:
+                return True
+            os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+            cache = os.path.join(DISK_CACHE_DIR, f"{self.img_size[0]}x{self.img_size[1]}")
+            print(f"{split}: 緩存約 {size / 1024 ** 3:.1f} GB，寫入磁盤緩存 {cache}_{split}")
+        return cache if not isinstance(cache, str) else f"{cache}_{split}"
+    
+    def _prepare_dataset(self, dataset, num_samples, training, cache):
+        """
+        對已解碼的 (uint8圖片, 目標) 數據集執行緩存、打亂、分批、歸一化、批量增強和預取
+        """
+        autotune = tf.data.AUTOTUNE
+        
+        # 緩存解碼和縮放後的 uint8 圖片（歸一化在緩存之後）：True 緩存在內存，字符串則為磁盤緩存文件路徑
+        if cache:
+            dataset = dataset.cache('' if cache is True else cache)
+        
+        # 增強樣本不落盤時，每輪把每張圖片重複多次，由在線增強生成不同版本
+        augment_config = load_augmentation_config(self.data_dir) if training else None
+        if augment_config:
+            dataset = dataset.repeat(1 + augment_config['augment_per_image'])
+        
+        if training:
+            dataset = dataset.shuffle(min(num_samples, 10000), reshuffle_each_iteration=True)
+        dataset = dataset.batch(self.batch_size)
+        
+        def normalize(images, targets):
+            return tf.cast(images, tf.float32) / 255.0, targets
+        
+        dataset = dataset.map(normalize, num_parallel_calls=autotune)
+        
+        if training:
+            augmentation = build_augmentation(augment_config['seed'] if augment_config else None)
+            dataset = dataset.map(
+                lambda images, targets: (augmentation(images, training=True), targets),
+                num_parallel_calls=autotune
+            )
+        
+        return dataset.prefetch(autotune)
+    
+    def epoch_samples(self, num_samples):
+        """
+        訓練集每輪的樣本數（在線增強時每張圖片每輪重複 1 + augment_per_image 次）
+        """
+        augment_config = load_augmentation_config(self.data_dir)
+        if augment_config:
+            return num_samples * (1 + augment_config['augment_per_image'])
+        return num_samples
+    
+    def create_datasets(self, validation_split=0.2, cache='auto'):
+        """
+        創建 tf.data 訓練集和驗證集
+        
+        Args:
+            validation_split: 驗證集比例
+            cache: True 緩存在內存；字符串為磁盤緩存路徑前綴；False 不緩存；
+                   'auto' 按數據量選擇內存或磁盤（見 MEMORY_CACHE_LIMIT）
+            
+        Returns:
+            tuple: (訓練集, 驗證集, 訓練樣本數, 驗證樣本數)
+        """
+        paths, labels = self.list_image_files()
+        (train_paths, train_labels), (val_paths, val_labels) = self.split_files(
+            paths, labels, validation_split)
+        
+        train_cache = self._split_cache(cache, 'train', len(train_paths))
+        val_cache = self._split_cache(cache, 'val', len(val_paths))
+        
+        train_ds = self._make_dataset(train_paths, train_labels, True, train_cache)
+        val_ds = self._make_dataset(val_paths, val_labels, False, val_cache)
+        
+        return train_ds, val_ds, len(train_paths), len(val_paths)
+    
+    def create_shard_datasets(self, shard_dir='../data/shards', cache='auto'):
+        """
+        從分片數據集創建訓練集和驗證集（劃分由分片索引決定）
+        
+        Args:
+            shard_dir: 分片目錄（由 dataset_shards.py 生成）
+            cache: 同 create_datasets
+            
+        Returns:
+            tuple: (訓練集, 驗證集, 訓練樣本數, 驗證樣本數)
+        """
+        shards = ShardDataset(shard_dir)
+        if shards.class_names != self.class_names:
+            raise ValueError(f"分片的類別與訓練器不一致: {shards.class_names}")
+        
+        def to_training(image, label):
+            image = tf.image.resize(tf.cast(image, tf.float32), self.img_size)
+            image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+            return image, tf.one_hot(tf.cast(label, tf.int32), self.num_classes)
+        
+        datasets = []
+        for split in ('train', 'val'):
+            dataset = shards.as_tf_dataset(split).map(
+                to_training, num_parallel_calls=tf.data.AUTOTUNE)
+            split_cache = self._split_cache(cache, split, shards.size(split))
+            datasets.append(self._prepare_dataset(
+                dataset, shards.size(split), split == 'train', split_cache))
+        
+        return datasets[0], datasets[1], shards.size('train'), shards.size('val')
+    
+    def benchmark_input_pipeline(self, num_batches=50, cache='auto'):
+        """
+        比較 ImageDataGenerator 與 tf.data 管線的讀取吞吐量（張/秒）
+        
+        tf.data 管線先完整讀取一輪以填充緩存，再計時第二輪，對應訓練中第2輪以後的情況
+        
+        Args:
+            num_batches: 每種管線計時的批次數
+            cache: 傳給 create_datasets 的緩存設置
+            
+        Returns:
+            dict: 各管線的吞吐量
+        """
+        def measure(batches):
+            count = 0
+            start = time.perf_counter()
+            for i, (images, _) in enumerate(batches):
+                count += len(images)
+                if i + 1 >= num_batches:
+                    break
+            return count / (time.perf_counter() - start)
+        
+        results = {}
+        
+        train_gen, _ = self.create_data_generators()
+        results['generator'] = measure(train_gen)
+        
+        train_ds, _, _, _ = self.create_datasets(cache=cache)
+        if cache:
+            for _ in train_ds:
+                pass
+        results['tf_data'] = measure(train_ds)
+        
+        print("\n數據管線吞吐量:")
+        for name, throughput in results.items():
+            print(f"  {name:12s}: {throughput:8.1f} 張/秒")
+        print(f"  加速比: {results['tf_data'] / results['generator']:.1f}x")
+        
+        return results
+    
+    def build_backbone(self, base_model_name='mobilenetv2'):
+        """
+        構建凍結的基礎模型
         
         Args:
             base_model_name: 基礎模型名稱 ('mobilenetv2' 或 'efficientnet')
@@ -101,56 +347,132 @@ class DocumentClassifierTrainer:
         # 凍結基礎模型（可選，用於遷移學習）
         base_model.trainable = False
         
+        return base_model
+    
+    def build_head_layers(self):
+        """構建分類頭（全局池化之後的各層）"""
+        return [
+            layers.Dropout(0.2),
+            layers.Dense(128, activation='relu'),
+            layers.Dropout(0.2),
+            # 混合精度下輸出層保持 float32，保證 softmax 數值穩定
+            layers.Dense(self.num_classes, activation='softmax', dtype='float32')
+        ]
+    
+    def compile_model(self, model, learning_rate=0.0001):
+        """編譯模型"""
+        model.compile(
+            optimizer=Adam(learning_rate=learning_rate),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        return model
+    
+    def build_model(self, base_model_name='mobilenetv2', head_layers=None):
+        """
+        構建模型
+        
+        Args:
+            base_model_name: 基礎模型名稱 ('mobilenetv2' 或 'efficientnet')
+            head_layers: 已訓練的分類頭（可選，默認新建）
+        """
+        base_model = self.build_backbone(base_model_name)
+        
         # 構建完整模型
         model = keras.Sequential([
             base_model,
             layers.GlobalAveragePooling2D(),
-            layers.Dropout(0.2),
-            layers.Dense(128, activation='relu'),
-            layers.Dropout(0.2),
-            layers.Dense(self.num_classes, activation='softmax')
+            *(head_layers or self.build_head_layers())
         ])
         
         # 編譯模型
-        model.compile(
-            optimizer=Adam(learning_rate=0.0001),
-            loss='categorical_crossentropy',
-            metrics=['accuracy']
+        return self.compile_model(model)
+    
+    def extract_features(self, paths, base_model_name='mobilenetv2',
+                         cache_dir='../data/feature_cache'):
+        """
+        用凍結的基礎模型提取池化後的特徵，已緩存的圖片不再重新計算
+        
+        Args:
+            paths: 圖片路徑列表
+            base_model_name: 基礎模型名稱
+            cache_dir: 特徵緩存根目錄
+            
+        Returns:
+            numpy array: (len(paths), 特徵維度) 的特徵數組
+        """
+        extractor = keras.Sequential([
+            self.build_backbone(base_model_name),
+            layers.GlobalAveragePooling2D()
+        ])
+        dim = extractor.output_shape[-1]
+        cache = FeatureCache(
+            os.path.join(cache_dir, f"{base_model_name}_{self.img_size[0]}x{self.img_size[1]}"),
+            dim
         )
         
-        return model
+        hashes = [file_hash(path) for path in paths]
+        missing = set(cache.missing(hashes))
+        
+        if missing:
+            todo = {}
+            for path, h in zip(paths, hashes):
+                if h in missing and h not in todo:
+                    todo[h] = path
+            print(f"計算特徵: {len(todo)} 張新圖片或已修改的圖片（緩存中已有 {len(cache)} 張）")
+            
+            dataset = tf.data.Dataset.from_tensor_slices(
+                (list(todo.values()), [0] * len(todo)))
+            dataset = dataset.map(self._decode_image, num_parallel_calls=tf.data.AUTOTUNE)
+            dataset = dataset.map(lambda image, _: image).batch(self.batch_size)
+            dataset = dataset.prefetch(tf.data.AUTOTUNE)
+            
+            todo_hashes = list(todo.keys())
+            offset = 0
+            for images in dataset:
+                features = extractor(images, training=False).numpy()
+                cache.add(todo_hashes[offset:offset + len(features)], features)
+                offset += len(features)
+            cache.save()
+        else:
+            print(f"全部 {len(paths)} 張圖片的特徵已在緩存中")
+        
+        return cache.get(hashes)
     
-    def train(self, epochs=50, base_model='mobilenetv2'):
+    def train_head(self, epochs=50, base_model='mobilenetv2', cache_dir='../data/feature_cache'):
         """
-        訓練模型
+        在緩存的特徵上訓練分類頭，再與基礎模型組合為完整模型
+        
+        基礎模型只對新圖片運行一次；此模式不做數據增強
         
         Args:
             epochs: 訓練輪數
             base_model: 基礎模型名稱
+            cache_dir: 特徵緩存根目錄
         """
-        print("準備數據生成器...")
-        train_gen, val_gen = self.create_data_generators()
+        paths, labels = self.list_image_files()
+        (train_paths, train_labels), (val_paths, val_labels) = self.split_files(paths, labels)
         
-        print(f"訓練樣本數: {train_gen.samples}")
-        print(f"驗證樣本數: {val_gen.samples}")
+        print(f"訓練樣本數: {len(train_paths)}")
+        print(f"驗證樣本數: {len(val_paths)}")
         
-        print("構建模型...")
-        model = self.build_model(base_model)
-        model.summary()
+        train_features = self.extract_features(train_paths, base_model, cache_dir)
+        val_features = self.extract_features(val_paths, base_model, cache_dir)
+        train_targets = keras.utils.to_categorical(train_labels, self.num_classes)
+        val_targets = keras.utils.to_categorical(val_labels, self.num_classes)
+        
+        head_layers = self.build_head_layers()
+        head = self.compile_model(keras.Sequential([
+            keras.Input(shape=(train_features.shape[1],)),
+            *head_layers
+        ]))
         
-        # 回調函數
         callbacks = [
             keras.callbacks.EarlyStopping(
                 monitor='val_loss',
                 patience=10,
                 restore_best_weights=True
             ),
-            keras.callbacks.ModelCheckpoint(
-                '../backend/models/document_classifier.h5',
-                monitor='val_accuracy',
-                save_best_only=True,
-                verbose=1
-            ),
             keras.callbacks.ReduceLROnPlateau(
                 monitor='val_loss',
                 factor=0.5,
@@ -159,23 +481,406 @@ class DocumentClassifierTrainer:
             )
         ]
         
-        print("開始訓練...")
+        print("開始訓練分類頭...")
+        history = head.fit(
+            train_features,
+            train_targets,
+            batch_size=self.batch_size,
+            epochs=epochs,
+            validation_data=(val_features, val_targets),
+            callbacks=callbacks,
+            verbose=1
+        )
+        
+        # 與基礎模型組合（共用已訓練的分類頭各層）
+        model = self.build_model(base_model, head_layers=head_layers)
+        model.save('../backend/models/document_classifier.h5')
+        print("模型已保存到 backend/models/document_classifier.h5")
+        
+        self.plot_training_history(history)
+        
+        return model, history
+    
+    def unfreeze_top_layers(self, model, num_layers):
+        """
+        解凍基礎模型最上面的 num_layers 層用於微調（BatchNorm 層保持凍結）
+        """
+        base_model = model.layers[0]
+        base_model.trainable = True
+        for layer in base_model.layers[:-num_layers]:
+            layer.trainable = False
+        for layer in base_model.layers:
+            if isinstance(layer, layers.BatchNormalization):
+                layer.trainable = False
+    
+    def to_float32(self, model):
+        """
+        以 float32 策略重建模型並複製權重
+        
+        混合精度訓練時各層的策略會隨模型保存，服務端在CPU上加載後仍按混合精度運行；
+        混合精度的權重本身就是 float32，直接複製即可
+        """
+        float_model = model.__class__.from_config(float32_config(model.get_config()))
+        float_model.set_weights(model.get_weights())
+        return self.compile_model(float_model)
+    
+    def _build_callbacks(self, model, num_samples, checkpoint_dir, best_accuracy=None):
+        """
+        構建回調函數；完整訓練狀態檢查點必須放在最後
+        
+        Args:
+            best_accuracy: 之前階段的最佳 val_accuracy，本階段只有超過它才覆蓋已保存的最佳模型
+        """
+        early_stopping = keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=10,
+            restore_best_weights=True
+        )
+        reduce_lr = keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=5,
+            min_lr=1e-7
+        )
+        model_checkpoint = keras.callbacks.ModelCheckpoint(
+            BEST_MODEL_PATH,
+            monitor='val_accuracy',
+            save_best_only=True,
+            initial_value_threshold=best_accuracy,
+            verbose=1
+        )
+        state_checkpoint = TrainingStateCheckpoint(
+            model, checkpoint_dir, callbacks=[early_stopping, reduce_lr, model_checkpoint])
+        
+        callbacks = [
+            EpochTimer(num_samples),
+            early_stopping,
+            model_checkpoint,
+            reduce_lr,
+            state_checkpoint
+        ]
+        return callbacks, state_checkpoint, model_checkpoint
+    
+    def _fit_phase(self, model, train_gen, val_gen, epochs, num_samples, checkpoint_dir,
+                   best_accuracy=None):
+        """
+        訓練一個階段，存在檢查點時從中斷處繼續
+        
+        Args:
+            best_accuracy: 之前階段的最佳 val_accuracy（見 _build_callbacks）
+        
+        Returns:
+            tuple: (History 或 None（該階段之前已完成）, 到本階段為止的最佳 val_accuracy)
+        """
+        callbacks, state_checkpoint, model_checkpoint = self._build_callbacks(
+            model, num_samples, checkpoint_dir, best_accuracy)
+        initial_epoch = state_checkpoint.restore()
+        if state_checkpoint.completed or initial_epoch >= epochs:
+            print(f"階段已完成，跳過: {checkpoint_dir}")
+            best = state_checkpoint.saved_state(model_checkpoint).get('best', best_accuracy)
+            return None, best
+        
         history = model.fit(
             train_gen,
             epochs=epochs,
+            initial_epoch=initial_epoch,
             validation_data=val_gen,
             callbacks=callbacks,
             verbose=1
         )
+        return history, float(model_checkpoint.best)
+    
+    def train(self, epochs=50, base_model='mobilenetv2', pipeline='tf_data', cache='auto',
+              fine_tune_layers=0, fine_tune_epochs=10, precision='float32',
+              checkpoint_dir='../backend/models/checkpoints', shard_dir='../data/shards'):
+        """
+        訓練模型
+        
+        第一階段凍結基礎模型只訓練分類頭；fine_tune_layers > 0 時，
+        第二階段解凍基礎模型最上面的若干層，以較小學習率微調。
+        每輪保存完整訓練狀態，中斷後重新運行會自動從最近的檢查點繼續。
+        
+        Args:
+            epochs: 第一階段訓練輪數
+            base_model: 基礎模型名稱
+            pipeline: 數據管線 ('tf_data'、'shards' 或 'generator')
+            cache: tf.data 管線的緩存設置（見 create_datasets）
+            fine_tune_layers: 第二階段解凍的層數（0 表示不微調）
+            fine_tune_epochs: 第二階段訓練輪數
+            precision: 'float32'、'mixed_bfloat16'（支持 bfloat16 的CPU）或 'mixed_float16'（GPU）
+            checkpoint_dir: 訓練狀態檢查點目錄
+            shard_dir: pipeline='shards' 時的分片目錄
+        """
+        if precision != 'float32':
+            keras.mixed_precision.set_global_policy(precision)
+            print(f"使用混合精度: {precision}")
+        
+        if pipeline == 'tf_data':
+            print("準備 tf.data 數據管線...")
+            train_gen, val_gen, train_samples, val_samples = self.create_datasets(cache=cache)
+        elif pipeline == 'shards':
+            print(f"從分片讀取數據: {shard_dir}")
+            train_gen, val_gen, train_samples, val_samples = self.create_shard_datasets(
+                shard_dir, cache=cache)
+        else:
+            print("準備數據生成器...")
+            train_gen, val_gen = self.create_data_generators()
+            train_samples, val_samples = train_gen.samples, val_gen.samples
+        
+        print(f"訓練樣本數: {train_samples}")
+        print(f"驗證樣本數: {val_samples}")
+        # 吞吐量按每輪實際處理的樣本數計算（tf.data 管線在線增強時包含重複的樣本）
+        epoch_samples = self.epoch_samples(train_samples) if pipeline != 'generator' else train_samples
+        
+        print("構建模型...")
+        model = self.build_model(base_model)
+        model.summary()
+        
+        phase1_dir = os.path.join(checkpoint_dir, 'phase1')
+        phase2_dir = os.path.join(checkpoint_dir, 'phase2')
+        history = None
+        best_accuracy = None
+        
+        # 第二階段已經開始時，直接恢復第二階段的狀態（其中包含第一階段以來的最佳準確率）
+        resume_phase2 = fine_tune_layers > 0 and tf.train.latest_checkpoint(phase2_dir)
+        
+        if not resume_phase2:
+            print("第一階段：訓練分類頭...")
+            history, best_accuracy = self._fit_phase(
+                model, train_gen, val_gen, epochs, epoch_samples, phase1_dir)
+        
+        if fine_tune_layers > 0:
+            print(f"第二階段：微調基礎模型最上面的 {fine_tune_layers} 層...")
+            self.unfreeze_top_layers(model, fine_tune_layers)
+            self.compile_model(model, learning_rate=1e-5)
+            # 第二階段只有超過第一階段的最佳準確率時才覆蓋最佳模型
+            fine_tune_history, _ = self._fit_phase(
+                model, train_gen, val_gen, fine_tune_epochs, epoch_samples, phase2_dir,
+                best_accuracy)
+            history = fine_tune_history or history
+        
+        if precision != 'float32':
+            # 服務端在CPU上以 float32 加載模型，保存前去掉混合精度策略
+            keras.mixed_precision.set_global_policy('float32')
+            if os.path.exists(BEST_MODEL_PATH):
+                best_model = keras.models.load_model(BEST_MODEL_PATH, compile=False)
+                self.to_float32(best_model).save(BEST_MODEL_PATH)
+            model = self.to_float32(model)
         
         # 保存最終模型
-        model.save('../backend/models/document_classifier_final.h5')
+        model.save(FINAL_MODEL_PATH)
         
         # 繪製訓練曲線
-        self.plot_training_history(history)
+        if history is not None:
+            self.plot_training_history(history)
         
         return model, history
     
+    def teacher_logits(self, paths, teacher, teacher_path, cache_dir='../data/feature_cache'):
+        """
+        計算教師模型對每張圖片的對數概率，已緩存的圖片不再重新計算
+        
+        緩存以教師模型文件的校驗和區分，更換教師模型後自動重新計算
+        
+        Args:
+            paths: 圖片路徑列表
+            teacher: 已加載的教師模型
+            teacher_path: 教師模型文件（用於區分緩存）
+            cache_dir: 緩存根目錄
+            
+        Returns:
+            numpy array: (len(paths), 類別數) 的對數概率
+        """
+        teacher_size = tuple(teacher.input_shape[1:3])
+        cache = FeatureCache(
+            os.path.join(cache_dir, f"teacher_{file_hash(teacher_path)[:12]}"), self.num_classes)
+        
+        hashes = [file_hash(path) for path in paths]
+        missing = set(cache.missing(hashes))
+        
+        if missing:
+            todo = {}
+            for path, h in zip(paths, hashes):
+                if h in missing and h not in todo:
+                    todo[h] = path
+            print(f"計算教師輸出: {len(todo)} 張新圖片或已修改的圖片（緩存中已有 {len(cache)} 張）")
+            
+            dataset = tf.data.Dataset.from_tensor_slices(
+                (list(todo.values()), [0] * len(todo)))
+            dataset = dataset.map(lambda path, label: self._decode_image(path, label, teacher_size)[0],
+                                  num_parallel_calls=tf.data.AUTOTUNE)
+            dataset = dataset.batch(self.batch_size).prefetch(tf.data.AUTOTUNE)
+            
+            todo_hashes = list(todo.keys())
+            offset = 0
+            for images in dataset:
+                probabilities = teacher(images, training=False).numpy()
+                logits = np.log(np.clip(probabilities, 1e-7, 1.0))
+                cache.add(todo_hashes[offset:offset + len(logits)], logits)
+                offset += len(logits)
+            cache.save()
+        else:
+            print(f"全部 {len(paths)} 張圖片的教師輸出已在緩存中")
+        
+        return cache.get(hashes)
+    
+    def build_student(self, width=0.35):
+        """
+        構建學生模型：窄版 MobileNetV2（width 為通道寬度倍數），整個網絡都參與訓練
+        
+        Args:
+            width: 通道寬度倍數（0.35、0.5、0.75 或 1.0）
+        """
+        backbone = MobileNetV2(
+            input_shape=(*self.img_size, 3),
+            include_top=False,
+            weights='imagenet',
+            alpha=width
+        )
+        return keras.Sequential([
+            backbone,
+            layers.GlobalAveragePooling2D(),
+            layers.Dropout(0.2),
+            layers.Dense(self.num_classes, activation='softmax', dtype='float32')
+        ], name='student')
+    
+    def distillation_loss(self, temperature=4.0, alpha=0.3):
+        """
+        蒸餾損失：alpha × 真實標籤交叉熵 + (1 - alpha) × T² × KL(教師 ‖ 學生)，兩者分佈都以溫度 T 軟化
+        
+        目標向量為 [one-hot標籤, 教師對數概率] 拼接；學生輸出為softmax概率，
+        其對數與logits只差一個常數，不影響軟化後的分佈
+        """
+        n = self.num_classes
+        
+        def loss(y_true, y_pred):
+            labels, teacher = y_true[:, :n], y_true[:, n:]
+            hard = keras.losses.categorical_crossentropy(labels, y_pred)
+            student_log = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+            soft_teacher = tf.nn.softmax(teacher / temperature)
+            soft_student_log = tf.nn.log_softmax(student_log / temperature)
+            kl = tf.reduce_sum(
+                soft_teacher * (tf.math.log(soft_teacher + 1e-7) - soft_student_log), axis=-1)
+            return alpha * hard + (1 - alpha) * temperature ** 2 * kl
+        
+        def accuracy(y_true, y_pred):
+            return keras.metrics.categorical_accuracy(y_true[:, :n], y_pred)
+        
+        return loss, accuracy
+    
+    def distill(self, teacher_path='../backend/models/document_classifier.h5', epochs=30,
+                width=0.35, temperature=4.0, alpha=0.3, cache='auto',
+                cache_dir='../data/feature_cache',
+                output_path='../backend/models/document_classifier_student.h5'):
+        """
+        知識蒸餾：以現有模型為教師，訓練更小的學生模型（輸入尺寸為訓練器的 img_size）
+        
+        教師輸出按圖片內容哈希緩存，只對新圖片計算一次；學生看到的是在線增強後的圖片，
+        教師輸出則來自原圖。
+        
+        Args:
+            teacher_path: 教師模型文件
+            epochs: 訓練輪數
+            width: 學生網絡通道寬度倍數
+            temperature: 蒸餾溫度
+            alpha: 真實標籤損失的權重
+            cache: tf.data 緩存設置（見 create_datasets）
+            cache_dir: 教師輸出緩存根目錄
+            output_path: 學生模型保存路徑
+        """
+        teacher = keras.models.load_model(teacher_path, compile=False)
+        print(f"教師模型: {teacher_path}，輸入 {teacher.input_shape[1:3]}")
+        
+        paths, labels = self.list_image_files()
+        (train_paths, train_labels), (val_paths, val_labels) = self.split_files(paths, labels)
+        print(f"訓練樣本數: {len(train_paths)}")
+        print(f"驗證樣本數: {len(val_paths)}")
+        
+        train_logits = self.teacher_logits(train_paths, teacher, teacher_path, cache_dir)
+        val_logits = self.teacher_logits(val_paths, teacher, teacher_path, cache_dir)
+        del teacher
+        
+        def make_dataset(paths, labels, logits, training, split_cache):
+            def decode(path, label, teacher_logits):
+                one_hot = tf.one_hot(label, self.num_classes)
+                return self._read_image(path), tf.concat([one_hot, teacher_logits], axis=0)
+            
+            dataset = tf.data.Dataset.from_tensor_slices(
+                (paths, labels, logits.astype(np.float32)))
+            dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+            return self._prepare_dataset(dataset, len(paths), training, split_cache)
+        
+        train_ds = make_dataset(train_paths, train_labels, train_logits, True,
+                                self._split_cache(cache, 'distill_train', len(train_paths)))
+        val_ds = make_dataset(val_paths, val_labels, val_logits, False,
+                              self._split_cache(cache, 'distill_val', len(val_paths)))
+        
+        student = self.build_student(width)
+        loss, accuracy = self.distillation_loss(temperature, alpha)
+        student.compile(optimizer=Adam(learning_rate=1e-3), loss=loss, metrics=[accuracy])
+        student.summary()
+        
+        print(f"開始蒸餾: 輸入 {self.img_size}，寬度 {width}，溫度 {temperature}，alpha {alpha}")
+        history = student.fit(
+            train_ds,
+            epochs=epochs,
+            validation_data=val_ds,
+            callbacks=[
+                EpochTimer(self.epoch_samples(len(train_paths))),
+                keras.callbacks.EarlyStopping(
+                    monitor='val_loss',
+                    patience=8,
+                    restore_best_weights=True
+                ),
+                keras.callbacks.ReduceLROnPlateau(
+                    monitor='val_loss',
+                    factor=0.5,
+                    patience=4,
+                    min_lr=1e-6
+                )
+            ],
+            verbose=1
+        )
+        
+        # 換回標準損失再保存，服務端加載時不需要自定義對象
+        self.compile_model(student)
+        student.save(output_path)
+        print(f"學生模型已保存到 {output_path}")
+        
+        self.plot_training_history(history)
+        
+        return student, history
+    
+    def register_model(self, model_path, history=None, base_model=None,
+                       registry_dir='../backend/models/registry', activate=False):
+        """
+        將訓練好的模型登記到模型註冊表
+        
+        Args:
+            model_path: 模型文件
+            history: 訓練歷史（用於記錄驗證指標）
+            base_model: 基礎模型名稱（記錄在備註中）
+            registry_dir: 註冊表目錄
+            activate: 是否設為服務使用的當前版本
+            
+        Returns:
+            str: 版本名
+        """
+        metrics = {}
+        if history is not None and history.history.get('val_accuracy'):
+            best = int(np.argmax(history.history['val_accuracy']))
+            metrics = {
+                'val_accuracy': float(history.history['val_accuracy'][best]),
+                'val_loss': float(history.history['val_loss'][best]),
+                'epochs': len(history.history['val_accuracy'])
+            }
+        
+        registry = ModelRegistry(registry_dir)
+        version = registry.register(model_path, metrics=metrics, activate=activate,
+                                    notes=f"base_model={base_model}, img_size={self.img_size}")
+        print(f"模型已登記為版本 {version}" + ("（當前版本）" if activate else ""))
+        return version
+    
     def plot_training_history(self, history):
         """繪製訓練歷史"""
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
@@ -202,6 +907,44 @@ class DocumentClassifierTrainer:
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='訓練文檔分類模型')
+    parser.add_argument('--data-dir', default='../data/processed')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--base-model', default='mobilenetv2', choices=['mobilenetv2', 'efficientnet'])
+    parser.add_argument('--pipeline', default='tf_data', choices=['tf_data', 'shards', 'generator'])
+    parser.add_argument('--shard-dir', default='../data/shards', help='分片數據集目錄')
+    parser.add_argument('--cache', default='auto',
+                        help="tf.data 緩存：'auto'（數據量大時自動改用磁盤）、'memory'、'none' 或磁盤緩存路徑前綴")
+    parser.add_argument('--fine-tune-layers', type=int, default=0,
+                        help='第二階段解凍的基礎模型層數（0 表示不微調）')
+    parser.add_argument('--fine-tune-epochs', type=int, default=10)
+    parser.add_argument('--precision', default='float32',
+                        choices=['float32', 'mixed_bfloat16', 'mixed_float16'])
+    parser.add_argument('--checkpoint-dir', default='../backend/models/checkpoints',
+                        help='訓練狀態檢查點目錄（中斷後自動恢復）')
+    parser.add_argument('--head-only', action='store_true',
+                        help='在緩存的骨幹網絡特徵上只訓練分類頭')
+    parser.add_argument('--feature-cache', default='../data/feature_cache', help='特徵緩存目錄')
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help='只比較數據管線吞吐量，不訓練')
+    parser.add_argument('--distill', action='store_true',
+                        help='以 --teacher 為教師，蒸餾訓練小模型（輸入尺寸為 --student-size）')
+    parser.add_argument('--teacher', default='../backend/models/document_classifier.h5')
+    parser.add_argument('--student-size', type=int, default=128)
+    parser.add_argument('--student-width', type=float, default=0.35,
+                        choices=[0.35, 0.5, 0.75, 1.0], help='學生網絡通道寬度倍數')
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.3, help='真實標籤損失的權重')
+    parser.add_argument('--student-output', default='../backend/models/document_classifier_student.h5')
+    parser.add_argument('--register', action='store_true', help='訓練完成後登記到模型註冊表')
+    parser.add_argument('--activate', action='store_true',
+                        help='登記後設為服務使用的當前版本（運行中的服務會熱切換）')
+    parser.add_argument('--registry-dir', default='../backend/models/registry')
+    args = parser.parse_args()
+    
+    cache = {'memory': True, 'none': False}.get(args.cache, args.cache)
+    
     # 設置GPU（如果可用）
     physical_devices = tf.config.list_physical_devices('GPU')
     if len(physical_devices) > 0:
@@ -211,17 +954,61 @@ if __name__ == '__main__':
         print("使用CPU")
     
     # 創建訓練器
+    img_size = (args.student_size, args.student_size) if args.distill else (224, 224)
     trainer = DocumentClassifierTrainer(
-        data_dir='../data/processed',
-        img_size=(224, 224),
-        batch_size=32
-    )
-    
-    # 開始訓練
-    model, history = trainer.train(
-        epochs=50,
-        base_model='mobilenetv2'  # 或 'efficientnet'
+        data_dir=args.data_dir,
+        img_size=img_size,
+        batch_size=args.batch_size
     )
     
-    print("訓練完成！")
-
+    if args.distill:
+        model, history = trainer.distill(
+            teacher_path=args.teacher,
+            epochs=args.epochs,
+            width=args.student_width,
+            temperature=args.temperature,
+            alpha=args.alpha,
+            cache=cache,
+            cache_dir=args.feature_cache,
+            output_path=args.student_output
+        )
+        
+        print("蒸餾完成！")
+        
+        if args.register:
+            trainer.register_model(args.student_output, history,
+                                   f"student_mobilenetv2_{args.student_width}",
+                                   args.registry_dir, args.activate)
+    elif args.benchmark_input:
+        trainer.benchmark_input_pipeline(cache=cache)
+    elif args.head_only:
+        model, history = trainer.train_head(
+            epochs=args.epochs,
+            base_model=args.base_model,
+            cache_dir=args.feature_cache
+        )
+        
+        print("訓練完成！")
+        
+        if args.register:
+            trainer.register_model('../backend/models/document_classifier.h5', history,
+                                   args.base_model, args.registry_dir, args.activate)
+    else:
+        # 開始訓練
+        model, history = trainer.train(
+            epochs=args.epochs,
+            base_model=args.base_model,  # 'mobilenetv2' 或 'efficientnet'
+            pipeline=args.pipeline,
+            cache=cache,
+            fine_tune_layers=args.fine_tune_layers,
+            fine_tune_epochs=args.fine_tune_epochs,
+            precision=args.precision,
+            checkpoint_dir=args.checkpoint_dir,
+            shard_dir=args.shard_dir
+        )
+        
+        print("訓練完成！")
+        
+        if args.register:
+            trainer.register_model('../backend/models/document_classifier_final.h5', history,
+                                   args.base_model, args.registry_dir, args.activate)
@@ -0,0 +1,132 @@
+"""
+訓練回調函數
+記錄每輪耗時和吞吐量，保存可恢復的完整訓練狀態
+"""
+import os
+import json
+import time
+import tensorflow as tf
+from tensorflow import keras
+
+
+def _to_python(value):
+    """將NumPy/TensorFlow標量轉換為可寫入JSON的Python類型"""
+    if hasattr(value, 'numpy'):
+        value = value.numpy()
+    if hasattr(value, 'item'):
+        value = value.item()
+    return value
+
+
+class EpochTimer(keras.callbacks.Callback):
+    def __init__(self, num_samples):
+        """
+        記錄每輪的耗時和吞吐量，並寫入 logs（會出現在 history 中）
+
+        Args:
+            num_samples: 每輪的訓練樣本數
+        """
+        super().__init__()
+        self.num_samples = num_samples
+        self._start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is None:
+            return
+        seconds = time.perf_counter() - self._start
+        logs['epoch_seconds'] = seconds
+        logs['images_per_sec'] = self.num_samples / seconds if seconds > 0 else 0.0
+        print(f"Epoch {epoch + 1}: {seconds:.1f} 秒, {logs['images_per_sec']:.1f} 張/秒, "
+              f"accuracy={logs.get('accuracy', 0):.4f}, val_accuracy={logs.get('val_accuracy', 0):.4f}")
+
+
+class TrainingStateCheckpoint(keras.callbacks.Callback):
+    # 需要隨檢查點保存的回調狀態
+    STATE_ATTRIBUTES = ('wait', 'best', 'cooldown_counter', 'stopped_epoch')
+
+    def __init__(self, model, checkpoint_dir, callbacks=(), max_to_keep=3):
+        """
+        每輪結束時保存完整訓練狀態（模型權重、優化器狀態、輪數、學習率調整狀態）
+
+        必須放在回調列表的最後，以便在其他回調重置狀態之後再恢復它們
+
+        Args:
+            model: 要保存的模型（需已編譯）
+            checkpoint_dir: 檢查點目錄
+            callbacks: 需要一併保存狀態的回調（如 EarlyStopping、ReduceLROnPlateau）
+            max_to_keep: 保留的檢查點數量
+        """
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.tracked_callbacks = list(callbacks)
+        self.state_path = os.path.join(checkpoint_dir, 'callbacks.json')
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.checkpoint = tf.train.Checkpoint(
+            model=model, optimizer=model.optimizer, epoch=self.epoch)
+        self.manager = tf.train.CheckpointManager(
+            self.checkpoint, checkpoint_dir, max_to_keep=max_to_keep)
+        self._callback_state = None
+        self.completed = False
+
+    def restore(self):
+        """
+        恢復最近的檢查點
+
+        Returns:
+            int: 應從哪一輪繼續訓練（沒有檢查點時為0）
+        """
+        if not self.manager.latest_checkpoint:
+            return 0
+        self.checkpoint.restore(self.manager.latest_checkpoint)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._callback_state = state.get('callbacks')
+            self.completed = state.get('completed', False)
+        print(f"從檢查點恢復: {self.manager.latest_checkpoint}（第 {int(self.epoch.numpy())} 輪）")
+        return int(self.epoch.numpy())
+
+    def saved_state(self, callback):
+        """
+        restore 讀取的某個回調的保存狀態
+
+        Returns:
+            dict: 屬性名 → 值；沒有保存的狀態時為空字典
+        """
+        if not self._callback_state:
+            return {}
+        index = self.tracked_callbacks.index(callback)
+        return self._callback_state[index] if index < len(self._callback_state) else {}
+
+    def on_train_begin(self, logs=None):
+        # 其他回調已在 on_train_begin 中重置，這裡再寫回保存的狀態
+        if not self._callback_state:
+            return
+        for callback, state in zip(self.tracked_callbacks, self._callback_state):
+            for name, value in state.items():
+                setattr(callback, name, value)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch.assign(epoch + 1)
+        self.manager.save(checkpoint_number=epoch + 1)
+        self._save_state()
+
+    def on_train_end(self, logs=None):
+        self.completed = True
+        self._save_state()
+
+    def _save_state(self):
+        callbacks = []
+        for callback in self.tracked_callbacks:
+            callbacks.append({
+                name: _to_python(getattr(callback, name))
+                for name in self.STATE_ATTRIBUTES if hasattr(callback, name)
+            })
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'callbacks': callbacks, 'completed': self.completed}, f)
+        os.replace(tmp_path, self.state_path)
@@ -88,6 +88,39 @@ def test_upload_and_recognize(image_path):
         traceback.print_exc()
         return False
 
+def test_upload_and_recognize_combined(image_path):
+    """測試單次請求的上傳並識別功能"""
+    print("=" * 50)
+    print("測試 3: 上傳並識別（單次請求）")
+    print("=" * 50)
+    
+    if not os.path.exists(image_path):
+        print(f"[ERROR] 圖片文件不存在: {image_path}")
+        return False
+    
+    try:
+        print(f"上傳並識別: {image_path}")
+        with open(image_path, 'rb') as f:
+            files = {'file': (os.path.basename(image_path), f, 'image/jpeg')}
+            response = requests.post(f"{API_BASE_URL}/api/upload_and_recognize", files=files)
+        
+        if response.status_code != 200:
+            print(f"[ERROR] 識別失敗: {response.status_code}")
+            print(f"錯誤: {response.text}")
+            return False
+        
+        data = response.json().get('data', {})
+        print("[OK] 識別成功!")
+        print(f"  File ID: {data.get('file_id', 'N/A')}")
+        print(f"  文檔類型: {data.get('document_type', 'N/A')}")
+        print(f"  置信度: {data.get('confidence', 0) * 100:.1f}%")
+        
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] 測試失敗: {e}")
+        return False
+
 def main():
     print("\n" + "=" * 50)
     print("智能文檔識別系統 - API 測試")
@@ -116,6 +149,7 @@ def main():
     
     if image_path:
         test_upload_and_recognize(image_path)
+        test_upload_and_recognize_combined(image_path)
     else:
         print("\n" + "=" * 50)
         print("提示: 沒有找到測試圖片")
@@ -136,6 +170,7 @@ if __name__ == "__main__":
         # 如果提供了圖片路徑作為參數
         test_backend_health()
         test_upload_and_recognize(sys.argv[1])
+        test_upload_and_recognize_combined(sys.argv[1])
     else:
         main()
 